@@ -1,14 +1,47 @@
 import os
-from flask import Flask, render_template, request, jsonify, send_file, session, redirect, url_for
-from database import init_db, get_db
+from flask import Flask, Response, render_template, request, jsonify, send_file, send_from_directory, session, redirect, url_for
+from database import init_db, get_db, db_path, shard_paths, SITES
+from profiling import init_profiling, list_profiles
+from idempotency import idempotent
+import writer
+import archive
+import catalog
+import ledger
+import search
+import products
+import relocation
+import replenishment
+import stocktake
+import collection
+import snapshot
+import maintenance
+import events
+import sites
+import uploads
+from compression import init_compression
+from assets import init_static_assets
 import sqlite3
-import pandas as pd
+from lazy import LazyModule
 from datetime import datetime
 import tempfile
 import uuid
+import json
+import time
+
+# pandas загружается при первой выгрузке или импорте (lazy.py)
+pd = LazyModule('pandas')
 
 app = Flask(__name__)
 app.secret_key = 'warehouse-secret-key-2024'
+app.config['ADMIN_USERS'] = set(filter(None, os.environ.get('WAREHOUSE_ADMINS', 'admin').split(',')))
+# Загрузки в памяти и ограничение размера запроса (uploads.py)
+uploads.init_uploads(app)
+init_compression(app)
+init_static_assets(app)
+# Отчёты читают снимок базы, если он включён (snapshot.py)
+snapshot.init_snapshots(app)
+# Площадка запроса (шард базы) — по сессии, ?site= или заголовку (sites.py)
+sites.init_sites(app)
 init_db()
 
 # Функция для загрузки пользователей из файла
@@ -44,6 +77,28 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def is_admin():
+    return bool(session.get('logged_in')) and session.get('username') in app.config['ADMIN_USERS']
+
+# Доступ только для администраторов
+def admin_required(f):
+    from functools import wraps
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not session.get('logged_in'):
+            return redirect(url_for('login', next=request.url))
+        if not is_admin():
+            return jsonify({'success': False, 'error': 'Admin access required'}), 403
+        return f(*args, **kwargs)
+    return decorated_function
+
+init_profiling(app, is_admin)
+
+@app.before_request
+def start_background_jobs():
+    # Потоки запускаются в рабочем процессе при первом запросе, а не при импорте
+    maintenance.start_scheduler()
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
@@ -71,7 +126,8 @@ def logout():
 def index():
     db = get_db()
     zones = db.execute('SELECT * FROM zones ORDER BY name').fetchall()
-    return render_template('index.html', zones=zones, username=session.get('username'))
+    return render_template('index.html', zones=zones, username=session.get('username'),
+                           last_event_id=events.last_event_id(db))
 
 @app.route('/zone/<int:zone_id>')
 @login_required
@@ -79,7 +135,8 @@ def zone_detail(zone_id):
     db = get_db()
     zone = db.execute('SELECT * FROM zones WHERE id = ?', (zone_id,)).fetchone()
     boxes = db.execute('SELECT * FROM boxes WHERE zone_id = ? ORDER BY name', (zone_id,)).fetchall()
-    return render_template('zone_detail.html', zone=zone, boxes=boxes, username=session.get('username'))
+    return render_template('zone_detail.html', zone=zone, boxes=boxes, username=session.get('username'),
+                           last_event_id=events.last_event_id(db))
 
 @app.route('/box/<int:box_id>')
 @login_required
@@ -93,112 +150,355 @@ def box_detail(box_id):
     ''', (box_id,)).fetchone()
     
     items = db.execute('''
-        SELECT * FROM box_items 
-        WHERE box_id = ? 
-        ORDER BY product_name
+        SELECT bi.*, p.name as product_name, p.barcode
+        FROM box_items bi
+        JOIN products p ON bi.product_id = p.id
+        WHERE bi.box_id = ? 
+        ORDER BY p.name
     ''', (box_id,)).fetchall()
     
-    return render_template('box_detail.html', box=box, items=items, username=session.get('username'))
+    return render_template('box_detail.html', box=box, items=items, username=session.get('username'),
+                           last_event_id=events.last_event_id(db))
 
 # API endpoints
+@app.route('/api/events')
+@login_required
+def event_stream():
+    """Поток изменений (Server-Sent Events) для живого обновления страниц (events.py)"""
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_id = int(last_id)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'last_event_id must be an integer'}), 400
+    
+    return Response(events.stream(db_path(), last_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# Операции записи по зонам и коробкам; выполняются писателем (writer.py)
+def insert_zone(db, name, description):
+    return db.execute('INSERT INTO zones (name, description) VALUES (?, ?)', (name, description)).lastrowid
+
+def update_zone(db, zone_id, name, description):
+    db.execute('UPDATE zones SET name = ?, description = ? WHERE id = ?', (name, description, zone_id))
+
+def insert_box(db, name, description, zone_id):
+    return db.execute('INSERT INTO boxes (name, description, zone_id) VALUES (?, ?, ?)',
+                      (name, description, zone_id)).lastrowid
+
+def update_box(db, box_id, name, description, zone_id):
+    # zone_id необязателен: без него коробка остаётся в своей зоне
+    db.execute('UPDATE boxes SET name = ?, description = ?, zone_id = COALESCE(?, zone_id) WHERE id = ?',
+               (name, description, zone_id, box_id))
+
 @app.route('/api/zones', methods=['POST'])
 @login_required
+@idempotent
 def create_zone():
     data = request.get_json()
-    db = get_db()
-    cursor = db.execute('INSERT INTO zones (name, description) VALUES (?, ?)',
-               (data['name'], data.get('description', '')))
-    db.commit()
-    return jsonify({'success': True, 'id': cursor.lastrowid})
+    zone_id = writer.submit(insert_zone, data['name'], data.get('description', ''))
+    return jsonify({'success': True, 'id': zone_id})
 
 @app.route('/api/zones/<int:zone_id>', methods=['PUT', 'DELETE'])
 @login_required
+@idempotent
 def manage_zone(zone_id):
-    db = get_db()
     if request.method == 'PUT':
         data = request.get_json()
-        db.execute('UPDATE zones SET name = ?, description = ? WHERE id = ?',
-                   (data['name'], data.get('description', ''), zone_id))
-        db.commit()
+        writer.submit(update_zone, zone_id, data['name'], data.get('description', ''))
         return jsonify({'success': True})
     elif request.method == 'DELETE':
-        db.execute('DELETE FROM zones WHERE id = ?', (zone_id,))
-        db.commit()
-        return jsonify({'success': True})
+        deleted = writer.submit(delete_zones, [zone_id])
+        return jsonify({'success': True, **deleted})
+
+@app.route('/api/zones/bulk_delete', methods=['POST'])
+@login_required
+@idempotent
+def bulk_delete_zones():
+    """Удаление нескольких зон вместе с их коробками и товарами"""
+    try:
+        ids = parse_id_list(request.get_json())
+        if ids is None:
+            return jsonify({'success': False, 'error': 'ids must be a list of integers'}), 400
+        
+        deleted = writer.submit(delete_zones, ids)
+        return jsonify({'success': True, **deleted})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/boxes', methods=['POST'])
 @login_required
+@idempotent
 def create_box():
     data = request.get_json()
-    db = get_db()
-    cursor = db.execute('INSERT INTO boxes (name, description, zone_id) VALUES (?, ?, ?)',
-                        (data['name'], data.get('description', ''), data['zone_id']))
-    db.commit()
-    return jsonify({'success': True, 'id': cursor.lastrowid})
+    box_id = writer.submit(insert_box, data['name'], data.get('description', ''), data['zone_id'])
+    return jsonify({'success': True, 'id': box_id})
 
 @app.route('/api/boxes/<int:box_id>', methods=['PUT', 'DELETE'])
 @login_required
+@idempotent
 def manage_box(box_id):
-    db = get_db()
     if request.method == 'PUT':
         data = request.get_json()
-        db.execute('UPDATE boxes SET name = ?, description = ? WHERE id = ?',
-                   (data['name'], data.get('description', ''), box_id))
-        db.commit()
+        writer.submit(update_box, box_id, data['name'], data.get('description', ''), data.get('zone_id'))
         return jsonify({'success': True})
     elif request.method == 'DELETE':
-        db.execute('DELETE FROM boxes WHERE id = ?', (box_id,))
-        db.commit()
-        return jsonify({'success': True})
+        deleted = writer.submit(delete_boxes, [box_id])
+        return jsonify({'success': True, **deleted})
+
+@app.route('/api/boxes/bulk_delete', methods=['POST'])
+@login_required
+@idempotent
+def bulk_delete_boxes():
+    """Удаление нескольких коробок вместе с их товарами"""
+    try:
+        ids = parse_id_list(request.get_json())
+        if ids is None:
+            return jsonify({'success': False, 'error': 'ids must be a list of integers'}), 400
+        
+        deleted = writer.submit(delete_boxes, ids)
+        return jsonify({'success': True, **deleted})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/boxes/move', methods=['POST'])
+@login_required
+@idempotent
+def move_boxes():
+    """Перенос нескольких коробок в другую зону; dry_run возвращает изменения без записи"""
+    return run_relocation(relocation.move_boxes, 'zone_id')
+
+@app.route('/api/box_items/move', methods=['POST'])
+@login_required
+@idempotent
+def move_box_items():
+    """Перенос позиций в другую коробку со слиянием количеств по штрих-коду"""
+    return run_relocation(relocation.move_items, 'box_id')
+
+def run_relocation(operation, target_field):
+    try:
+        data = request.get_json()
+        ids = parse_id_list(data)
+        if ids is None:
+            return jsonify({'success': False, 'error': 'ids must be a list of integers'}), 400
+        target = data.get(target_field)
+        if not isinstance(target, int):
+            return jsonify({'success': False, 'error': f'{target_field} must be an integer'}), 400
+        
+        dry_run = bool(data.get('dry_run'))
+        try:
+            result = writer.submit(operation, ids, target, dry_run)
+        except relocation.DryRun as e:
+            result = e.result
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        return jsonify({'success': True, 'dry_run': dry_run, **result})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def parse_id_list(data):
+    """Список id из {"ids": [...]}; None, если формат неверный"""
+    ids = data.get('ids') if isinstance(data, dict) else None
+    if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        return None
+    return ids
+
+# Инвентаризация (stocktake.py): сканирования копятся в сессии, закрытие считает расхождения
+@app.route('/api/stocktakes', methods=['POST'])
+@login_required
+@idempotent
+def create_stocktake():
+    try:
+        data = request.get_json() or {}
+        try:
+            session_id = writer.submit(stocktake.create, data.get('zone_id'), data.get('box_id'),
+                                       session.get('username'))
+        except stocktake.StocktakeError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        return jsonify({'success': True, 'id': session_id})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/stocktakes/<int:session_id>')
+@login_required
+def get_stocktake(session_id):
+    try:
+        result = stocktake.get(get_db(), session_id)
+        if result is None:
+            return jsonify({'success': False, 'error': 'Stocktake session not found'}), 404
+        return jsonify({'success': True, 'session': result})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/stocktakes/<int:session_id>/scans', methods=['POST'])
+@login_required
+@idempotent
+def add_stocktake_scans(session_id):
+    """Одно сканирование {box_id, barcode, quantity} или пачка {"scans": [...]}"""
+    try:
+        data = request.get_json()
+        scans = data.get('scans', [data]) if isinstance(data, dict) else None
+        if not isinstance(scans, list) or not all(isinstance(scan, dict) and scan.get('barcode') for scan in scans):
+            return jsonify({'success': False, 'error': 'scans must be a list of objects with a barcode'}), 400
+        try:
+            lines = writer.submit(stocktake.add_scans, session_id, scans)
+        except stocktake.StocktakeError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        return jsonify({'success': True, 'lines': lines})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/stocktakes/<int:session_id>/close', methods=['POST'])
+@login_required
+@idempotent
+def close_stocktake(session_id):
+    """Расхождения с остатками; {"apply": true} вносит исправления той же транзакцией"""
+    try:
+        data = request.get_json(silent=True) or {}
+        try:
+            result = writer.submit(stocktake.close, session_id, bool(data.get('apply')))
+        except stocktake.StocktakeError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        return jsonify({'success': True, **result})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# Каскадное удаление. Внешние ключи SQLite не проверяет (PRAGMA foreign_keys
+# выключен), поэтому зависимые строки удаляются явно — по одному запросу на
+# таблицу для всего списка id (json_each), в одной транзакции писателя.
+def delete_boxes(db, box_ids):
+    ids = json.dumps(box_ids)
+    items = db.execute('''
+        DELETE FROM box_items WHERE box_id IN (SELECT value FROM json_each(?))
+    ''', (ids,)).rowcount
+    boxes = db.execute('''
+        DELETE FROM boxes WHERE id IN (SELECT value FROM json_each(?))
+    ''', (ids,)).rowcount
+    return {'deleted_boxes': boxes, 'deleted_items': items}
+
+def delete_zones(db, zone_ids):
+    ids = json.dumps(zone_ids)
+    items = db.execute('''
+        DELETE FROM box_items WHERE box_id IN (
+            SELECT id FROM boxes WHERE zone_id IN (SELECT value FROM json_each(?))
+        )
+    ''', (ids,)).rowcount
+    boxes = db.execute('''
+        DELETE FROM boxes WHERE zone_id IN (SELECT value FROM json_each(?))
+    ''', (ids,)).rowcount
+    zones = db.execute('''
+        DELETE FROM zones WHERE id IN (SELECT value FROM json_each(?))
+    ''', (ids,)).rowcount
+    return {'deleted_zones': zones, 'deleted_boxes': boxes, 'deleted_items': items}
+
+def sweep_orphans(db):
+    """Удаляет строки, оставшиеся от удалённых ранее зон, коробок и приёмок"""
+    return {
+        'box_items': db.execute('''
+            DELETE FROM box_items WHERE box_id NOT IN (SELECT id FROM boxes)
+               OR box_id IN (SELECT id FROM boxes WHERE zone_id NOT IN (SELECT id FROM zones))
+        ''').rowcount,
+        'boxes': db.execute('''
+            DELETE FROM boxes WHERE zone_id NOT IN (SELECT id FROM zones)
+        ''').rowcount,
+        'receipt_items': db.execute('''
+            DELETE FROM receipt_items WHERE receipt_id NOT IN (SELECT id FROM receipts)
+        ''').rowcount,
+    }
+
+@app.cli.command('sweep-orphans')
+def sweep_orphans_command():
+    """Разовая очистка «осиротевших» строк в базах, где удаление не было каскадным (во всех шардах)"""
+    for site in list(SITES) or [None]:
+        deleted = writer.get_writer(db_path(site)).submit(sweep_orphans)
+        prefix = f'[{site}] ' if site else ''
+        for table, count in deleted.items():
+            print(f'{prefix}{table}: {count} rows deleted')
+        print(f'{prefix}Total: {sum(deleted.values())} rows reclaimed')
 
 @app.route('/api/box_items', methods=['POST'])
 @login_required
+@idempotent
 def add_box_item():
     try:
         data = request.get_json()
         if not data or 'box_id' not in data or 'product_name' not in data:
             return jsonify({'success': False, 'error': 'Missing required fields'}), 400
         
-        db = get_db()
-        
-        existing = None
-        if data.get('barcode'):
-            existing = db.execute('''
-                SELECT * FROM box_items 
-                WHERE box_id = ? AND barcode = ?
-            ''', (data['box_id'], data['barcode'])).fetchone()
-        
-        if existing:
-            db.execute('''
-                UPDATE box_items SET quantity = quantity + ? 
-                WHERE id = ?
-            ''', (data['quantity'], existing['id']))
-        else:
-            db.execute('''
-                INSERT INTO box_items (box_id, product_name, barcode, quantity) 
-                VALUES (?, ?, ?, ?)
-            ''', (data['box_id'], data['product_name'], data.get('barcode'), data['quantity']))
-        
-        db.commit()
+        writer.submit(upsert_box_item, data['box_id'], data['product_name'], data.get('barcode'), data['quantity'])
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/box_items/<int:item_id>', methods=['PUT', 'DELETE'])
 @login_required
+@idempotent
 def manage_box_item(item_id):
-    db = get_db()
     if request.method == 'PUT':
         data = request.get_json()
-        db.execute('UPDATE box_items SET product_name = ?, quantity = ? WHERE id = ?',
-                   (data['product_name'], data['quantity'], item_id))
-        db.commit()
+        updated = writer.submit(update_box_item, item_id, data['product_name'], data['quantity'],
+                                bool(data.get('rename_everywhere')))
+        if not updated:
+            return jsonify({'success': False,
+                            'error': 'Product with a barcode is shared by all boxes; '
+                                     'set rename_everywhere to rename it everywhere'}), 400
         return jsonify({'success': True})
     elif request.method == 'DELETE':
-        db.execute('DELETE FROM box_items WHERE id = ?', (item_id,))
-        db.commit()
+        writer.submit(delete_box_item, item_id)
         return jsonify({'success': True})
 
+# Операции записи по товарам в коробках; выполняются писателем (writer.py)
+# пачками в одной транзакции, поэтому сами не делают commit
+def upsert_box_item(db, box_id, product_name, barcode, quantity):
+    barcode = products.normalize_barcode(barcode)
+    product_id = products.get_or_create(db, product_name, barcode)
+    existing = None
+    if barcode:
+        existing = db.execute('''
+            SELECT * FROM box_items 
+            WHERE box_id = ? AND product_id = ?
+        ''', (box_id, product_id)).fetchone()
+    
+    if existing:
+        db.execute('''
+            UPDATE box_items SET quantity = quantity + ? 
+            WHERE id = ?
+        ''', (quantity, existing['id']))
+    else:
+        db.execute('''
+            INSERT INTO box_items (box_id, product_id, quantity) 
+            VALUES (?, ?, ?)
+        ''', (box_id, product_id, quantity))
+
+def update_box_item(db, item_id, product_name, quantity, rename_everywhere=False):
+    """False — смена названия товара со штрих-кодом без rename_everywhere"""
+    item = db.execute('''
+        SELECT bi.product_id, p.name, p.barcode
+        FROM box_items bi
+        JOIN products p ON bi.product_id = p.id
+        WHERE bi.id = ?
+    ''', (item_id,)).fetchone()
+    if not item:
+        return True
+    
+    # Название товара со штрих-кодом общее для всех коробок и приёмок, поэтому
+    # меняется только явно (rename_everywhere); товар без штрих-кода определяется
+    # названием, поэтому позиция переходит на другой товар
+    product_id = item['product_id']
+    if item['barcode']:
+        if product_name != item['name']:
+            if not rename_everywhere:
+                return False
+            db.execute('UPDATE products SET name = ? WHERE id = ?', (product_name, product_id))
+    else:
+        product_id = products.get_or_create(db, product_name)
+    db.execute('UPDATE box_items SET product_id = ?, quantity = ? WHERE id = ?',
+               (product_id, quantity, item_id))
+    return True
+
+def delete_box_item(db, item_id):
+    db.execute('DELETE FROM box_items WHERE id = ?', (item_id,))
+
 @app.route('/api/check_product')
 @login_required
 def check_product():
@@ -211,9 +511,11 @@ def check_product():
         
         db = get_db()
         product = db.execute('''
-            SELECT * FROM box_items 
-            WHERE box_id = ? AND barcode = ?
-        ''', (box_id, barcode)).fetchone()
+            SELECT bi.id, p.name as product_name, p.barcode, bi.quantity
+            FROM box_items bi
+            JOIN products p ON bi.product_id = p.id
+            WHERE bi.box_id = ? AND p.barcode = ?
+        ''', (box_id, barcode.strip())).fetchone()
         
         if product:
             return jsonify({
@@ -230,6 +532,74 @@ def check_product():
     except Exception as e:
         return jsonify({'exists': False, 'error': str(e)})
 
+@app.route('/api/catalog')
+@login_required
+def barcode_catalog():
+    """Изменения справочника штрих-кодов после since — для кэша станции (catalog.py)"""
+    try:
+        since = request.args.get('since', 0, type=int)
+        limit = min(request.args.get('limit', catalog.PAGE_SIZE, type=int), catalog.PAGE_SIZE)
+        return jsonify(dict(catalog.changes(get_db(), since, limit), success=True))
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/box_items/bulk', methods=['POST'])
+@login_required
+@idempotent
+def add_box_items_bulk():
+    """Очередь сканирований станции одной пачкой; у каждого сканирования свой ключ"""
+    try:
+        data = request.get_json(silent=True) or {}
+        scans = data.get('scans')
+        if not isinstance(scans, list) or not all(isinstance(scan, dict) for scan in scans):
+            return jsonify({'success': False, 'error': 'Missing scans'}), 400
+        if len(scans) > catalog.MAX_SCANS:
+            return jsonify({'success': False, 'error': f'At most {catalog.MAX_SCANS} scans per request'}), 400
+        result = writer.submit(catalog.apply_scans, scans, upsert_box_item)
+        return jsonify(dict(result, success=True))
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/search')
+@login_required
+def search_products():
+    """Поиск товаров по названию и штрих-коду в коробках и приёмках.
+
+    Порядок — по bm25 внутри блоков из 1000 совпавших товаров, от новых
+    к старым (search.RANK_CANDIDATES), а не по релевантности среди всех
+    совпадений: общее слово не заставляет оценивать сотни тысяч товаров.
+    """
+    try:
+        text = request.args.get('q', '').strip()
+        page = request.args.get('page', 1, type=int)
+        per_page = request.args.get('per_page', 50, type=int)
+        source = request.args.get('source', 'all')
+        
+        try:
+            rows, has_more = search.search(get_db(), text, page=page, per_page=per_page, source=source)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        return jsonify({
+            'success': True,
+            'query': text,
+            'page': page,
+            'has_more': has_more,
+            'results': [dict(row) for row in rows]
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.cli.command('search-rebuild')
+def search_rebuild_command():
+    """Перестроить поисковый индекс (для баз, созданных до появления поиска) во всех шардах"""
+    for site in list(SITES) or [None]:
+        db = get_db(site)
+        search.rebuild(db)
+        db.commit()
+        db.close()
+        print(f'[{site}] Search index rebuilt' if site else 'Search index rebuilt')
+
 # НОВЫЙ ЭНДПОИНТ: Сборка товаров из Excel файла
 @app.route('/api/process_collection', methods=['POST'])
 @login_required
@@ -246,106 +616,20 @@ def process_collection():
         if not file.filename.endswith('.xlsx'):
             return jsonify({'success': False, 'error': 'Only Excel files are supported'}), 400
         
-        # Сохраняем временный файл
-        with tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False) as tmp:
-            file_path = tmp.name
-            file.save(file_path)
-        
-        # Читаем Excel файл
-        df = pd.read_excel(file_path)
+        # Читаем Excel файл прямо из буфера загрузки
+        df = uploads.read_excel(file)
         
         # Определяем тип файла и столбцы
         file_type, barcode_col, quantity_col, name_col, article_col = detect_file_columns(df)
         
-        db = get_db()
-        
-        # Получаем все товары из базы данных
-        all_items = db.execute('''
-            SELECT 
-                bi.id as item_id,
-                bi.product_name,
-                bi.barcode,
-                bi.quantity,
-                b.name as box_name,
-                z.name as zone_name,
-                b.id as box_id
-            FROM box_items bi
-            JOIN boxes b ON bi.box_id = b.id
-            JOIN zones z ON b.zone_id = z.id
-            WHERE bi.quantity > 0
-        ''').fetchall()
-        
-        # Создаем словарь для быстрого поиска
-        items_dict = {}
-        for item in all_items:
-            barcode = str(item['barcode']).strip() if item['barcode'] else ''
-            if barcode and barcode != 'nan':
-                items_dict[barcode] = {
-                    'item_id': item['item_id'],
-                    'product_name': item['product_name'],
-                    'quantity': item['quantity'],
-                    'zone': item['zone_name'],
-                    'box': item['box_name'],
-                    'box_id': item['box_id']
-                }
-        
-        # Обрабатываем файл сборки
-        collection_plan = []
-        total_needed = 0
-        total_to_take = 0
-        
-        for index, row in df.iterrows():
-            try:
-                # Пропускаем пустые строки
-                if pd.isna(row[barcode_col]) or pd.isna(row[quantity_col]):
-                    continue
-                
-                barcode = str(row[barcode_col]).strip()
-                needed_qty = int(row[quantity_col])
-                product_name = str(row[name_col]) if name_col and not pd.isna(row.get(name_col)) else f"Товар {barcode}"
-                article = str(row[article_col]) if article_col and not pd.isna(row.get(article_col)) else ""
-                
-                if not barcode or barcode == 'nan':
-                    continue
-                
-                if barcode in items_dict:
-                    item_info = items_dict[barcode]
-                    available_qty = item_info['quantity']
-                    
-                    # Определяем сколько можем взять
-                    take_qty = min(needed_qty, available_qty)
-                    
-                    if take_qty > 0:
-                        collection_item = {
-                            'barcode': barcode,
-                            'article': article,
-                            'product_name': product_name,
-                            'needed': needed_qty,
-                            'take': take_qty,
-                            'zone': item_info['zone'],
-                            'box': item_info['box'],
-                            'remaining_after': available_qty - take_qty,
-                            'item_id': item_info['item_id'],
-                            'box_id': item_info['box_id']
-                        }
-                        
-                        collection_plan.append(collection_item)
-                        total_needed += needed_qty
-                        total_to_take += take_qty
-                        
-            except Exception as e:
-                print(f"Ошибка обработки строки {index + 2}: {e}")
-                continue
+        # Спрос из файла соединяется с остатками одним merge (collection.py)
+        collection_plan, total_needed, total_to_take = collection.build_plan(
+            get_db(), df, barcode_col, quantity_col, name_col, article_col
+        )
         
         # Группируем по зонам и коробкам для оптимизированного плана
         optimized_plan = optimize_collection_plan(collection_plan)
         
-        # Удаляем временный файл
-        try:
-            os.unlink(file_path)
-        except:
-            pass
-        
         return jsonify({
             'success': True,
             'file_type': file_type,
@@ -359,9 +643,62 @@ def process_collection():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/process_wave', methods=['POST'])
+@login_required
+def process_wave():
+    """Волна сборки: несколько файлов заказов, один обход коробок и раскладка по ячейкам"""
+    try:
+        files = [file for file in request.files.getlist('files') if file.filename]
+        if not files:
+            return jsonify({'success': False, 'error': 'No files uploaded'}), 400
+        
+        orders = []
+        for file in files:
+            if not file.filename.endswith('.xlsx'):
+                return jsonify({'success': False, 'error': f'Only Excel files are supported: {file.filename}'}), 400
+            df = uploads.read_excel(file)
+            _, barcode_col, quantity_col, name_col, article_col = detect_file_columns(df)
+            if barcode_col is None or quantity_col is None:
+                return jsonify({'success': False, 'error': f'No barcode/quantity columns in {file.filename}'}), 400
+            orders.append((file.filename,
+                           collection.demand_frame(df, barcode_col, quantity_col, name_col, article_col)))
+        
+        started = time.perf_counter()
+        wave = collection.build_wave(get_db(), orders)
+        wave['optimized_plan'] = optimize_collection_plan(wave['collection_plan'])
+        planning_ms = (time.perf_counter() - started) * 1000
+        
+        return jsonify({
+            'success': True,
+            'orders': len(orders),
+            'total_items': len(wave['collection_plan']),
+            'planning_ms': round(planning_ms, 1),
+            **wave
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def apply_collection(db, collection_plan):
+    """Списание подтверждённой сборки; выполняется писателем (writer.py)"""
+    # Расход для отчёта о пополнении — по остаткам до обновления
+    replenishment.record_outflow(db, collection_plan)
+    
+    updated_count = 0
+    for item in collection_plan:
+        # Обновляем количество в базе данных
+        db.execute('''
+            UPDATE box_items 
+            SET quantity = ? 
+            WHERE id = ?
+        ''', (item['remaining_after'], item['item_id']))
+        updated_count += 1
+    return updated_count
+
 # НОВЫЙ ЭНДПОИНТ: Подтверждение сборки и обновление базы
 @app.route('/api/confirm_collection', methods=['POST'])
 @login_required
+@idempotent
 def confirm_collection():
     """Подтверждение сборки и обновление остатков"""
     try:
@@ -369,20 +706,7 @@ def confirm_collection():
         if not data or 'collection_plan' not in data:
             return jsonify({'success': False, 'error': 'No collection plan provided'}), 400
         
-        collection_plan = data['collection_plan']
-        db = get_db()
-        
-        updated_count = 0
-        for item in collection_plan:
-            # Обновляем количество в базе данных
-            db.execute('''
-                UPDATE box_items 
-                SET quantity = ? 
-                WHERE id = ?
-            ''', (item['remaining_after'], item['item_id']))
-            updated_count += 1
-        
-        db.commit()
+        updated_count = writer.submit(apply_collection, data['collection_plan'])
         
         return jsonify({
             'success': True,
@@ -452,25 +776,100 @@ def optimize_collection_plan(collection_plan):
     
     return optimized
 
+# Пополнение (replenishment.py): отчёт из предрассчитанных остатков по товарам
+@app.route('/api/replenishment')
+@login_required
+def replenishment_report():
+    """Товары ниже минимального остатка; ?all=1 — все товары с порогом"""
+    try:
+        days = request.args.get('days', replenishment.OUTFLOW_DAYS, type=int)
+        # Расход по сборкам хранится только за OUTFLOW_DAYS дней
+        if not 1 <= days <= replenishment.OUTFLOW_DAYS:
+            return jsonify({'success': False,
+                            'error': f'days must be between 1 and {replenishment.OUTFLOW_DAYS}'}), 400
+        rows = replenishment.report(get_db(), include_all=request.args.get('all') == '1', days=days)
+        return jsonify({'success': True, 'days': days, 'items': rows})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/replenishment/thresholds', methods=['POST'])
+@login_required
+@idempotent
+def set_replenishment_thresholds():
+    """{"thresholds": [{"barcode": ..., "min_quantity": ...}]}; min_quantity null снимает порог"""
+    try:
+        data = request.get_json()
+        thresholds = data.get('thresholds') if isinstance(data, dict) else None
+        if not isinstance(thresholds, list) or not all(isinstance(t, dict) and t.get('barcode') for t in thresholds):
+            return jsonify({'success': False, 'error': 'thresholds must be a list of objects with a barcode'}), 400
+        updated = writer.submit(replenishment.set_thresholds, thresholds)
+        return jsonify({'success': True, 'updated': updated})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/replenishment/export')
+@login_required
+def export_replenishment():
+    """Отчёт о пополнении в xlsx или CSV (?format=csv)"""
+    try:
+        rows = replenishment.report(snapshot.report_db(), include_all=request.args.get('all') == '1')
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        if request.args.get('format') == 'csv':
+            return Response(replenishment.to_csv(rows), mimetype='text/csv',
+                            headers={'Content-Disposition': f'attachment; filename=replenishment_{stamp}.csv'})
+        
+        with tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False) as tmp:
+            file_path = tmp.name
+        replenishment.to_frame(rows).to_excel(file_path, index=False, engine='openpyxl')
+        
+        response = send_file(
+            file_path,
+            as_attachment=True,
+            download_name=f'replenishment_{stamp}.xlsx',
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+        
+        @response.call_on_close
+        def cleanup():
+            try:
+                os.unlink(file_path)
+            except OSError:
+                pass
+        
+        return response
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.cli.command('replenishment-rebuild')
+def replenishment_rebuild_command():
+    """Пересчитать остатки по товарам из box_items во всех шардах"""
+    for site in list(SITES) or [None]:
+        db = get_db(site)
+        replenishment.rebuild(db)
+        db.commit()
+        db.close()
+        print(f'[{site}] Product stock rebuilt' if site else 'Product stock rebuilt')
+
 @app.route('/api/export_excel_all')
 @login_required
 def export_excel_all():
     """Простая выгрузка всех данных"""
     try:
-        db = get_db()
+        db = snapshot.report_db()
         
         query = '''
             SELECT 
                 z.name as "Зона",
                 b.name as "Коробка", 
-                bi.product_name as "Название товара",
-                bi.barcode as "Штрих-код",
+                p.name as "Название товара",
+                p.barcode as "Штрих-код",
                 bi.quantity as "Количество",
                 bi.created_at as "Дата добавления"
             FROM box_items bi
+            JOIN products p ON bi.product_id = p.id
             JOIN boxes b ON bi.box_id = b.id
             JOIN zones z ON b.zone_id = z.id
-            ORDER BY z.name, b.name, bi.product_name
+            ORDER BY z.name, b.name, p.name
         '''
         
         df = pd.read_sql_query(query, db)
@@ -507,20 +906,21 @@ def export_excel_all():
 def export_excel_boxes():
     """Простая выгрузка по коробкам"""
     try:
-        db = get_db()
+        db = snapshot.report_db()
         
         query = '''
             SELECT 
                 z.name as "Зона",
                 b.name as "Коробка",
-                bi.product_name as "Название товара",
-                bi.barcode as "Штрих-код", 
+                p.name as "Название товара",
+                p.barcode as "Штрих-код", 
                 bi.quantity as "Количество",
                 bi.created_at as "Дата добавления"
             FROM box_items bi
+            JOIN products p ON bi.product_id = p.id
             JOIN boxes b ON bi.box_id = b.id
             JOIN zones z ON b.zone_id = z.id
-            ORDER BY z.name, b.name, bi.product_name
+            ORDER BY z.name, b.name, p.name
         '''
         
         df = pd.read_sql_query(query, db)
@@ -575,17 +975,18 @@ def export_items_by_date():
         if not start_date or not end_date:
             return jsonify({'success': False, 'error': 'Start date and end date are required'}), 400
         
-        db = get_db()
+        db = snapshot.report_db()
         
         query = '''
             SELECT 
                 z.name as "Зона",
                 b.name as "Коробка", 
-                bi.product_name as "Название товара",
-                bi.barcode as "Штрих-код",
+                p.name as "Название товара",
+                p.barcode as "Штрих-код",
                 bi.quantity as "Количество",
                 bi.created_at as "Дата добавления"
             FROM box_items bi
+            JOIN products p ON bi.product_id = p.id
             JOIN boxes b ON bi.box_id = b.id
             JOIN zones z ON b.zone_id = z.id
             WHERE DATE(bi.created_at) BETWEEN ? AND ?
@@ -664,8 +1065,167 @@ def export_items_by_date():
         print(f"Error in export_items_by_date: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/export_stock_as_of')
+@login_required
+def export_stock_as_of():
+    """Выгрузка остатков на момент времени по журналу движений"""
+    try:
+        at = request.args.get('at', '').strip().replace('T', ' ')
+        if not at:
+            return jsonify({'success': False, 'error': 'Parameter "at" is required'}), 400
+        
+        # Дата без времени — остатки на конец дня
+        if len(at) == 10:
+            at += ' 23:59:59'
+        elif len(at) == 16:
+            at += ':59'
+        try:
+            datetime.strptime(at, '%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Invalid "at" format, expected YYYY-MM-DD[ HH:MM[:SS]]'}), 400
+        
+        db = snapshot.report_db()
+        
+        query = f'''
+            SELECT 
+                COALESCE(z.name, '—') as "Зона",
+                COALESCE(b.name, 'Коробка #' || s.box_id) as "Коробка",
+                p.name as "Название товара",
+                p.barcode as "Штрих-код",
+                s.quantity as "Количество"
+            FROM ({ledger.AS_OF_QUERY}) s
+            LEFT JOIN products p ON s.product_id = p.id
+            LEFT JOIN boxes b ON s.box_id = b.id
+            LEFT JOIN zones z ON b.zone_id = z.id
+            ORDER BY 1, 2, 3
+        '''
+        
+        df = pd.read_sql_query(query, db, params=ledger.as_of_params(at))
+        
+        with tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False) as tmp:
+            file_path = tmp.name
+        
+        with pd.ExcelWriter(file_path, engine='openpyxl') as writer:
+            if not df.empty:
+                df.to_excel(writer, sheet_name='Остатки', index=False)
+            else:
+                empty_df = pd.DataFrame({'Сообщение': [f'Нет остатков на {at}']})
+                empty_df.to_excel(writer, sheet_name='Остатки', index=False)
+        
+        download_name = f'stock_as_of_{at.replace(" ", "_").replace(":", "")}.xlsx'
+        
+        response = send_file(
+            file_path,
+            as_attachment=True,
+            download_name=download_name,
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+        
+        @response.call_on_close
+        def cleanup():
+            try:
+                os.unlink(file_path)
+            except:
+                pass
+                
+        return response
+        
+    except Exception as e:
+        print(f"Error in export_stock_as_of: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def import_items(db, df, import_mode):
+    """Строки файла импорта -> зоны, коробки и позиции; выполняется писателем (writer.py)"""
+    imported_count = 0
+    updated_count = 0
+    errors = []
+
+    if import_mode == 'replace':
+        db.execute('DELETE FROM box_items')
+        db.execute('DELETE FROM boxes')
+        db.execute('DELETE FROM zones')
+
+    zones_cache = {}
+    boxes_cache = {}
+    products_cache = {}
+
+    for index, row in df.iterrows():
+        try:
+            if pd.isna(row['Название товара']) or pd.isna(row['Количество']):
+                continue
+
+            product_name = str(row['Название товара'])
+            quantity = int(row['Количество'])
+            barcode = products.normalize_barcode(row['Штрих-код']) if 'Штрих-код' in df.columns and not pd.isna(row.get('Штрих-код')) else None
+            article = str(row['Артикул']) if 'Артикул' in df.columns and not pd.isna(row.get('Артикул')) else None
+            zone_name = str(row['Зона']) if 'Зона' in df.columns and not pd.isna(row.get('Зона')) else 'Основная зона'
+            box_name = str(row['Коробка']) if 'Коробка' in df.columns and not pd.isna(row.get('Коробка')) else 'Коробка 1'
+
+            zone_key = zone_name
+            if zone_key not in zones_cache:
+                zone = db.execute('SELECT id FROM zones WHERE name = ?', (zone_name,)).fetchone()
+                if not zone:
+                    cursor = db.execute('INSERT INTO zones (name) VALUES (?)', (zone_name,))
+                    zone_id = cursor.lastrowid
+                else:
+                    zone_id = zone['id']
+                zones_cache[zone_key] = zone_id
+            else:
+                zone_id = zones_cache[zone_key]
+
+            box_key = f"{zone_id}_{box_name}"
+            if box_key not in boxes_cache:
+                box = db.execute('SELECT id FROM boxes WHERE name = ? AND zone_id = ?', (box_name, zone_id)).fetchone()
+                if not box:
+                    cursor = db.execute('INSERT INTO boxes (name, zone_id) VALUES (?, ?)', (box_name, zone_id))
+                    box_id = cursor.lastrowid
+                else:
+                    box_id = box['id']
+                boxes_cache[box_key] = box_id
+            else:
+                box_id = boxes_cache[box_key]
+
+            product_key = barcode or product_name
+            if product_key not in products_cache:
+                products_cache[product_key] = products.get_or_create(db, product_name, barcode, article)
+            product_id = products_cache[product_key]
+
+            existing_item = None
+            if barcode:
+                existing_item = db.execute(
+                    'SELECT id, quantity FROM box_items WHERE box_id = ? AND product_id = ?', 
+                    (box_id, product_id)
+                ).fetchone()
+
+            if existing_item:
+                if import_mode == 'add':
+                    db.execute(
+                        'UPDATE box_items SET quantity = quantity + ? WHERE id = ?',
+                        (quantity, existing_item['id'])
+                    )
+                    updated_count += 1
+                else:
+                    db.execute(
+                        'UPDATE box_items SET quantity = ? WHERE id = ?',
+                        (quantity, existing_item['id'])
+                    )
+                    updated_count += 1
+            else:
+                db.execute(
+                    'INSERT INTO box_items (box_id, product_id, quantity) VALUES (?, ?, ?)',
+                    (box_id, product_id, quantity)
+                )
+                imported_count += 1
+
+        except Exception as e:
+            errors.append(f"Строка {index + 2}: {str(e)}")
+            continue
+    
+    return {'imported_count': imported_count, 'updated_count': updated_count, 'errors': errors}
+
 @app.route('/api/import_items_excel', methods=['POST'])
 @login_required
+@idempotent
 def import_items_excel():
     """Импорт товаров из Excel файла в зоны и коробки"""
     try:
@@ -681,107 +1241,16 @@ def import_items_excel():
         
         import_mode = request.form.get('import_mode', 'add')
         
-        with tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False) as tmp:
-            file_path = tmp.name
-            file.save(file_path)
-        
-        df = pd.read_excel(file_path)
+        df = uploads.read_excel(file)
         
         required_columns = ['Название товара', 'Количество']
         for col in required_columns:
             if col not in df.columns:
-                try:
-                    os.unlink(file_path)
-                except:
-                    pass
                 return jsonify({'success': False, 'error': f'Missing required column: {col}'}), 400
         
-        db = get_db()
-        imported_count = 0
-        updated_count = 0
-        errors = []
-        
-        if import_mode == 'replace':
-            db.execute('DELETE FROM box_items')
-            db.execute('DELETE FROM boxes')
-            db.execute('DELETE FROM zones')
-            db.commit()
-        
-        zones_cache = {}
-        boxes_cache = {}
-        
-        for index, row in df.iterrows():
-            try:
-                if pd.isna(row['Название товара']) or pd.isna(row['Количество']):
-                    continue
-                
-                product_name = str(row['Название товара'])
-                quantity = int(row['Количество'])
-                barcode = str(row['Штрих-код']) if 'Штрих-код' in df.columns and not pd.isna(row.get('Штрих-код')) else None
-                zone_name = str(row['Зона']) if 'Зона' in df.columns and not pd.isna(row.get('Зона')) else 'Основная зона'
-                box_name = str(row['Коробка']) if 'Коробка' in df.columns and not pd.isna(row.get('Коробка')) else 'Коробка 1'
-                
-                zone_key = zone_name
-                if zone_key not in zones_cache:
-                    zone = db.execute('SELECT id FROM zones WHERE name = ?', (zone_name,)).fetchone()
-                    if not zone:
-                        cursor = db.execute('INSERT INTO zones (name) VALUES (?)', (zone_name,))
-                        zone_id = cursor.lastrowid
-                    else:
-                        zone_id = zone['id']
-                    zones_cache[zone_key] = zone_id
-                else:
-                    zone_id = zones_cache[zone_key]
-                
-                box_key = f"{zone_id}_{box_name}"
-                if box_key not in boxes_cache:
-                    box = db.execute('SELECT id FROM boxes WHERE name = ? AND zone_id = ?', (box_name, zone_id)).fetchone()
-                    if not box:
-                        cursor = db.execute('INSERT INTO boxes (name, zone_id) VALUES (?, ?)', (box_name, zone_id))
-                        box_id = cursor.lastrowid
-                    else:
-                        box_id = box['id']
-                    boxes_cache[box_key] = box_id
-                else:
-                    box_id = boxes_cache[box_key]
-                
-                existing_item = None
-                if barcode:
-                    existing_item = db.execute(
-                        'SELECT id, quantity FROM box_items WHERE box_id = ? AND barcode = ?', 
-                        (box_id, barcode)
-                    ).fetchone()
-                
-                if existing_item:
-                    if import_mode == 'add':
-                        db.execute(
-                            'UPDATE box_items SET quantity = quantity + ? WHERE id = ?',
-                            (quantity, existing_item['id'])
-                        )
-                        updated_count += 1
-                    else:
-                        db.execute(
-                            'UPDATE box_items SET quantity = ? WHERE id = ?',
-                            (quantity, existing_item['id'])
-                        )
-                        updated_count += 1
-                else:
-                    db.execute(
-                        'INSERT INTO box_items (box_id, product_name, barcode, quantity) VALUES (?, ?, ?, ?)',
-                        (box_id, product_name, barcode, quantity)
-                    )
-                    imported_count += 1
-                
-            except Exception as e:
-                errors.append(f"Строка {index + 2}: {str(e)}")
-                continue
-        
-        db.commit()
-        
-        try:
-            os.unlink(file_path)
-        except:
-            pass
+        imported = writer.submit(import_items, df, import_mode)
+        imported_count, updated_count = imported['imported_count'], imported['updated_count']
+        errors = imported['errors']
         
         if import_mode == 'replace':
             message = f'Данные заменены. Импортировано {imported_count} новых товаров, обновлено {updated_count} существующих товаров'
@@ -810,12 +1279,16 @@ def import_items_excel():
 @login_required
 def receipts_page():
     """Страница приёмки товаров"""
+    try:
+        date_from = archive.parse_date(request.args.get('date_from'))
+        date_to = archive.parse_date(request.args.get('date_to'))
+    except ValueError:
+        date_from = date_to = None
     db = get_db()
-    receipts = db.execute('''
-        SELECT * FROM receipts 
-        ORDER BY receipt_date DESC, created_at DESC
-    ''').fetchall()
-    return render_template('receipts.html', receipts=receipts, username=session.get('username'))
+    listing = archive.list_receipts(db, page=request.args.get('page', 1, type=int),
+                                    date_from=date_from, date_to=date_to)
+    return render_template('receipts.html', date_from=date_from, date_to=date_to,
+                           username=session.get('username'), **listing)
 
 # НОВАЯ СТРАНИЦА: Сборка товаров
 @app.route('/collection')
@@ -824,21 +1297,131 @@ def collection_page():
     """Страница сборки товаров"""
     return render_template('collection.html', username=session.get('username'))
 
+@app.route('/replenishment')
+@login_required
+def replenishment_page():
+    """Страница пополнения: товары ниже порога и пороги"""
+    return render_template('replenishment.html', days=replenishment.OUTFLOW_DAYS, username=session.get('username'))
+
+@app.route('/stocktake/<int:session_id>')
+@login_required
+def stocktake_page(session_id):
+    """Страница инвентаризации: сканирование и расхождения"""
+    db = get_db()
+    stocktake_session = stocktake.get(db, session_id)
+    if stocktake_session is None:
+        return redirect(url_for('index'))
+    boxes = db.execute('''
+        SELECT id, name FROM boxes WHERE id = ? OR zone_id = ? ORDER BY name
+    ''', (stocktake_session['box_id'], stocktake_session['zone_id'])).fetchall()
+    return render_template('stocktake.html', stocktake=stocktake_session, boxes=boxes,
+                           username=session.get('username'))
+
 @app.route('/receipt/<int:receipt_id>')
 @login_required
 def receipt_detail(receipt_id):
     """Детальная страница приёмки"""
     db = get_db()
-    receipt = db.execute('SELECT * FROM receipts WHERE id = ?', (receipt_id,)).fetchone()
-    items = db.execute('''
-        SELECT * FROM receipt_items 
-        WHERE receipt_id = ? 
-        ORDER BY product_name
-    ''', (receipt_id,)).fetchall()
+    receipt, items = archive.find_receipt(db, receipt_id)
+    if receipt is None:
+        return redirect(url_for('receipts_page'))
     return render_template('receipt_detail.html', receipt=receipt, items=items, username=session.get('username'))
 
+# Операции записи по приёмкам; выполняются писателем (writer.py). Номер
+# приёмки создаётся в операции, чтобы повтор запроса (idempotency.py)
+# вернул тот же номер из сохранённого результата
+def insert_receipt(db, receipt_date, description):
+    receipt_number = f"REC-{datetime.now().strftime('%Y%m%d')}-{uuid.uuid4().hex[:8].upper()}"
+    receipt_id = db.execute('''
+        INSERT INTO receipts (receipt_number, receipt_date, description)
+        VALUES (?, ?, ?)
+    ''', (receipt_number, receipt_date, description)).lastrowid
+    return {'receipt_id': receipt_id, 'receipt_number': receipt_number}
+
+def insert_receipt_items(db, receipt_id, items):
+    """Строки приёмки; None — приёмки нет"""
+    receipt = db.execute('SELECT id FROM receipts WHERE id = ?', (receipt_id,)).fetchone()
+    if not receipt:
+        return None
+
+    total_quantity = 0
+    total_products = len(items)
+
+    for item in items:
+        if not item.get('product_name') or not item.get('quantity'):
+            continue
+
+        product_id = products.get_or_create(db, item['product_name'], item.get('barcode'), item.get('article'))
+        db.execute('''
+            INSERT INTO receipt_items (receipt_id, product_id, quantity, box_name, zone_name)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (
+            receipt_id,
+            product_id,
+            item['quantity'],
+            item.get('box_name'),
+            item.get('zone_name')
+        ))
+
+        total_quantity += item['quantity']
+
+    db.execute('''
+        UPDATE receipts 
+        SET total_quantity = ?, total_products = ? 
+        WHERE id = ?
+    ''', (total_quantity, total_products, receipt_id))
+    return total_products
+
+def import_receipt(db, receipt_date, description, df):
+    """Приёмка из строк файла импорта"""
+    receipt = insert_receipt(db, receipt_date, description)
+    receipt_id = receipt['receipt_id']
+    imported_count = 0
+    total_quantity = 0
+    products_cache = {}
+
+    for index, row in df.iterrows():
+        try:
+            if pd.isna(row['Название товара']) or pd.isna(row['Количество']):
+                continue
+
+            quantity = int(row['Количество'])
+            product_name = str(row['Название товара'])
+            barcode = products.normalize_barcode(row['Штрих-код']) if 'Штрих-код' in df.columns and not pd.isna(row.get('Штрих-код')) else None
+            article = str(row['Артикул']) if 'Артикул' in df.columns and not pd.isna(row.get('Артикул')) else None
+
+            product_key = barcode or product_name
+            if product_key not in products_cache:
+                products_cache[product_key] = products.get_or_create(db, product_name, barcode, article)
+
+            db.execute('''
+                INSERT INTO receipt_items (receipt_id, product_id, quantity, box_name, zone_name)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (
+                receipt_id,
+                products_cache[product_key],
+                quantity,
+                str(row['Коробка']) if 'Коробка' in df.columns and not pd.isna(row.get('Коробка')) else None,
+                str(row['Зона']) if 'Зона' in df.columns and not pd.isna(row.get('Зона')) else None
+            ))
+
+            imported_count += 1
+            total_quantity += quantity
+
+        except Exception as e:
+            print(f"Error importing row {index + 2}: {e}")
+            continue
+
+    db.execute('''
+        UPDATE receipts 
+        SET total_quantity = ?, total_products = ? 
+        WHERE id = ?
+    ''', (total_quantity, imported_count, receipt_id))
+    return dict(receipt, imported_count=imported_count, total_quantity=total_quantity)
+
 @app.route('/api/receipts', methods=['POST'])
 @login_required
+@idempotent
 def create_receipt():
     """Создание новой приёмки"""
     try:
@@ -846,45 +1429,28 @@ def create_receipt():
         if not data or 'receipt_date' not in data:
             return jsonify({'success': False, 'error': 'Missing required fields'}), 400
         
-        db = get_db()
-        
-        receipt_number = f"REC-{datetime.now().strftime('%Y%m%d')}-{uuid.uuid4().hex[:8].upper()}"
-        
-        cursor = db.execute('''
-            INSERT INTO receipts (receipt_number, receipt_date, description)
-            VALUES (?, ?, ?)
-        ''', (
-            receipt_number,
-            data['receipt_date'],
-            data.get('description', '')
-        ))
-        
-        receipt_id = cursor.lastrowid
-        db.commit()
+        receipt = writer.submit(insert_receipt, data['receipt_date'], data.get('description', ''))
         
-        return jsonify({
-            'success': True, 
-            'receipt_id': receipt_id,
-            'receipt_number': receipt_number
-        })
+        return jsonify({'success': True, **receipt})
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/receipts/<int:receipt_id>', methods=['DELETE'])
 @login_required
+@idempotent
 def delete_receipt(receipt_id):
     """Удаление приёмки"""
     try:
-        db = get_db()
-        db.execute('DELETE FROM receipts WHERE id = ?', (receipt_id,))
-        db.commit()
+        archive.delete_archived(receipt_id)
+        writer.submit(archive.delete_receipt, receipt_id)
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/receipts/<int:receipt_id>/items', methods=['POST'])
 @login_required
+@idempotent
 def add_receipt_items(receipt_id):
     """Добавление товаров в приёмку"""
     try:
@@ -892,40 +1458,9 @@ def add_receipt_items(receipt_id):
         if not data or 'items' not in data:
             return jsonify({'success': False, 'error': 'Missing items data'}), 400
         
-        db = get_db()
-        
-        receipt = db.execute('SELECT id FROM receipts WHERE id = ?', (receipt_id,)).fetchone()
-        if not receipt:
+        total_products = writer.submit(insert_receipt_items, receipt_id, data['items'])
+        if total_products is None:
             return jsonify({'success': False, 'error': 'Receipt not found'}), 404
-        
-        total_quantity = 0
-        total_products = len(data['items'])
-        
-        for item in data['items']:
-            if not item.get('product_name') or not item.get('quantity'):
-                continue
-            
-            db.execute('''
-                INSERT INTO receipt_items (receipt_id, product_name, barcode, quantity, box_name, zone_name)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
-                receipt_id,
-                item['product_name'],
-                item.get('barcode'),
-                item['quantity'],
-                item.get('box_name'),
-                item.get('zone_name')
-            ))
-            
-            total_quantity += item['quantity']
-        
-        db.execute('''
-            UPDATE receipts 
-            SET total_quantity = ?, total_products = ? 
-            WHERE id = ?
-        ''', (total_quantity, total_products, receipt_id))
-        
-        db.commit()
         return jsonify({'success': True, 'added_items': total_products})
         
     except Exception as e:
@@ -933,6 +1468,7 @@ def add_receipt_items(receipt_id):
 
 @app.route('/api/receipts/import_excel', methods=['POST'])
 @login_required
+@idempotent
 def import_receipts_excel():
     """Импорт приёмки из Excel файла"""
     try:
@@ -952,80 +1488,19 @@ def import_receipts_excel():
         if not receipt_date:
             return jsonify({'success': False, 'error': 'Receipt date is required'}), 400
         
-        with tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False) as tmp:
-            file_path = tmp.name
-            file.save(file_path)
-        
-        df = pd.read_excel(file_path)
+        df = uploads.read_excel(file)
         
         required_columns = ['Название товара', 'Количество']
         for col in required_columns:
             if col not in df.columns:
-                try:
-                    os.unlink(file_path)
-                except:
-                    pass
                 return jsonify({'success': False, 'error': f'Missing required column: {col}'}), 400
         
-        db = get_db()
-        
-        receipt_number = f"REC-{datetime.now().strftime('%Y%m%d')}-{uuid.uuid4().hex[:8].upper()}"
-        
-        cursor = db.execute('''
-            INSERT INTO receipts (receipt_number, receipt_date, description)
-            VALUES (?, ?, ?)
-        ''', (receipt_number, receipt_date, description))
-        
-        receipt_id = cursor.lastrowid
-        imported_count = 0
-        total_quantity = 0
-        
-        for index, row in df.iterrows():
-            try:
-                if pd.isna(row['Название товара']) or pd.isna(row['Количество']):
-                    continue
-                
-                quantity = int(row['Количество'])
-                
-                db.execute('''
-                    INSERT INTO receipt_items (receipt_id, product_name, barcode, quantity, box_name, zone_name)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (
-                    receipt_id,
-                    str(row['Название товара']),
-                    str(row['Штрих-код']) if 'Штрих-код' in df.columns and not pd.isna(row.get('Штрих-код')) else None,
-                    quantity,
-                    str(row['Коробка']) if 'Коробка' in df.columns and not pd.isna(row.get('Коробка')) else None,
-                    str(row['Зона']) if 'Зона' in df.columns and not pd.isna(row.get('Зона')) else None
-                ))
-                
-                imported_count += 1
-                total_quantity += quantity
-                
-            except Exception as e:
-                print(f"Error importing row {index + 2}: {e}")
-                continue
-        
-        db.execute('''
-            UPDATE receipts 
-            SET total_quantity = ?, total_products = ? 
-            WHERE id = ?
-        ''', (total_quantity, imported_count, receipt_id))
-        
-        db.commit()
-        
-        try:
-            os.unlink(file_path)
-        except:
-            pass
+        imported = writer.submit(import_receipt, receipt_date, description, df)
         
         return jsonify({
             'success': True, 
-            'receipt_id': receipt_id,
-            'receipt_number': receipt_number,
-            'imported_count': imported_count,
-            'total_quantity': total_quantity,
-            'message': f'Приёмка #{receipt_number} создана. Импортировано {imported_count} товаров'
+            **imported,
+            'message': f"Приёмка #{imported['receipt_number']} создана. Импортировано {imported['imported_count']} товаров"
         })
         
     except Exception as e:
@@ -1036,19 +1511,13 @@ def import_receipts_excel():
 def export_receipt_excel(receipt_id):
     """Экспорт приёмки в Excel"""
     try:
-        db = get_db()
+        db = snapshot.report_db()
         
-        receipt = db.execute('SELECT * FROM receipts WHERE id = ?', (receipt_id,)).fetchone()
+        # Приёмка старше границы архива ищется в архиве
+        receipt, items = archive.find_receipt(db, receipt_id)
         if not receipt:
             return jsonify({'success': False, 'error': 'Receipt not found'}), 404
         
-        items = db.execute('''
-            SELECT product_name, barcode, quantity, box_name, zone_name
-            FROM receipt_items 
-            WHERE receipt_id = ?
-            ORDER BY product_name
-        ''', (receipt_id,)).fetchall()
-        
         data = []
         for item in items:
             data.append({
@@ -1106,38 +1575,114 @@ def export_receipt_excel(receipt_id):
 @app.route('/api/receipts/stats')
 @login_required
 def get_receipts_stats():
-    """Получение статистики по приёмкам"""
+    """Получение статистики по приёмкам (с date_from раньше границы — вместе с архивом)"""
     try:
+        try:
+            date_from = archive.parse_date(request.args.get('date_from'))
+            date_to = archive.parse_date(request.args.get('date_to'))
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Dates must be YYYY-MM-DD'}), 400
         db = get_db()
-        
-        total_receipts = db.execute('SELECT COUNT(*) as count FROM receipts').fetchone()['count']
-        total_quantity = db.execute('SELECT SUM(total_quantity) as total FROM receipts').fetchone()['total'] or 0
-        total_products = db.execute('SELECT SUM(total_products) as total FROM receipts').fetchone()['total'] or 0
-        
-        seven_days_stats = db.execute('''
-            SELECT 
-                DATE(receipt_date) as date,
-                COUNT(*) as receipts_count,
-                SUM(total_quantity) as total_quantity,
-                SUM(total_products) as total_products
-            FROM receipts 
-            WHERE receipt_date >= DATE('now', '-7 days')
-            GROUP BY DATE(receipt_date)
-            ORDER BY date DESC
-        ''').fetchall()
+        totals, recent, archived = archive.stats(db, date_from, date_to)
         
         return jsonify({
             'success': True,
-            'stats': {
-                'total_receipts': total_receipts,
-                'total_quantity': total_quantity,
-                'total_products': total_products
-            },
-            'recent_stats': [dict(row) for row in seven_days_stats]
+            'stats': totals,
+            'recent_stats': recent,
+            'archive_included': archived,
+            'archived_before': archive.boundary(db)
         })
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# ПЛОЩАДКИ (несколько складов, sites.py)
+@app.route('/api/sites')
+@login_required
+def list_sites():
+    return jsonify({'success': True, 'sites': list(SITES), 'current': sites.current()})
+
+@app.route('/api/sites/select', methods=['POST'])
+@login_required
+def choose_site():
+    """Площадка по умолчанию для запросов этой сессии"""
+    site = (request.get_json(silent=True) or {}).get('site')
+    if site not in SITES:
+        return jsonify({'success': False, 'error': f'Unknown site: {site}'}), 404
+    session['site'] = site
+    return jsonify({'success': True, 'site': site})
+
+@app.route('/api/sites/lookup')
+@login_required
+def lookup_across_sites():
+    """Поиск штрих-кода на всех площадках"""
+    try:
+        barcode = products.normalize_barcode(request.args.get('barcode'))
+        if not barcode:
+            return jsonify({'success': False, 'error': 'Missing barcode'}), 400
+        return jsonify({'success': True, 'items': sites.lookup_barcode(barcode)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/sites/totals')
+@login_required
+def totals_across_sites():
+    """Остатки по площадкам и в сумме"""
+    try:
+        return jsonify({'success': True, **sites.totals()})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# АДМИНИСТРИРОВАНИЕ: профили запросов
+@app.route('/admin/profiles')
+@admin_required
+def admin_profiles():
+    """Список сохранённых профилей и отчётов о медленных запросах"""
+    return jsonify({'success': True, 'profiles': list_profiles(app.config['PROFILE_DIR'])})
+
+@app.route('/admin/profiles/<path:name>')
+@admin_required
+def download_profile(name):
+    """Скачивание профиля"""
+    return send_from_directory(os.path.abspath(app.config['PROFILE_DIR']), name, as_attachment=True)
+
+# АДМИНИСТРИРОВАНИЕ: обслуживание базы
+@app.route('/admin/maintenance')
+@admin_required
+def admin_maintenance():
+    """Последние запуски задач обслуживания, размер базы и его динамика, резервные копии"""
+    try:
+        return jsonify({'success': True, **maintenance.status(get_db())})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/admin/maintenance/run', methods=['POST'])
+@admin_required
+@idempotent
+def admin_maintenance_run():
+    """Внеочередной запуск задачи обслуживания"""
+    try:
+        task = (request.get_json(silent=True) or {}).get('task')
+        if task not in maintenance.TASKS:
+            return jsonify({'success': False, 'error': f'Unknown task, expected one of: {", ".join(maintenance.TASKS)}'}), 400
+        
+        run = maintenance.run_task(task, force=True)
+        if run is None:
+            return jsonify({'success': True, 'run': None, 'message': 'Nothing to do or the task is already running'})
+        return jsonify({'success': run['status'] == 'ok', 'run': dict(run, details=json.loads(run['details']))})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.cli.command('compact')
+def compact_command():
+    """Разовый полный VACUUM с переводом базы на incremental auto_vacuum (блокирует запись)"""
+    for path in shard_paths():
+        db = sqlite3.connect(path, isolation_level=None)
+        before = os.path.getsize(path)
+        db.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        db.execute('VACUUM')
+        db.close()
+        print(f'{path} compacted: {before / 1024 / 1024:.1f} MB -> {os.path.getsize(path) / 1024 / 1024:.1f} MB')
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,274 @@
+"""Архив старых приёмок в отдельном файле базы.
+
+Приёмки с датой старше ``ARCHIVE_AFTER_DAYS`` дней
+(``WAREHOUSE_RECEIPTS_ARCHIVE_DAYS``) задача обслуживания
+``archive_receipts`` (maintenance.py) переносит вместе с их строками
+в ``<база>-archive.db`` рядом с рабочей базой (каталог можно задать
+``WAREHOUSE_ARCHIVE_DIR``); id приёмок и строк сохраняются. В рабочей базе
+хранится граница ``archived_before``: всё, что раньше неё, может быть
+только в архиве.
+
+Список приёмок и статистика читают рабочую базу. Архив присоединяется
+(ATTACH) и объединяется через UNION ALL, только когда запрошенный
+диапазон дат начинается раньше границы. Карточка приёмки и выгрузка
+ищут приёмку в архиве, если в рабочей базе её нет; удаление удаляет её
+из обеих баз.
+
+Перенос идёт своим соединением, а не через писателя (writer.py): ATTACH
+внутри транзакции невозможен. Порция — до ``ARCHIVE_BATCH`` приёмок,
+копия в архив и удаление из рабочей базы в одной транзакции. В WAL она
+атомарна для каждой базы в отдельности: если процесс упал между
+фиксациями, приёмка остаётся в обеих базах до следующего запуска,
+который перезаписывает копию (INSERT OR REPLACE) и удаляет её снова.
+"""
+import json
+import os
+import sqlite3
+from datetime import date
+
+import database
+import writer
+
+ARCHIVE_AFTER_DAYS = int(os.environ.get('WAREHOUSE_RECEIPTS_ARCHIVE_DAYS', '365'))
+ARCHIVE_BATCH = 200
+PER_PAGE = 50
+
+RECEIPT_COLUMNS = 'id, receipt_number, receipt_date, total_quantity, total_products, description, created_at'
+ITEM_COLUMNS = 'id, receipt_id, product_id, quantity, box_name, zone_name, created_at'
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS receipt_archive (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        archived_before DATE NOT NULL
+    );
+'''
+
+# Те же таблицы в файле архива; product_id ссылается на справочник рабочей базы
+ARCHIVE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS archive.receipts (
+        id INTEGER PRIMARY KEY,
+        receipt_number TEXT NOT NULL,
+        receipt_date DATE NOT NULL,
+        total_quantity INTEGER NOT NULL DEFAULT 0,
+        total_products INTEGER NOT NULL DEFAULT 0,
+        description TEXT,
+        created_at TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS archive.idx_receipts_date ON receipts (receipt_date, created_at);
+
+    CREATE TABLE IF NOT EXISTS archive.receipt_items (
+        id INTEGER PRIMARY KEY,
+        receipt_id INTEGER NOT NULL,
+        product_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL DEFAULT 1,
+        box_name TEXT,
+        zone_name TEXT,
+        created_at TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS archive.idx_receipt_items_receipt ON receipt_items (receipt_id);
+'''
+
+MOVE = [
+    f'''INSERT OR REPLACE INTO archive.receipts ({RECEIPT_COLUMNS})
+        SELECT {RECEIPT_COLUMNS} FROM main.receipts WHERE id IN (SELECT value FROM json_each(:ids))''',
+    f'''INSERT OR REPLACE INTO archive.receipt_items ({ITEM_COLUMNS})
+        SELECT {ITEM_COLUMNS} FROM main.receipt_items WHERE receipt_id IN (SELECT value FROM json_each(:ids))''',
+    'DELETE FROM main.receipt_items WHERE receipt_id IN (SELECT value FROM json_each(:ids))',
+    'DELETE FROM main.receipts WHERE id IN (SELECT value FROM json_each(:ids))',
+]
+
+ITEMS_QUERY = '''
+    SELECT ri.*, p.name AS product_name, p.barcode
+    FROM {schema}.receipt_items ri
+    JOIN main.products p ON ri.product_id = p.id
+    WHERE ri.receipt_id = ?
+    ORDER BY p.name
+'''
+
+
+def init_archive(db):
+    db.executescript(SCHEMA)
+
+
+def archive_path(path=None):
+    path = path or database.db_path()
+    stem = os.path.splitext(os.path.basename(path))[0]
+    directory = os.environ.get('WAREHOUSE_ARCHIVE_DIR') or os.path.dirname(os.path.abspath(path))
+    return os.path.join(directory, f'{stem}-archive.db')
+
+
+def boundary(db):
+    """Дата, раньше которой приёмки могут лежать в архиве; None — архива нет"""
+    row = db.execute('SELECT archived_before FROM main.receipt_archive WHERE id = 1').fetchone()
+    return row[0] if row else None
+
+
+def attach(db, path=None):
+    """Присоединяет архив к соединению как схему archive (повторно — ничего не делает)"""
+    if not any(row[1] == 'archive' for row in db.execute('PRAGMA database_list')):
+        db.execute('ATTACH DATABASE ? AS archive', (archive_path(path),))
+    return db
+
+
+def parse_date(value):
+    """'YYYY-MM-DD' или пусто -> строка даты или None; иначе ValueError"""
+    if not value:
+        return None
+    return date.fromisoformat(value).isoformat()
+
+
+def _source(db, date_from):
+    """Таблица приёмок для диапазона, начинающегося с date_from: рабочая или с архивом"""
+    archived_before = boundary(db)
+    if archived_before is None or date_from is None or date_from >= archived_before:
+        return 'main.receipts', False
+    attach(db)
+    return (f'(SELECT {RECEIPT_COLUMNS} FROM main.receipts '
+            f'UNION ALL SELECT {RECEIPT_COLUMNS} FROM archive.receipts)'), True
+
+
+def _where(date_from, date_to):
+    # Условия только для заданных границ: иначе индекс по дате не используется
+    conditions = []
+    if date_from:
+        conditions.append('receipt_date >= :date_from')
+    if date_to:
+        conditions.append('receipt_date <= :date_to')
+    return f'WHERE {" AND ".join(conditions)}' if conditions else ''
+
+
+def list_receipts(db, page=1, per_page=PER_PAGE, date_from=None, date_to=None):
+    """Страница приёмок, новые первыми.
+
+    Без date_from — только рабочая база; с date_from раньше границы архива
+    в выборку попадают и архивные приёмки.
+    """
+    source, archived = _source(db, date_from)
+    params = {'date_from': date_from, 'date_to': date_to}
+    where = _where(date_from, date_to)
+    total = db.execute(f'SELECT COUNT(*) FROM {source} {where}', params).fetchone()[0]
+    pages = max((total + per_page - 1) // per_page, 1)
+    page = min(max(page, 1), pages)
+    receipts = db.execute(f'''
+        SELECT * FROM {source} {where}
+        ORDER BY receipt_date DESC, created_at DESC, id DESC
+        LIMIT :limit OFFSET :offset
+    ''', dict(params, limit=per_page, offset=(page - 1) * per_page)).fetchall()
+    return {
+        'receipts': receipts,
+        'total': total,
+        'page': page,
+        'pages': pages,
+        'per_page': per_page,
+        'archive_included': archived,
+        'archived_before': boundary(db),
+    }
+
+
+def stats(db, date_from=None, date_to=None):
+    """Итоги по приёмкам за диапазон (по умолчанию — рабочая база) и по дням за последнюю неделю"""
+    source, archived = _source(db, date_from)
+    where = _where(date_from, date_to)
+    totals = db.execute(f'''
+        SELECT COUNT(*) AS total_receipts,
+               COALESCE(SUM(total_quantity), 0) AS total_quantity,
+               COALESCE(SUM(total_products), 0) AS total_products
+        FROM {source} {where}
+    ''', {'date_from': date_from, 'date_to': date_to}).fetchone()
+    week_from = db.execute("SELECT DATE('now', '-7 days')").fetchone()[0]
+    week_source, _ = _source(db, week_from)
+    recent = db.execute(f'''
+        SELECT DATE(receipt_date) AS date,
+               COUNT(*) AS receipts_count,
+               SUM(total_quantity) AS total_quantity,
+               SUM(total_products) AS total_products
+        FROM {week_source}
+        WHERE receipt_date >= :date_from
+        GROUP BY DATE(receipt_date)
+        ORDER BY date DESC
+    ''', {'date_from': week_from}).fetchall()
+    return dict(totals), [dict(row) for row in recent], archived
+
+
+def find_receipt(db, receipt_id):
+    """(приёмка, её строки) из рабочей базы или архива; (None, []) — если нет нигде"""
+    schema = 'main'
+    receipt = db.execute('SELECT * FROM main.receipts WHERE id = ?', (receipt_id,)).fetchone()
+    if receipt is None and boundary(db) is not None:
+        schema = 'archive'
+        receipt = attach(db).execute('SELECT * FROM archive.receipts WHERE id = ?', (receipt_id,)).fetchone()
+    if receipt is None:
+        return None, []
+    return receipt, db.execute(ITEMS_QUERY.format(schema=schema), (receipt_id,)).fetchall()
+
+
+def delete_receipt(db, receipt_id):
+    """Удаляет приёмку и её строки в рабочей базе; выполняется писателем (writer.py)"""
+    db.execute('DELETE FROM main.receipt_items WHERE receipt_id = ?', (receipt_id,))
+    db.execute('DELETE FROM main.receipts WHERE id = ?', (receipt_id,))
+
+
+def delete_archived(receipt_id, path=None):
+    """Удаляет приёмку из архива, если он есть.
+
+    Своим соединением с файлом архива: ATTACH к соединению писателя внутри
+    его транзакции невозможен, а других писателей у архива, кроме переноса,
+    нет. Повторное удаление ничего не меняет.
+    """
+    target = archive_path(path)
+    if not os.path.exists(target):
+        return
+    conn = sqlite3.connect(target, timeout=writer.BUSY_TIMEOUT_MS / 1000)
+    try:
+        # Файл мог создать ATTACH до первого переноса — тогда таблиц в нём нет
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'receipts'").fetchone():
+            return
+        with conn:
+            conn.execute('DELETE FROM receipt_items WHERE receipt_id = ?', (receipt_id,))
+            conn.execute('DELETE FROM receipts WHERE id = ?', (receipt_id,))
+    finally:
+        conn.close()
+
+
+def move(path, days=ARCHIVE_AFTER_DAYS):
+    """Переносит в архив приёмки с датой старше days дней"""
+    if days <= 0:
+        return None
+    conn = sqlite3.connect(path, isolation_level=None, timeout=writer.BUSY_TIMEOUT_MS / 1000)
+    try:
+        cutoff = conn.execute("SELECT DATE('now', ?)", (f'-{days} days',)).fetchone()[0]
+        if not conn.execute('SELECT 1 FROM receipts WHERE receipt_date < ? LIMIT 1', (cutoff,)).fetchone():
+            return None
+        attach(conn, path)
+        conn.execute('PRAGMA archive.journal_mode = WAL')
+        conn.executescript(ARCHIVE_SCHEMA)
+        # Граница сдвигается до переноса: пока он идёт, запросы за старые
+        # даты уже объединяют архив с ещё не перенесёнными приёмками
+        conn.execute('''
+            INSERT INTO main.receipt_archive (id, archived_before) VALUES (1, ?)
+            ON CONFLICT (id) DO UPDATE SET archived_before = MAX(archived_before, excluded.archived_before)
+        ''', (cutoff,))
+
+        moved_receipts = moved_items = 0
+        while True:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                ids = [row[0] for row in conn.execute('''
+                    SELECT id FROM main.receipts WHERE receipt_date < ? ORDER BY receipt_date, id LIMIT ?
+                ''', (cutoff, ARCHIVE_BATCH))]
+                if not ids:
+                    conn.execute('ROLLBACK')
+                    break
+                params = {'ids': json.dumps(ids)}
+                conn.execute(MOVE[0], params)
+                moved_items += conn.execute(MOVE[1], params).rowcount
+                for statement in MOVE[2:]:
+                    conn.execute(statement, params)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            moved_receipts += len(ids)
+    finally:
+        conn.close()
+    return {'archived_receipts': moved_receipts, 'archived_items': moved_items, 'archived_before': cutoff}
@@ -0,0 +1,48 @@
+"""Версионированные URL статики и долгое кэширование.
+
+``url_for('static', filename=...)`` получает параметр ``v`` — хэш
+содержимого файла, поэтому браузер может кэшировать такие ответы на год:
+после изменения файла меняется и URL.
+"""
+import hashlib
+import os
+
+from flask import request
+
+CACHE_MAX_AGE = 365 * 24 * 3600
+
+# filename -> (mtime, хэш); пересчитывается при изменении файла
+_fingerprints = {}
+
+
+def fingerprint(static_folder, filename):
+    path = os.path.join(static_folder, filename)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    cached = _fingerprints.get(filename)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, 'rb') as f:
+        digest = hashlib.md5(f.read()).hexdigest()[:12]
+    _fingerprints[filename] = (mtime, digest)
+    return digest
+
+
+def init_static_assets(app):
+    @app.url_defaults
+    def add_static_fingerprint(endpoint, values):
+        if endpoint == 'static' and 'filename' in values and 'v' not in values:
+            version = fingerprint(app.static_folder, values['filename'])
+            if version:
+                values['v'] = version
+
+    @app.after_request
+    def cache_fingerprinted_static(response):
+        if request.endpoint == 'static' and request.args.get('v') and response.status_code in (200, 304):
+            response.cache_control.public = True
+            response.cache_control.max_age = CACHE_MAX_AGE
+            response.cache_control.immutable = True
+            response.cache_control.no_cache = None
+        return response
@@ -0,0 +1,4 @@
+"""Бенчмарки складского приложения.
+
+Запуск основного набора: ``python -m bench.run --help``.
+"""
@@ -0,0 +1,181 @@
+"""Размер базы и время выгрузки до и после справочника товаров.
+
+Строит базу в старой схеме (название и штрих-код в каждой строке
+box_items/receipt_items) с длинными названиями товаров, замеряет размер и
+выгрузку, затем переводит её в новую схему через database.init_db и
+повторяет замеры.
+
+    python -m bench.catalog --items 300000 --receipt-items 200000 --products 30000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from bench import generate  # noqa: E402
+
+# Схема до справочника товаров
+LEGACY_SCHEMA = '''
+    CREATE TABLE zones (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, description TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE boxes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, description TEXT,
+        zone_id INTEGER NOT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE box_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, box_id INTEGER NOT NULL,
+        product_name TEXT NOT NULL, barcode TEXT, quantity INTEGER NOT NULL DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX idx_box_items_box_barcode ON box_items (box_id, barcode);
+    CREATE TABLE receipts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, receipt_number TEXT NOT NULL UNIQUE,
+        receipt_date DATE NOT NULL, total_quantity INTEGER NOT NULL DEFAULT 0,
+        total_products INTEGER NOT NULL DEFAULT 0, description TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE receipt_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, receipt_id INTEGER NOT NULL,
+        product_name TEXT NOT NULL, barcode TEXT, quantity INTEGER NOT NULL DEFAULT 1,
+        box_name TEXT, zone_name TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+'''
+
+LEGACY_EXPORT = '''
+    SELECT z.name as "Зона", b.name as "Коробка", bi.product_name as "Название товара",
+           bi.barcode as "Штрих-код", bi.quantity as "Количество", bi.created_at as "Дата добавления"
+    FROM box_items bi
+    JOIN boxes b ON bi.box_id = b.id
+    JOIN zones z ON b.zone_id = z.id
+    ORDER BY z.name, b.name, bi.product_name
+'''
+
+EXPORT = '''
+    SELECT z.name as "Зона", b.name as "Коробка", p.name as "Название товара",
+           p.barcode as "Штрих-код", bi.quantity as "Количество", bi.created_at as "Дата добавления"
+    FROM box_items bi
+    JOIN products p ON bi.product_id = p.id
+    JOIN boxes b ON bi.box_id = b.id
+    JOIN zones z ON b.zone_id = z.id
+    ORDER BY z.name, b.name, p.name
+'''
+
+# Таблицы с данными о товарах (без журнала и поискового индекса)
+CORE_TABLES = ('box_items', 'receipt_items', 'products', 'idx_box_items_box_barcode',
+               'idx_box_items_box_product', 'idx_box_items_product', 'idx_receipt_items_product',
+               'sqlite_autoindex_products_1', 'idx_products_name_no_barcode')
+
+QUALIFIERS = ['мужская', 'женская', 'детская', 'хлопковая', 'оверсайз', 'с принтом',
+              'водоотталкивающий', 'из нержавеющей стали', 'для путешествий', 'подарочная']
+SIZES = ['XS', 'S', 'M', 'L', 'XL', 'XXL', '0,5 л', '1 л', '20x30 см']
+
+
+def long_product_name(rng, barcode):
+    return (f'{rng.choice(generate.WORDS)} {rng.choice(QUALIFIERS)} {rng.choice(QUALIFIERS)}, '
+            f'цвет {rng.choice(generate.COLORS)}, размер {rng.choice(SIZES)}, '
+            f'коллекция {rng.randint(2019, 2025)}, арт. {barcode[-6:]}')
+
+
+def build_legacy(path, items, receipt_items, product_count, seed):
+    rng = random.Random(seed)
+    db = sqlite3.connect(path)
+    db.executescript(LEGACY_SCHEMA)
+    db.executemany('INSERT INTO zones (name) VALUES (?)', [(f'Зона {z + 1}',) for z in range(20)])
+    db.executemany('INSERT INTO boxes (name, zone_id) VALUES (?, ?)',
+                   [(f'Коробка {b + 1}', b % 20 + 1) for b in range(max(1, items // 100))])
+    boxes = max(1, items // 100)
+    catalog = [(b, long_product_name(rng, b)) for b in (generate.make_barcode(rng) for _ in range(product_count))]
+    db.executemany(
+        'INSERT INTO box_items (box_id, product_name, barcode, quantity) VALUES (?, ?, ?, ?)',
+        ((rng.randint(1, boxes), name, barcode, rng.randint(1, 200))
+         for barcode, name in (rng.choice(catalog) for _ in range(items)))
+    )
+    db.executemany('INSERT INTO receipts (receipt_number, receipt_date) VALUES (?, date(\'now\'))',
+                   [(f'REC-BENCH-{r}',) for r in range(max(1, receipt_items // 200))])
+    receipts = max(1, receipt_items // 200)
+    db.executemany(
+        'INSERT INTO receipt_items (receipt_id, product_name, barcode, quantity, box_name, zone_name) '
+        'VALUES (?, ?, ?, ?, ?, ?)',
+        ((rng.randint(1, receipts), name, barcode, rng.randint(1, 50), 'Коробка 1', 'Зона 1')
+         for barcode, name in (rng.choice(catalog) for _ in range(receipt_items)))
+    )
+    db.commit()
+    db.close()
+
+
+def sizes(path):
+    db = sqlite3.connect(path)
+    db.execute('VACUUM')
+    per_table = dict(db.execute('SELECT name, SUM(pgsize) FROM dbstat GROUP BY name'))
+    db.close()
+    core = sum(size for name, size in per_table.items() if name in CORE_TABLES)
+    return os.path.getsize(path), core
+
+
+def time_export(path, query, workdir, repeat):
+    """(лучшее время запроса в DataFrame, время записи xlsx), мс"""
+    db = sqlite3.connect(path)
+    query_ms = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        df = pd.read_sql_query(query, db)
+        query_ms.append((time.perf_counter() - started) * 1000)
+    db.close()
+    started = time.perf_counter()
+    df.to_excel(os.path.join(workdir, 'export.xlsx'), index=False, engine='openpyxl')
+    return min(query_ms), (time.perf_counter() - started) * 1000, len(df)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Database size and export time before/after the product catalogue')
+    parser.add_argument('--items', type=int, default=300_000)
+    parser.add_argument('--receipt-items', type=int, default=200_000)
+    parser.add_argument('--products', type=int, default=30_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--dir')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix='warehouse-catalog-', dir=args.dir) as workdir:
+        path = os.path.join(workdir, 'warehouse.db')
+        print(f'Building legacy database: {args.items:,} box items, {args.receipt_items:,} receipt items, '
+              f'{args.products:,} products...')
+        build_legacy(path, args.items, args.receipt_items, args.products, args.seed)
+        before_size, before_core = sizes(path)
+        before_query, before_xlsx, rows = time_export(path, LEGACY_EXPORT, workdir, args.repeat)
+
+        os.environ['WAREHOUSE_DB'] = path
+        import database
+        started = time.perf_counter()
+        database.init_db()
+        migrate_s = time.perf_counter() - started
+
+        after_size, after_core = sizes(path)
+        after_query, after_xlsx, after_rows = time_export(path, EXPORT, workdir, args.repeat)
+        if after_rows != rows:
+            raise SystemExit(f'Export row count changed: {rows} -> {after_rows}')
+
+    mb = 1024 * 1024
+    print()
+    print(f'init_db (migration, ledger, search index): {migrate_s:.1f} s')
+    print(f'{"":<28}{"before":>12}{"after":>12}')
+    print(f'{"item tables + indexes, MB":<28}{before_core / mb:>12.1f}{after_core / mb:>12.1f}')
+    print(f'{"database file, MB":<28}{before_size / mb:>12.1f}{after_size / mb:>12.1f}')
+    print(f'{"export query, ms":<28}{before_query:>12.0f}{after_query:>12.0f}')
+    print(f'{"export xlsx write, ms":<28}{before_xlsx:>12.0f}{after_xlsx:>12.0f}')
+    print(f'({rows:,} exported rows; the file after migration also holds the ledger and search index)')
+
+
+if __name__ == '__main__':
+    main()
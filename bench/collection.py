@@ -0,0 +1,146 @@
+"""Сопоставление файла сборки с остатками: прежний цикл и merge (collection.py).
+
+Строит синтетический склад, генерирует файл сборки заданного размера
+(сразу DataFrame — без записи xlsx) и замеряет обе реализации, не считая
+чтение Excel. Прежний цикл по ``df.iterrows()`` воспроизведён ниже.
+
+    python -m bench.collection --lines 500000
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+import collection  # noqa: E402
+from bench import generate  # noqa: E402
+
+
+def legacy_plan(db, df, barcode_col, quantity_col, name_col, article_col):
+    """Прежняя реализация из app.process_collection"""
+    all_items = db.execute('''
+        SELECT bi.id as item_id, p.name as product_name, p.barcode, bi.quantity,
+               b.name as box_name, z.name as zone_name, b.id as box_id
+        FROM box_items bi
+        JOIN products p ON bi.product_id = p.id
+        JOIN boxes b ON bi.box_id = b.id
+        JOIN zones z ON b.zone_id = z.id
+        WHERE bi.quantity > 0
+        ORDER BY bi.id
+    ''').fetchall()
+    items_dict = {}
+    for item in all_items:
+        barcode = str(item['barcode']).strip() if item['barcode'] else ''
+        if barcode and barcode != 'nan':
+            items_dict[barcode] = {
+                'item_id': item['item_id'], 'product_name': item['product_name'], 'quantity': item['quantity'],
+                'zone': item['zone_name'], 'box': item['box_name'], 'box_id': item['box_id']
+            }
+
+    collection_plan = []
+    total_needed = 0
+    total_to_take = 0
+    for index, row in df.iterrows():
+        try:
+            if pd.isna(row[barcode_col]) or pd.isna(row[quantity_col]):
+                continue
+            barcode = str(row[barcode_col]).strip()
+            needed_qty = int(row[quantity_col])
+            product_name = str(row[name_col]) if name_col and not pd.isna(row.get(name_col)) else None
+            article = str(row[article_col]) if article_col and not pd.isna(row.get(article_col)) else ""
+            if not barcode or barcode == 'nan':
+                continue
+            if barcode in items_dict:
+                item_info = items_dict[barcode]
+                available_qty = item_info['quantity']
+                product_name = product_name or item_info['product_name']
+                take_qty = min(needed_qty, available_qty)
+                if take_qty > 0:
+                    collection_plan.append({
+                        'barcode': barcode, 'article': article, 'product_name': product_name,
+                        'needed': needed_qty, 'take': take_qty, 'zone': item_info['zone'],
+                        'box': item_info['box'], 'remaining_after': available_qty - take_qty,
+                        'item_id': item_info['item_id'], 'box_id': item_info['box_id']
+                    })
+                    total_needed += needed_qty
+                    total_to_take += take_qty
+        except Exception:
+            continue
+    return collection_plan, total_needed, total_to_take
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Collection matching: iterrows loop vs columnar merge')
+    parser.add_argument('--lines', type=int, default=500_000, help='demand lines in the order file')
+    parser.add_argument('--zones', type=int, default=20)
+    parser.add_argument('--boxes-per-zone', type=int, default=50)
+    parser.add_argument('--items-per-box', type=int, default=100)
+    parser.add_argument('--duplicate-rate', type=float, default=0.3, help='share of repeated demand barcodes')
+    parser.add_argument('--format', choices=sorted(generate.ORDER_FORMATS), default='shk_excel')
+    parser.add_argument('--skip-legacy', action='store_true')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix='warehouse-collection-') as workdir:
+        db_path = os.path.join(workdir, 'warehouse.db')
+        os.environ['WAREHOUSE_DB'] = db_path
+        import database
+        database.init_db()
+        warehouse = generate.generate_warehouse(db_path, zones=args.zones, boxes_per_zone=args.boxes_per_zone,
+                                                items_per_box=args.items_per_box, seed=args.seed)
+        db = sqlite3.connect(db_path)
+        db.row_factory = sqlite3.Row
+
+        df = generate.generate_order_frame(warehouse, args.format, lines=args.lines,
+                                           duplicate_rate=args.duplicate_rate, seed=args.seed)
+        columns = generate.ORDER_FORMATS[args.format]
+        print(f'{len(warehouse.barcodes):,} products in stock, {len(df):,} demand lines '
+              f'({df[columns[0]].nunique():,} distinct barcodes)')
+
+        # Без повторов обе реализации должны давать один и тот же план
+        unique = df.drop_duplicates(columns[0])
+        if legacy_plan(db, unique, *columns) != collection.build_plan(db, unique, *columns):
+            raise SystemExit('Plans differ on an order file without repeated barcodes')
+
+        demand, demand_s = timed(collection.demand_frame, df, *columns)
+        stock, stock_s = timed(collection.stock_frame, db)
+        plan, match_s = timed(collection.match, db, demand, stock)
+        records, records_s = timed(collection.plan_records, plan)
+        _, json_s = timed(json.dumps, records)
+        new_total = demand_s + stock_s + match_s + records_s
+
+        print()
+        print('merge (collection.py):')
+        print(f'  demand frame + aggregation {demand_s * 1000:>8.0f} ms')
+        print(f'  stock frame                {stock_s * 1000:>8.0f} ms')
+        print(f'  merge + names              {match_s * 1000:>8.0f} ms')
+        print(f'  plan records               {records_s * 1000:>8.0f} ms')
+        print(f'  total                      {new_total * 1000:>8.0f} ms  ({len(records):,} plan lines, '
+              f'{int(plan["take"].sum()):,} units to take)')
+        print(f'  (json.dumps of the plan    {json_s * 1000:>8.0f} ms)')
+
+        if not args.skip_legacy:
+            (legacy_records, _, legacy_take), legacy_s = timed(legacy_plan, db, df, *columns)
+            print('iterrows loop (before):')
+            print(f'  total                      {legacy_s * 1000:>8.0f} ms  ({len(legacy_records):,} plan lines, '
+                  f'{legacy_take:,} units to take; repeated barcodes counted per line)')
+            print(f'speed-up: {legacy_s / new_total:.0f}x')
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
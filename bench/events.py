@@ -0,0 +1,186 @@
+"""Сканирование при нескольких открытых станциях: перезагрузка страницы против потока изменений (events.py).
+
+Несколько «станций» смотрят одну коробку. Раньше, чтобы увидеть
+сканирование, каждая перезагружала страницу коробки (HTML целиком, запросы
+к базе на каждую); теперь каждая получает одно сообщение SSE, а запросы к
+базе делает один поток рассылки на процесс. Считаются запросы SQL (кроме
+соединения писателя — его работа одинакова в обоих случаях) и байты на
+одно сканирование, задержка доставки события и цена триггеров журнала для
+писателя.
+
+    python -m bench.events --stations 5 --items-per-box 100 --scans 200
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from bench import generate  # noqa: E402
+from bench.run import logged_in_client, percentile  # noqa: E402
+
+
+class StatementCounter:
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def hook(self, conn, path):
+        conn.set_trace_callback(self.trace)
+
+    def trace(self, statement):
+        with self._lock:
+            self.count += 1
+
+
+class Station:
+    """Открытая страница: читает поток изменений в своём потоке"""
+
+    def __init__(self, client, last_event_id):
+        self.response = client.get(f'/api/events?last_event_id={last_event_id}', buffered=False)
+        self.messages = 0
+        self.bytes = 0
+        self.arrivals = []
+        self.ready = threading.Event()
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        for chunk in self.response.response:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            if chunk.startswith(b'retry:'):
+                self.ready.set()
+                continue
+            self.bytes += len(chunk)
+            self.messages += 1
+            self.arrivals.append(time.perf_counter())
+
+
+def scan_payload(box_id, barcode, names):
+    return {'box_id': box_id, 'product_name': names[barcode], 'barcode': barcode, 'quantity': 1}
+
+
+def writer_cost(db_path, item_ids, count):
+    """Медиана времени фиксации одиночного сканирования через писателя, мс"""
+    import writer
+    coalescer = writer.get_writer(db_path)
+
+    def scan(conn, item_id):
+        conn.execute('UPDATE box_items SET quantity = quantity + 1 WHERE id = ?', (item_id,))
+
+    samples = []
+    for index in range(count):
+        started = time.perf_counter()
+        coalescer.submit(scan, item_ids[index % len(item_ids)])
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Per-scan queries and bytes: page reloads vs server-sent events')
+    parser.add_argument('--stations', type=int, default=5, help='open pages watching the same box')
+    parser.add_argument('--items-per-box', type=int, default=100)
+    parser.add_argument('--scans', type=int, default=200)
+    parser.add_argument('--zones', type=int, default=5)
+    parser.add_argument('--boxes-per-zone', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix='warehouse-events-') as workdir:
+        db_path = os.path.join(workdir, 'warehouse.db')
+        os.environ['WAREHOUSE_DB'] = db_path
+        os.chdir(workdir)
+        import app as warehouse_app
+        import database
+        import events
+        warehouse = generate.generate_warehouse(db_path, zones=args.zones, boxes_per_zone=args.boxes_per_zone,
+                                                items_per_box=args.items_per_box, seed=args.seed)
+        counter = StatementCounter()
+        database.connection_hooks.append(counter.hook)
+
+        box_id = warehouse.box_ids[0]
+        db = database.get_db()
+        barcodes = [row[0] for row in db.execute('''
+            SELECT p.barcode FROM box_items bi JOIN products p ON bi.product_id = p.id WHERE bi.box_id = ?
+        ''', (box_id,))]
+        item_ids = [row[0] for row in db.execute('SELECT id FROM box_items WHERE box_id = ?', (box_id,))]
+        db.close()
+
+        # Цена триггеров журнала — до запуска потоков рассылки, поочерёдно с ними и без них
+        with_triggers, without_triggers = [], []
+        for _ in range(3):
+            with_triggers.append(writer_cost(db_path, item_ids, 1000))
+            db = database.get_db()
+            triggers = [row[0] for row in db.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE '%_events_%'")]
+            for name in triggers:
+                db.execute(f'DROP TRIGGER {name}')
+            db.commit()
+            without_triggers.append(writer_cost(db_path, item_ids, 1000))
+            events.init_events(db)
+            db.commit()
+            db.close()
+        with_triggers, without_triggers = statistics.median(with_triggers), statistics.median(without_triggers)
+
+        scans = [scan_payload(box_id, barcodes[i % len(barcodes)], warehouse.names) for i in range(args.scans)]
+        client = logged_in_client(warehouse_app.app)
+        gzip = {'Accept-Encoding': 'gzip'}
+
+        # Раньше: сканирование, затем каждая станция перезагружает страницу коробки
+        counter.count = 0
+        page_bytes = 0
+        started = time.perf_counter()
+        for payload in scans:
+            client.post('/api/box_items', json=payload)
+            for _ in range(args.stations):
+                page_bytes += len(client.get(f'/box/{box_id}', headers=gzip).data)
+        before_s = time.perf_counter() - started
+        before_queries = counter.count
+
+        # Теперь: станции держат поток изменений, страница не перезагружается
+        db = database.get_db()
+        last_id = events.last_event_id(db)
+        db.close()
+        stations = [Station(logged_in_client(warehouse_app.app), last_id) for _ in range(args.stations)]
+        for station in stations:
+            station.ready.wait(5)
+        counter.count = 0
+        delivery = []
+        started = time.perf_counter()
+        for index, payload in enumerate(scans, start=1):
+            client.post('/api/box_items', json=payload)
+            posted = time.perf_counter()
+            deadline = posted + 5
+            while any(station.messages < index for station in stations) and time.perf_counter() < deadline:
+                time.sleep(0.0002)
+            delivery.extend((station.arrivals[index - 1] - posted) * 1000
+                            for station in stations if station.messages >= index)
+        after_s = time.perf_counter() - started
+        after_queries = counter.count
+        sse_bytes = sum(station.bytes for station in stations)
+        messages = sum(station.messages for station in stations)
+        broadcaster = events.get_broadcaster(db_path)
+
+    print(f'box with {len(item_ids)} items, {args.stations} stations watching it, {args.scans} scans')
+    print()
+    print(f'{"per scan":<34}{"SQL queries":>12}{"bytes":>10}{"wall ms":>9}')
+    print(f'{"reload on every station (gzip)":<34}{before_queries / args.scans:>12.1f}'
+          f'{page_bytes / args.scans:>10.0f}{before_s * 1000 / args.scans:>9.1f}')
+    print(f'{"server-sent events":<34}{after_queries / args.scans:>12.1f}'
+          f'{sse_bytes / args.scans:>10.0f}{after_s * 1000 / args.scans:>9.1f}')
+    print()
+    print(f'SSE: {messages} messages delivered of {args.scans * args.stations} expected; '
+          f'delivery after the scan request returned p50 {percentile(delivery, 50):.1f} ms, '
+          f'p99 {percentile(delivery, 99):.1f} ms; broadcaster polls: {broadcaster.polls}')
+    print(f'writer commit of a single scan: {without_triggers:.2f} ms without change-event triggers, '
+          f'{with_triggers:.2f} ms with them (median)')
+
+
+if __name__ == '__main__':
+    main()
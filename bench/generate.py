@@ -0,0 +1,146 @@
+"""Генератор синтетических складов и файлов маркетплейсов"""
+import io
+import random
+import sqlite3
+
+import pandas as pd
+
+# Форматы файлов сборки, которые понимает detect_file_columns
+ORDER_FORMATS = {
+    'shk_excel': ('Баркод', 'Количество, шт.', 'Предмет', 'Артикул поставщика'),
+    'products_export': ('штрихкод', 'количество', 'имя (необязательно)', 'артикул'),
+}
+
+WORDS = ['Футболка', 'Кружка', 'Блокнот', 'Рюкзак', 'Кабель', 'Чехол', 'Лампа', 'Носки',
+         'Зарядка', 'Термос', 'Коврик', 'Ручка', 'Очки', 'Шапка', 'Перчатки', 'Игрушка']
+COLORS = ['красный', 'синий', 'чёрный', 'белый', 'зелёный', 'серый']
+
+
+def make_barcode(rng):
+    return '46' + ''.join(rng.choice('0123456789') for _ in range(11))
+
+
+def make_product_name(rng, barcode):
+    return f"{rng.choice(WORDS)} {rng.choice(COLORS)} арт. {barcode[-5:]}"
+
+
+class Warehouse:
+    """Описание сгенерированного склада: какие штрих-коды где лежат"""
+
+    def __init__(self, zone_ids, box_ids, barcodes, names):
+        self.zone_ids = zone_ids
+        self.box_ids = box_ids
+        self.barcodes = barcodes
+        self.names = names
+
+
+def generate_warehouse(db_path, zones=10, boxes_per_zone=20, items_per_box=50,
+                       duplicate_rate=0.1, seed=42):
+    """Заполняет базу синтетическим складом.
+
+    duplicate_rate — доля позиций, штрих-код которых уже лежит в другой
+    коробке (один товар в нескольких местах).
+    """
+    rng = random.Random(seed)
+    db = sqlite3.connect(db_path)
+
+    zone_rows = [(f'Зона {z + 1}', f'Синтетическая зона {z + 1}') for z in range(zones)]
+    db.executemany('INSERT INTO zones (name, description) VALUES (?, ?)', zone_rows)
+    zone_ids = [row[0] for row in db.execute('SELECT id FROM zones ORDER BY id')]
+
+    box_rows = [(f'Коробка {z_index + 1}-{b + 1}', '', zone_id)
+                for z_index, zone_id in enumerate(zone_ids)
+                for b in range(boxes_per_zone)]
+    db.executemany('INSERT INTO boxes (name, description, zone_id) VALUES (?, ?, ?)', box_rows)
+    box_ids = [row[0] for row in db.execute('SELECT id FROM boxes ORDER BY id')]
+
+    barcodes = []
+    names = {}
+    item_rows = []
+    for box_id in box_ids:
+        in_box = set()
+        for _ in range(items_per_box):
+            if barcodes and rng.random() < duplicate_rate:
+                barcode = rng.choice(barcodes)
+            else:
+                barcode = make_barcode(rng)
+                # На сотнях тысяч товаров случайные штрих-коды иногда совпадают
+                if barcode not in names:
+                    barcodes.append(barcode)
+                    names[barcode] = make_product_name(rng, barcode)
+            if barcode in in_box:
+                continue
+            in_box.add(barcode)
+            item_rows.append((box_id, barcode, rng.randint(1, 200)))
+    db.executemany('INSERT INTO products (barcode, name) VALUES (?, ?)',
+                   ((barcode, names[barcode]) for barcode in barcodes))
+    product_ids = dict(db.execute('SELECT barcode, id FROM products WHERE barcode IS NOT NULL'))
+    db.executemany('INSERT INTO box_items (box_id, product_id, quantity) VALUES (?, ?, ?)',
+                   ((box_id, product_ids[barcode], quantity) for box_id, barcode, quantity in item_rows))
+    db.commit()
+    db.close()
+
+    return Warehouse(zone_ids, box_ids, barcodes, names)
+
+
+def _to_xlsx(df):
+    buffer = io.BytesIO()
+    df.to_excel(buffer, index=False, engine='openpyxl')
+    buffer.seek(0)
+    return buffer
+
+
+def generate_order_xlsx(warehouse, file_format='shk_excel', lines=500, missing_rate=0.05,
+                        duplicate_rate=0.05, seed=42):
+    """Файл сборки маркетплейса (xlsx) — см. generate_order_frame"""
+    return _to_xlsx(generate_order_frame(warehouse, file_format, lines, missing_rate, duplicate_rate, seed))
+
+
+def generate_order_frame(warehouse, file_format='shk_excel', lines=500, missing_rate=0.05,
+                         duplicate_rate=0.05, seed=42):
+    """Строки файла сборки маркетплейса в одном из известных форматов.
+
+    missing_rate — доля строк со штрих-кодами, которых нет на складе,
+    duplicate_rate — доля строк, повторяющих уже встречавшийся штрих-код.
+    """
+    rng = random.Random(seed)
+    barcode_col, quantity_col, name_col, article_col = ORDER_FORMATS[file_format]
+    rows = []
+    used = []
+    for _ in range(lines):
+        if used and rng.random() < duplicate_rate:
+            barcode = rng.choice(used)
+        elif rng.random() < missing_rate:
+            barcode = make_barcode(rng)
+        else:
+            barcode = rng.choice(warehouse.barcodes)
+        used.append(barcode)
+        rows.append({
+            barcode_col: int(barcode),
+            quantity_col: rng.randint(1, 5),
+            name_col: warehouse.names.get(barcode, make_product_name(rng, barcode)),
+            article_col: f'ART-{barcode[-6:]}',
+        })
+    return pd.DataFrame(rows)
+
+
+def generate_items_xlsx(warehouse, rows=1000, new_rate=0.3, seed=42):
+    """Файл импорта товаров / приёмки: Название товара, Количество, Штрих-код, Зона, Коробка"""
+    rng = random.Random(seed)
+    data = []
+    for _ in range(rows):
+        if rng.random() < new_rate:
+            barcode = make_barcode(rng)
+            name = make_product_name(rng, barcode)
+        else:
+            barcode = rng.choice(warehouse.barcodes)
+            name = warehouse.names[barcode]
+        zone = rng.randrange(len(warehouse.zone_ids)) + 1
+        data.append({
+            'Название товара': name,
+            'Количество': rng.randint(1, 50),
+            'Штрих-код': barcode,
+            'Зона': f'Зона {zone}',
+            'Коробка': f'Коробка {zone}-{rng.randint(1, 5)}',
+        })
+    return _to_xlsx(pd.DataFrame(data))
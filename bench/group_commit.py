@@ -0,0 +1,95 @@
+"""Бенчмарк сканирований в секунду: отдельный commit на скан против group commit.
+
+Оба режима выполняют ту же операцию ``upsert_box_item`` из приложения на
+одном и том же диске; ``direct`` повторяет прежнее поведение маршрута
+(своё соединение и свой commit на каждый скан), ``coalesced`` отправляет
+сканы через писателя из writer.py.
+
+    python -m bench.group_commit --threads 16 --scans 4000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from bench import generate  # noqa: E402
+from bench.run import load_app  # noqa: E402
+
+
+def run_threads(threads, scans, work):
+    per_thread = scans // threads
+    errors = []
+
+    def worker(seed):
+        rng = random.Random(seed)
+        for _ in range(per_thread):
+            try:
+                work(rng)
+            except sqlite3.Error as e:
+                errors.append(str(e))
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+    return per_thread * threads, elapsed, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Scans/sec with and without group commit')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--scans', type=int, default=4000)
+    parser.add_argument('--boxes-per-zone', type=int, default=20)
+    parser.add_argument('--items-per-box', type=int, default=50)
+    parser.add_argument('--dir', help='directory for the database (defaults to a temp dir on the same disk as TMPDIR)')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix='warehouse-gc-', dir=args.dir) as workdir:
+        warehouse_app = load_app(workdir)
+        import app as app_module
+        import database
+        import writer
+
+        warehouse = generate.generate_warehouse(database.DB_PATH, zones=10, boxes_per_zone=args.boxes_per_zone,
+                                                items_per_box=args.items_per_box)
+
+        def scan_args(rng):
+            barcode = rng.choice(warehouse.barcodes)
+            return rng.choice(warehouse.box_ids), warehouse.names[barcode], barcode, 1
+
+        def direct(rng):
+            db = sqlite3.connect(database.DB_PATH, timeout=30)
+            db.row_factory = sqlite3.Row
+            app_module.upsert_box_item(db, *scan_args(rng))
+            db.commit()
+            db.close()
+
+        def coalesced(rng):
+            writer.submit(app_module.upsert_box_item, *scan_args(rng))
+
+        results = {}
+        for name, work in (('direct', direct), ('coalesced', coalesced)):
+            done, elapsed, errors = run_threads(args.threads, args.scans, work)
+            results[name] = done / elapsed
+            print(f'{name:<10} {done} scans in {elapsed:.2f}s -> {done / elapsed:>9.0f} scans/s, errors: {len(errors)}')
+
+        w = writer.get_writer()
+        print(f'coalesced batches: {w.batches}, average batch size {w.operations / max(w.batches, 1):.1f}')
+        print(f'speedup: x{results["coalesced"] / results["direct"]:.1f}')
+        os.chdir(REPO_ROOT)
+        del warehouse_app
+
+
+if __name__ == '__main__':
+    main()
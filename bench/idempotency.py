@@ -0,0 +1,96 @@
+"""Цена ключей идемпотентности для сканирования (idempotency.py).
+
+Сканирование через POST /api/box_items без ключа, с новым ключом на каждый
+запрос и повтор с уже использованным ключом (ответ из LRU процесса и из
+таблицы, как в другом воркере). Повторы не должны менять остаток.
+
+    python -m bench.idempotency --scans 2000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from bench import generate  # noqa: E402
+from bench.run import logged_in_client, percentile  # noqa: E402
+
+
+def timed(client, payload, keys):
+    samples = []
+    for key in keys:
+        headers = {'Idempotency-Key': key} if key else {}
+        started = time.perf_counter()
+        response = client.post('/api/box_items', json=payload, headers=headers)
+        samples.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200, response.data
+    return samples
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Scan latency with and without idempotency keys')
+    parser.add_argument('--scans', type=int, default=2000)
+    parser.add_argument('--zones', type=int, default=5)
+    parser.add_argument('--boxes-per-zone', type=int, default=20)
+    parser.add_argument('--items-per-box', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix='warehouse-idempotency-') as workdir:
+        db_path = os.path.join(workdir, 'warehouse.db')
+        os.environ['WAREHOUSE_DB'] = db_path
+        os.chdir(workdir)
+        import app as warehouse_app
+        import database
+        import idempotency
+        warehouse = generate.generate_warehouse(db_path, zones=args.zones, boxes_per_zone=args.boxes_per_zone,
+                                                items_per_box=args.items_per_box, seed=args.seed)
+        box_id = warehouse.box_ids[0]
+        db = database.get_db()
+        barcode = db.execute('''
+            SELECT p.barcode FROM box_items bi JOIN products p ON bi.product_id = p.id WHERE bi.box_id = ? LIMIT 1
+        ''', (box_id,)).fetchone()[0]
+        db.close()
+        payload = {'box_id': box_id, 'product_name': warehouse.names[barcode], 'barcode': barcode, 'quantity': 1}
+        client = logged_in_client(warehouse_app.app)
+
+        def quantity():
+            db = database.get_db()
+            try:
+                return db.execute('''
+                    SELECT bi.quantity FROM box_items bi JOIN products p ON bi.product_id = p.id
+                    WHERE bi.box_id = ? AND p.barcode = ?
+                ''', (box_id, barcode)).fetchone()[0]
+            finally:
+                db.close()
+
+        timed(client, payload, [None] * 100)
+        plain = timed(client, payload, [None] * args.scans)
+        keys = [str(uuid.uuid4()) for _ in range(args.scans)]
+        keyed = timed(client, payload, keys)
+        applied = quantity()
+        cached = timed(client, payload, keys[-min(args.scans, idempotency.CACHE_SIZE):])
+        idempotency._cache = idempotency.ResponseCache()
+        stored = timed(client, payload, keys)
+        replays_applied = quantity() - applied
+        db = database.get_db()
+        table_keys = db.execute('SELECT COUNT(*) FROM idempotency_keys').fetchone()[0]
+        db.close()
+
+    print(f'{args.scans} scans of one item via POST /api/box_items')
+    print()
+    print(f'{"request":<32}{"p50 ms":>9}{"p99 ms":>9}')
+    for label, samples in (('no key', plain), ('new key', keyed),
+                           ('replay, process LRU', cached), ('replay, from table', stored)):
+        print(f'{label:<32}{percentile(samples, 50):>9.2f}{percentile(samples, 99):>9.2f}')
+    print()
+    print(f'replays that changed stock: {replays_applied}; keys in table: {table_keys}')
+
+
+if __name__ == '__main__':
+    main()
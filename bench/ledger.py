@@ -0,0 +1,122 @@
+"""Бенчмарк остатков «на момент T» по журналу движений.
+
+Генерирует журнал заданного размера (по умолчанию 10 млн движений за год),
+строит контрольные точки через ledger.create_checkpoint и сравнивает время
+запроса остатков на случайные моменты: от ближайшей точки против полного
+перебора истории.
+
+    python -m bench.ledger --movements 10000000 --items 20000 --checkpoint-every 100000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+import ledger  # noqa: E402
+
+CHUNK = 1_000_000
+
+
+def generate_movements(db, count, items, boxes, start, span_seconds):
+    """Вставляет count движений с монотонно растущим временем"""
+    inserted = 0
+    while inserted < count:
+        chunk = min(CHUNK, count - inserted)
+        db.execute('''
+            WITH RECURSIVE seq(n) AS (
+                SELECT :offset + 1
+                UNION ALL
+                SELECT n + 1 FROM seq WHERE n < :offset + :chunk
+            ),
+            moves AS MATERIALIZED (
+                SELECT n, abs(random()) % :items + 1 AS item, abs(random()) % 9 - 3 AS delta FROM seq
+            )
+            INSERT INTO stock_movements (item_id, box_id, product_id, delta, created_at)
+            SELECT item, item % :boxes + 1, item,
+                   CASE WHEN delta = 0 THEN 1 ELSE delta END,
+                   datetime(:start, '+' || CAST(n * :span / :count AS INTEGER) || ' seconds')
+            FROM moves
+        ''', {'offset': inserted, 'chunk': chunk, 'items': items, 'boxes': boxes,
+              'start': start, 'span': span_seconds, 'count': count})
+        db.commit()
+        inserted += chunk
+        print(f'  {inserted:>12,} movements', flush=True)
+
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Point-in-time stock over a large movement ledger')
+    parser.add_argument('--movements', type=int, default=10_000_000)
+    parser.add_argument('--items', type=int, default=20_000)
+    parser.add_argument('--boxes', type=int, default=1_000)
+    parser.add_argument('--checkpoint-every', type=int, default=100_000)
+    parser.add_argument('--queries', type=int, default=20)
+    parser.add_argument('--full-replay-queries', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--dir', help='directory for the database')
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    start = datetime(2025, 1, 1)
+    span = timedelta(days=365)
+
+    with tempfile.TemporaryDirectory(prefix='warehouse-ledger-', dir=args.dir) as workdir:
+        db = sqlite3.connect(os.path.join(workdir, 'ledger.db'))
+        db.execute('PRAGMA journal_mode = WAL')
+        db.execute('CREATE TABLE box_items (id INTEGER PRIMARY KEY, box_id INTEGER, product_id INTEGER, quantity INTEGER, created_at TIMESTAMP)')
+        ledger.init_ledger(db)
+
+        print(f'Generating {args.movements:,} movements over {args.items:,} items...')
+        _, gen_ms = timed(generate_movements, db, args.movements, args.items, args.boxes,
+                          start.strftime('%Y-%m-%d %H:%M:%S'), int(span.total_seconds()))
+
+        print(f'Building checkpoints every {args.checkpoint_every:,} movements...')
+        checkpoint_times = []
+        for upto in range(args.checkpoint_every, args.movements + 1, args.checkpoint_every):
+            _, ms = timed(ledger.create_checkpoint, db, upto)
+            db.commit()
+            checkpoint_times.append(ms)
+
+        db.execute('ANALYZE')
+        size_mb = os.path.getsize(os.path.join(workdir, 'ledger.db')) / 1024 / 1024
+
+        moments = [(start + span * rng.random()).strftime('%Y-%m-%d %H:%M:%S') for _ in range(args.queries)]
+        with_cp = []
+        for at in moments:
+            _, ms = timed(ledger.stock_as_of, db, at)
+            with_cp.append(ms)
+
+        full = []
+        for at in moments[:args.full_replay_queries]:
+            rows_cp = sorted(tuple(r[:2]) + (r[4],) for r in ledger.stock_as_of(db, at))
+            rows_full, ms = timed(ledger.stock_as_of, db, at, use_checkpoints=False)
+            full.append(ms)
+            if rows_cp != sorted(tuple(r[:2]) + (r[4],) for r in rows_full):
+                raise SystemExit(f'Checkpoint and full replay disagree at {at}')
+        db.close()
+
+    print()
+    print(f'generation:             {gen_ms / 1000:.1f} s, database {size_mb:.0f} MB')
+    if checkpoint_times:
+        print(f'checkpoint build:       median {statistics.median(checkpoint_times):.1f} ms x {len(checkpoint_times)}')
+    print(f'as-of via checkpoint:   median {statistics.median(with_cp):.1f} ms, max {max(with_cp):.1f} ms ({len(with_cp)} queries)')
+    if full:
+        print(f'as-of via full replay:  median {statistics.median(full):.1f} ms ({len(full)} queries, results identical)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,353 @@
+"""Нагрузочный тест: смесь сканирований, просмотров, импортов и выгрузок.
+
+Запускает (или использует уже запущенный) локальный сервер и гоняет
+конфигурируемую смесь запросов из многих потоков и процессов. Для каждого
+эндпоинта считает пропускную способность, p50/p95/p99 задержки, долю
+ошибок и ошибок блокировки SQLite (``database is locked``).
+
+    python -m bench.load --duration 30 --processes 4 --threads 8 \\
+        --mix scan=60,check=15,view=15,import=3,receipt=2,export=3,collection=2
+    python -m bench.load --url http://127.0.0.1:5000 --db warehouse.db
+"""
+import argparse
+import http.cookiejar
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from datetime import date, datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from bench import generate  # noqa: E402
+from bench.run import percentile  # noqa: E402
+
+DEFAULT_MIX = 'scan=60,check=15,view=15,import=3,receipt=2,export=3,collection=2'
+DEFAULT_SERVER_CMD = [sys.executable, '-c', 'import sys, app; app.app.run(host="127.0.0.1", port=int(sys.argv[1]), threaded=True)', '{port}']
+LOCK_MARKERS = (b'database is locked', b'database table is locked')
+
+
+def read_warehouse_info(db_path):
+    db = sqlite3.connect(db_path)
+    zone_ids = [r[0] for r in db.execute('SELECT id FROM zones')]
+    box_ids = [r[0] for r in db.execute('SELECT id FROM boxes')]
+    names = {}
+    for barcode, name in db.execute('''
+        SELECT barcode, name FROM products
+        WHERE barcode IS NOT NULL AND id IN (SELECT product_id FROM box_items)
+    '''):
+        names[barcode] = name
+    db.close()
+    if not box_ids or not names:
+        raise SystemExit(f'{db_path} has no boxes or barcoded items to load-test against')
+    return generate.Warehouse(zone_ids, box_ids, list(names), names)
+
+
+def multipart(fields, file_field, filename, payload):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for key, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{key}"\r\n\r\n{value}\r\n'.encode())
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+        'Content-Type: application/vnd.openxmlformats-officedocument.spreadsheetml.sheet\r\n\r\n'.encode()
+    )
+    parts.append(payload)
+    parts.append(f'\r\n--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class Client:
+    """HTTP-клиент со своей сессией (cookie) на поток"""
+
+    def __init__(self, base_url, username, password, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+        body = urllib.parse.urlencode({'username': username, 'password': password}).encode()
+        self.opener.open(self.base_url + '/login', body, timeout=timeout).read()
+
+    def request(self, method, path, body=None, content_type=None):
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        if content_type:
+            req.add_header('Content-Type', content_type)
+        try:
+            with self.opener.open(req, timeout=self.timeout) as resp:
+                return resp.status, resp.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+        except (urllib.error.URLError, socket.timeout, ConnectionError) as e:
+            return 0, str(e).encode()
+
+
+class Operations:
+    """Генераторы запросов для каждого вида нагрузки"""
+
+    def __init__(self, info, files, rng):
+        self.info = info
+        self.files = files
+        self.rng = rng
+
+    def scan(self, client):
+        barcode = self.rng.choice(self.info.barcodes)
+        body = json.dumps({
+            'box_id': self.rng.choice(self.info.box_ids),
+            'product_name': self.info.names[barcode],
+            'barcode': barcode,
+            'quantity': 1,
+        }).encode()
+        return 'POST /api/box_items', client.request('POST', '/api/box_items', body, 'application/json')
+
+    def check(self, client):
+        query = urllib.parse.urlencode({'box_id': self.rng.choice(self.info.box_ids),
+                                        'barcode': self.rng.choice(self.info.barcodes)})
+        return 'GET /api/check_product', client.request('GET', '/api/check_product?' + query)
+
+    def view(self, client):
+        roll = self.rng.random()
+        if roll < 0.6:
+            return 'GET /box/<id>', client.request('GET', f'/box/{self.rng.choice(self.info.box_ids)}')
+        if roll < 0.9:
+            return 'GET /zone/<id>', client.request('GET', f'/zone/{self.rng.choice(self.info.zone_ids)}')
+        return 'GET /', client.request('GET', '/')
+
+    def import_(self, client):
+        body, content_type = multipart({'import_mode': 'add'}, 'file', 'items.xlsx', self.files['items'])
+        return 'POST /api/import_items_excel', client.request('POST', '/api/import_items_excel', body, content_type)
+
+    def receipt(self, client):
+        body, content_type = multipart({'receipt_date': date.today().isoformat(), 'description': 'load'},
+                                       'file', 'receipt.xlsx', self.files['items'])
+        return 'POST /api/receipts/import_excel', client.request('POST', '/api/receipts/import_excel', body, content_type)
+
+    def export(self, client):
+        if self.rng.random() < 0.5:
+            return 'GET /api/export_excel_all', client.request('GET', '/api/export_excel_all')
+        query = urllib.parse.urlencode({'start_date': '2000-01-01', 'end_date': date.today().isoformat()})
+        return 'GET /api/export_items_by_date', client.request('GET', '/api/export_items_by_date?' + query)
+
+    def collection(self, client):
+        body, content_type = multipart({}, 'file', 'order.xlsx', self.files['order'])
+        endpoint = 'POST /api/process_collection+confirm'
+        status, payload = client.request('POST', '/api/process_collection', body, content_type)
+        if status != 200:
+            return endpoint, (status, payload)
+        plan = json.loads(payload).get('collection_plan', [])
+        confirm = json.dumps({'collection_plan': plan}).encode()
+        return endpoint, client.request('POST', '/api/confirm_collection', confirm, 'application/json')
+
+
+def parse_mix(spec):
+    mix = {}
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if not hasattr(Operations, name if name != 'import' else 'import_'):
+            raise SystemExit(f'Unknown operation in mix: {name}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def run_worker_process(args, info, files, seed, deadline):
+    """Процесс нагрузки: несколько потоков, каждый со своей сессией"""
+    samples = []
+    lock = threading.Lock()
+    mix = parse_mix(args.mix)
+    names = list(mix)
+    weights = [mix[n] for n in names]
+
+    def thread_main(thread_seed):
+        rng = random.Random(thread_seed)
+        ops = Operations(info, files, rng)
+        client = Client(args.url, args.username, args.password, args.timeout)
+        local = []
+        while time.time() < deadline:
+            name = rng.choices(names, weights)[0]
+            op = getattr(ops, 'import_' if name == 'import' else name)
+            started = time.perf_counter()
+            endpoint, (status, body) = op(client)
+            elapsed = (time.perf_counter() - started) * 1000
+            locked = any(marker in body for marker in LOCK_MARKERS)
+            local.append((endpoint, elapsed, status, locked))
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=thread_main, args=(seed * 1000 + i,)) for i in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples
+
+
+def _process_entry(params):
+    return run_worker_process(*params)
+
+
+def aggregate(samples, duration):
+    per_endpoint = {}
+    for endpoint, elapsed, status, locked in samples:
+        per_endpoint.setdefault(endpoint, []).append((elapsed, status, locked))
+
+    report = {}
+    for endpoint, rows in sorted(per_endpoint.items()):
+        latencies = [r[0] for r in rows]
+        errors = sum(1 for r in rows if r[1] != 200)
+        locks = sum(1 for r in rows if r[2])
+        report[endpoint] = {
+            'requests': len(rows),
+            'throughput_rps': round(len(rows) / duration, 2),
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+            'error_rate': round(errors / len(rows), 4),
+            'lock_error_rate': round(locks / len(rows), 4),
+        }
+    total = len(samples)
+    report['TOTAL'] = {
+        'requests': total,
+        'throughput_rps': round(total / duration, 2),
+        'error_rate': round(sum(1 for s in samples if s[2] != 200) / total, 4) if total else 0,
+        'lock_error_rate': round(sum(1 for s in samples if s[3]) / total, 4) if total else 0,
+    }
+    return report
+
+
+def print_report(report):
+    print(f"{'endpoint':<36}{'req':>8}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'err%':>8}{'lock%':>8}")
+    for endpoint, row in report.items():
+        if endpoint == 'TOTAL':
+            continue
+        print(f"{endpoint:<36}{row['requests']:>8}{row['throughput_rps']:>9.1f}{row['p50_ms']:>9.1f}"
+              f"{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['error_rate'] * 100:>8.2f}{row['lock_error_rate'] * 100:>8.2f}")
+    total = report['TOTAL']
+    print(f"{'TOTAL':<36}{total['requests']:>8}{total['throughput_rps']:>9.1f}{'':>27}"
+          f"{total['error_rate'] * 100:>8.2f}{total['lock_error_rate'] * 100:>8.2f}")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_server(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url + '/login', timeout=1).read()
+            return
+        except (urllib.error.URLError, ConnectionError, socket.timeout):
+            time.sleep(0.2)
+    raise SystemExit(f'Server at {url} did not start in {timeout}s')
+
+
+def start_server(args, workdir):
+    """Поднимает сервер на синтетической базе во временном каталоге"""
+    db_path = os.path.join(workdir, 'warehouse.db')
+    port = free_port()
+    env = dict(os.environ, WAREHOUSE_DB=db_path, PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    # Создаём схему тем же init_db, что и приложение
+    subprocess.run([sys.executable, '-c', 'import database; database.init_db()'], env=env, cwd=workdir, check=True)
+    generate.generate_warehouse(db_path, zones=args.zones, boxes_per_zone=args.boxes_per_zone,
+                                items_per_box=args.items_per_box, duplicate_rate=args.duplicate_rate, seed=args.seed)
+    command = [part.format(port=port, repo=REPO_ROOT) for part in (args.server_cmd or DEFAULT_SERVER_CMD)]
+    server = subprocess.Popen(command, env=env, cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}'
+    wait_for_server(url)
+    return server, url, db_path
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Concurrent load test for the warehouse app')
+    parser.add_argument('--url', help='existing server; by default a local server is started on a synthetic DB')
+    parser.add_argument('--db', help='database of the existing server, used to pick box ids and barcodes')
+    parser.add_argument('--server-cmd', nargs=argparse.REMAINDER,
+                        help='command starting the server; {port} and {repo} are substituted (must be last)')
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='76543210')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='operation=weight list')
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=8, help='threads per process')
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--zones', type=int, default=10)
+    parser.add_argument('--boxes-per-zone', type=int, default=20)
+    parser.add_argument('--items-per-box', type=int, default=50)
+    parser.add_argument('--duplicate-rate', type=float, default=0.1)
+    parser.add_argument('--import-rows', type=int, default=500)
+    parser.add_argument('--order-lines', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write the JSON report here')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    parse_mix(args.mix)
+
+    server = None
+    workdir = tempfile.mkdtemp(prefix='warehouse-load-')
+    try:
+        if args.url:
+            if not args.db:
+                raise SystemExit('--db is required together with --url')
+            db_path = args.db
+        else:
+            server, args.url, db_path = start_server(args, workdir)
+        info = read_warehouse_info(db_path)
+        files = {
+            'items': generate.generate_items_xlsx(info, rows=args.import_rows, seed=args.seed).getvalue(),
+            'order': generate.generate_order_xlsx(info, lines=args.order_lines, seed=args.seed).getvalue(),
+        }
+
+        print(f'Load: {args.processes} process(es) x {args.threads} thread(s) for {args.duration:.0f}s against {args.url}')
+        started = time.time()
+        deadline = started + args.duration
+        if args.processes > 1:
+            params = [(args, info, files, seed, deadline) for seed in range(args.processes)]
+            with multiprocessing.Pool(args.processes) as pool:
+                samples = [s for chunk in pool.map(_process_entry, params) for s in chunk]
+        else:
+            samples = run_worker_process(args, info, files, 0, deadline)
+        duration = time.time() - started
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = aggregate(samples, duration)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'meta': {
+                    'created_at': datetime.now().isoformat(timespec='seconds'),
+                    'url': args.url,
+                    'mix': args.mix,
+                    'processes': args.processes,
+                    'threads': args.threads,
+                    'duration_s': round(duration, 2),
+                },
+                'endpoints': report,
+            }, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
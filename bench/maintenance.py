@@ -0,0 +1,163 @@
+"""Обслуживание базы: частичный индекс, очистка нулевых позиций, vacuum, резервная копия.
+
+Строит склад, в котором большая доля позиций обнулена (как после многих
+сборок), и замеряет горячие запросы без частичного индекса
+``idx_box_items_in_stock``, с ним и после очистки нулевых строк. Очистка
+идёт через писателя, параллельно поток «сканирований» замеряет задержку
+своих записей. Затем — освобождение места incremental vacuum и онлайн-копия.
+
+    python -m bench.maintenance --zones 20 --boxes-per-zone 50 --items-per-box 200 --zero-share 0.6
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from bench import generate  # noqa: E402
+from bench.run import percentile  # noqa: E402
+
+BOX_VIEW = '''
+    SELECT bi.*, p.name as product_name, p.barcode
+    FROM box_items bi JOIN products p ON bi.product_id = p.id
+    WHERE bi.box_id = ? ORDER BY p.name
+'''
+
+
+def hot_queries(db_path, box_ids, repeat):
+    """Медианы горячих запросов, мс"""
+    import collection
+    import search
+    db = sqlite3.connect(db_path)
+    db.row_factory = sqlite3.Row
+    timings = {}
+
+    def measure(name, fn):
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - started) * 1000)
+        timings[name] = statistics.median(samples)
+
+    measure('search "Футболка"', lambda: search.search(db, 'Футболка', source='boxes'))
+    measure('collection stock', lambda: db.execute(collection.STOCK_QUERY).fetchall())
+    measure('box view x50', lambda: [db.execute(BOX_VIEW, (box_id,)).fetchall() for box_id in box_ids[:50]])
+    db.close()
+    return timings
+
+
+def file_size(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.close()
+    return os.path.getsize(db_path)
+
+
+def scan_load(db_path, item_ids, stop, latencies):
+    """Сканирования через того же писателя, что и очистка"""
+    import writer
+    rng = random.Random(1)
+    coalescer = writer.get_writer(db_path)
+
+    def scan(conn, item_id):
+        conn.execute('UPDATE box_items SET quantity = quantity + 1 WHERE id = ? AND quantity > 0', (item_id,))
+
+    while not stop.is_set():
+        started = time.perf_counter()
+        coalescer.submit(scan, rng.choice(item_ids))
+        latencies.append((time.perf_counter() - started) * 1000)
+        time.sleep(0.002)
+
+
+def with_scans(db_path, item_ids, fn):
+    stop = threading.Event()
+    latencies = []
+    thread = threading.Thread(target=scan_load, args=(db_path, item_ids, stop, latencies))
+    thread.start()
+    started = time.perf_counter()
+    try:
+        result = fn()
+    finally:
+        elapsed = time.perf_counter() - started
+        stop.set()
+        thread.join()
+    return result, elapsed, latencies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Maintenance: partial index, zero-row purge, vacuum, backup')
+    parser.add_argument('--zones', type=int, default=20)
+    parser.add_argument('--boxes-per-zone', type=int, default=50)
+    parser.add_argument('--items-per-box', type=int, default=200)
+    parser.add_argument('--zero-share', type=float, default=0.6, help='share of box items with quantity 0')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix='warehouse-maintenance-') as workdir:
+        db_path = os.path.join(workdir, 'warehouse.db')
+        os.environ['WAREHOUSE_DB'] = db_path
+        os.environ.setdefault('WAREHOUSE_BACKUP_DIR', os.path.join(workdir, 'backups'))
+        import database
+        import maintenance
+        database.init_db()
+        warehouse = generate.generate_warehouse(db_path, zones=args.zones, boxes_per_zone=args.boxes_per_zone,
+                                                items_per_box=args.items_per_box, seed=args.seed)
+        db = sqlite3.connect(db_path)
+        rng = random.Random(args.seed)
+        item_ids = [row[0] for row in db.execute('SELECT id FROM box_items')]
+        zeroed = rng.sample(item_ids, int(len(item_ids) * args.zero_share))
+        db.executemany('UPDATE box_items SET quantity = 0 WHERE id = ?', ((i,) for i in zeroed))
+        db.commit()
+        in_stock = sorted(set(item_ids) - set(zeroed))
+        print(f'{len(item_ids):,} box items, {len(zeroed):,} of them at quantity 0')
+
+        db.execute('DROP INDEX idx_box_items_in_stock')
+        db.commit()
+        without_index = hot_queries(db_path, warehouse.box_ids, args.repeat)
+        database.init_db()
+        with_index = hot_queries(db_path, warehouse.box_ids, args.repeat)
+        size_before = file_size(db_path)
+
+        _, _, idle = with_scans(db_path, in_stock, lambda: time.sleep(2))
+        purged, purge_s, during = with_scans(db_path, in_stock, lambda: maintenance.purge_zero_rows(db_path, grace_hours=0))
+        after_purge = hot_queries(db_path, warehouse.box_ids, args.repeat)
+        size_purged = file_size(db_path)
+        vacuumed, vacuum_s, during_vacuum = with_scans(db_path, in_stock, lambda: maintenance.incremental_vacuum(db_path))
+        size_vacuumed = file_size(db_path)
+        started = time.perf_counter()
+        backup = maintenance.backup(db_path)
+        backup_s = time.perf_counter() - started
+        db.close()
+
+    print()
+    print(f'{"hot query, ms (median)":<26}{"no index":>10}{"partial":>10}{"purged":>10}')
+    for name in without_index:
+        print(f'{name:<26}{without_index[name]:>10.1f}{with_index[name]:>10.1f}{after_purge[name]:>10.1f}')
+
+    print()
+    print(f'purge: {purged["deleted_rows"]:,} rows deleted in {purge_s * 1000:.0f} ms')
+    print(f'incremental vacuum: {vacuumed.get("released_pages", 0):,} pages released in {vacuum_s * 1000:.0f} ms')
+    print(f'backup: {backup["bytes"] / 1024 / 1024:.1f} MB in {backup_s * 1000:.0f} ms')
+    mb = 1024 * 1024
+    print(f'database file: {size_before / mb:.1f} MB -> {size_purged / mb:.1f} MB after purge '
+          f'-> {size_vacuumed / mb:.1f} MB after incremental vacuum')
+    print()
+    print(f'{"scan commits via writer":<26}{"count":>8}{"p50 ms":>9}{"p99 ms":>9}{"max ms":>9}')
+    for name, samples in (('idle', idle), ('during purge', during), ('during vacuum', during_vacuum)):
+        if samples:
+            print(f'{name:<26}{len(samples):>8}{percentile(samples, 50):>9.2f}'
+                  f'{percentile(samples, 99):>9.2f}{max(samples):>9.2f}')
+
+
+if __name__ == '__main__':
+    main()
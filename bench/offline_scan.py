@@ -0,0 +1,152 @@
+"""Сканирование на станции с локальным справочником и очередью (catalog.py).
+
+Задержка одного сканирования для оператора на медленной сети, прежний
+путь против нового:
+
+- прежний: GET /api/check_product (название по штрих-коду), затем
+  POST /api/box_items — два обмена с сервером на каждое сканирование;
+- новый: название из копии справочника в IndexedDB, сканирование в
+  очередь браузера — ни одного обмена; очередь уходит в фоне пачкой
+  POST /api/box_items/bulk.
+
+Сети в песочнице нет, поэтому профиль сети — модель: время обмена =
+время сервера (замер через тестовый клиент Flask) + RTT + байты по
+проводу (ответ в gzip, как его отдаёт compression.py) / пропускная
+способность. Профили — параметры пресетов троттлинга Chrome DevTools.
+Время чтения IndexedDB в браузере здесь не замеряется.
+
+    python -m bench.offline_scan --scans 500 --profile fast-3g
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from bench import generate  # noqa: E402
+from bench.run import logged_in_client, percentile  # noqa: E402
+
+# RTT, мс; приём и отдача, кбит/с
+PROFILES = {
+    'slow-3g': (2000, 400, 400),
+    'fast-3g': (562.5, 1440, 675),
+    '4g': (170, 9000, 1500),
+}
+HEADERS_BYTES = 400
+
+
+class ThrottledClient:
+    """Тестовый клиент Flask с моделью медленной сети поверх замеренного времени сервера.
+
+    request -> (JSON ответа, время с сетью в мс, байты ответа по проводу)
+    """
+
+    def __init__(self, client, profile):
+        self.client = client
+        self.rtt, self.down, self.up = PROFILES[profile]
+
+    def request(self, method, url, **kwargs):
+        body = json.dumps(kwargs['json']).encode() if 'json' in kwargs else b''
+        started = time.perf_counter()
+        response = self.client.open(url, method=method, headers={'Accept-Encoding': 'gzip'}, **kwargs)
+        server_ms = (time.perf_counter() - started) * 1000
+        wire = len(response.data)
+        network_ms = (self.rtt + (len(body) + HEADERS_BYTES) * 8 / self.up
+                      + (wire + HEADERS_BYTES) * 8 / self.down)
+        assert response.status_code == 200, (url, response.status_code)
+        data = gzip.decompress(response.data) if response.headers.get('Content-Encoding') == 'gzip' else response.data
+        return json.loads(data), server_ms + network_ms, wire
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Per-scan latency on a throttled network: round trips vs local cache')
+    parser.add_argument('--scans', type=int, default=500)
+    parser.add_argument('--profile', choices=PROFILES, default='fast-3g')
+    parser.add_argument('--batch', type=int, default=500, help='queued scans per bulk request')
+    parser.add_argument('--zones', type=int, default=10)
+    parser.add_argument('--boxes-per-zone', type=int, default=50)
+    parser.add_argument('--items-per-box', type=int, default=100)
+    parser.add_argument('--changes', type=int, default=100, help='renamed products before the delta sync')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory(prefix='warehouse-offline-') as workdir:
+        db_path = os.path.join(workdir, 'warehouse.db')
+        os.environ['WAREHOUSE_DB'] = db_path
+        os.chdir(workdir)
+        import app as warehouse_app
+        import database
+        warehouse = generate.generate_warehouse(db_path, zones=args.zones, boxes_per_zone=args.boxes_per_zone,
+                                                items_per_box=args.items_per_box, seed=args.seed)
+        client = ThrottledClient(logged_in_client(warehouse_app.app), args.profile)
+        box_id = warehouse.box_ids[0]
+        barcodes = list(warehouse.names)
+        scans = [{'box_id': box_id, 'barcode': barcode, 'product_name': warehouse.names[barcode], 'quantity': 1}
+                 for barcode in (rng.choice(barcodes) for _ in range(args.scans))]
+
+        # Прежний путь: название с сервера, затем добавление — оператор ждёт оба обмена
+        lookups, saves, per_scan = [], [], []
+        for scan in scans:
+            _, lookup_ms, _ = client.request('GET', f'/api/check_product?box_id={box_id}&barcode={scan["barcode"]}')
+            _, save_ms, _ = client.request('POST', '/api/box_items', json=scan)
+            lookups.append(lookup_ms)
+            saves.append(save_ms)
+            per_scan.append(lookup_ms + save_ms)
+
+        # Новый путь: первая выгрузка справочника, догоняющая после изменений, пачки очереди
+        # Первая выгрузка — страницами, как их забирает script.js
+        catalogue, seq, pages, full_ms, full_bytes = [], 0, 0, 0, 0
+        while True:
+            page, page_ms, page_bytes = client.request('GET', f'/api/catalog?since={seq}')
+            catalogue += page['items']
+            seq, pages, full_ms, full_bytes = page['seq'], pages + 1, full_ms + page_ms, full_bytes + page_bytes
+            if not page['more']:
+                break
+        products = len(catalogue)
+        db = database.get_db()
+        for product_id in rng.sample([item[0] for item in catalogue], args.changes):
+            db.execute('UPDATE products SET name = name || ? WHERE id = ?', (' (new)', product_id))
+        db.commit()
+        db.close()
+        delta, delta_ms, delta_bytes = client.request('GET', f'/api/catalog?since={seq}')
+
+        queued = [dict(scan, key=uuid.uuid4().hex) for scan in scans]
+        bulk_ms, bulk_server_ms = [], []
+        for offset in range(0, len(queued), args.batch):
+            batch = queued[offset:offset + args.batch]
+            started = time.perf_counter()
+            response, total_ms, _ = client.request('POST', '/api/box_items/bulk', json={'scans': batch})
+            bulk_server_ms.append((time.perf_counter() - started) * 1000)
+            bulk_ms.append(total_ms)
+            assert len(response['applied']) == len(batch)
+        # Пачка отправлена повторно (ответ потерялся): ничего не применяется заново
+        replay, _, _ = client.request('POST', '/api/box_items/bulk', json={'scans': queued[:args.batch]})
+
+    rtt, down, up = PROFILES[args.profile]
+    print(f'profile {args.profile}: RTT {rtt} ms, {down} kbit/s down, {up} kbit/s up (modelled); {args.scans} scans')
+    print()
+    print(f'round trip per scan:  lookup p50 {percentile(lookups, 50):.0f} ms, add p50 {percentile(saves, 50):.0f} ms '
+          f'-> operator waits p50 {percentile(per_scan, 50):.0f} ms, p99 {percentile(per_scan, 99):.0f} ms per scan, '
+          f'{sum(per_scan) / 1000:.0f} s for all')
+    print('local cache + queue:  0 round trips per scan (IndexedDB read and write, not measured here)')
+    print()
+    print(f'catalogue, full:      {products:,} products, {full_bytes / 1024:.0f} KB gzip in {pages} request(s), '
+          f'{full_ms / 1000:.1f} s once')
+    print(f'catalogue, delta:     {len(delta["items"])} changed products, {delta_bytes / 1024:.1f} KB, '
+          f'{delta_ms:.0f} ms')
+    print(f'bulk sync:            {len(bulk_ms)} request(s) of up to {args.batch} scans, '
+          f'{sum(bulk_ms) / 1000:.1f} s in the background (server {sum(bulk_server_ms):.0f} ms)')
+    print(f'bulk resend:          {len(replay["applied"])} applied, {len(replay["duplicates"])} duplicates')
+
+
+if __name__ == '__main__':
+    main()
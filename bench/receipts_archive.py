@@ -0,0 +1,151 @@
+"""Архив старых приёмок (archive.py): страница приёмок и размер рабочей базы.
+
+Два года приёмок (по умолчанию 20 в день по 40 строк). Замеряется
+страница ``/receipts`` до архива — прежний вариант со всеми приёмками
+сразу и постраничный, — и после переноса: первая и дальняя страница по
+рабочей базе, выборка за диапазон, уходящий в архив (UNION ALL),
+и статистика. Размер рабочей базы — до переноса и после него
+и incremental_vacuum, как их выполняет обслуживание.
+
+    python -m bench.receipts_archive --days 730 --per-day 20 --lines 40
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from bench import generate  # noqa: E402
+from bench.run import logged_in_client, percentile  # noqa: E402
+
+
+def fill_receipts(db, days, per_day, lines, rng):
+    product_ids = [row[0] for row in db.execute('SELECT id FROM products')]
+    today = date.today()
+    receipt_id = item_id = 0
+    receipts, items = [], []
+    for back in range(days, -1, -1):
+        day = (today - timedelta(days=back)).isoformat()
+        for n in range(per_day):
+            receipt_id += 1
+            created = f'{day} {8 + n % 10:02d}:{rng.randrange(60):02d}:00'
+            quantities = [rng.randint(1, 50) for _ in range(lines)]
+            receipts.append((receipt_id, f'REC-{day.replace("-", "")}-{receipt_id:08X}', day,
+                             sum(quantities), lines, f'Поставка {receipt_id}', created))
+            for quantity in quantities:
+                item_id += 1
+                items.append((item_id, receipt_id, rng.choice(product_ids), quantity,
+                              f'Коробка {rng.randrange(100)}', f'Зона {rng.randrange(5)}', created))
+    db.executemany('''
+        INSERT INTO receipts (id, receipt_number, receipt_date, total_quantity, total_products, description, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', receipts)
+    db.executemany('''
+        INSERT INTO receipt_items (id, receipt_id, product_id, quantity, box_name, zone_name, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', items)
+    db.commit()
+    return len(receipts), len(items)
+
+
+def timed(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return percentile(samples, 50)
+
+
+def get_page(client, url):
+    def run():
+        response = client.get(url)
+        assert response.status_code == 200, response.status_code
+    return run
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Receipts archive: page latency and live DB size')
+    parser.add_argument('--days', type=int, default=730, help='days of receipt history')
+    parser.add_argument('--per-day', type=int, default=20, help='receipts per day')
+    parser.add_argument('--lines', type=int, default=40, help='lines per receipt')
+    parser.add_argument('--archive-days', type=int, default=90, help='receipts older than this are archived')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix='warehouse-archive-') as workdir:
+        db_path = os.path.join(workdir, 'warehouse.db')
+        os.environ['WAREHOUSE_DB'] = db_path
+        os.chdir(workdir)
+        import app as warehouse_app
+        import archive
+        import database
+        import maintenance
+        from flask import render_template
+        generate.generate_warehouse(db_path, zones=2, boxes_per_zone=50, items_per_box=50, seed=args.seed)
+        db = database.get_db()
+        receipts, lines = fill_receipts(db, args.days, args.per_day, args.lines, random.Random(args.seed))
+        client = logged_in_client(warehouse_app.app)
+
+        def render_everything():
+            # Прежняя страница: все приёмки одним запросом и одним списком
+            rows = db.execute('SELECT * FROM receipts ORDER BY receipt_date DESC, created_at DESC').fetchall()
+            with warehouse_app.app.test_request_context('/receipts'):
+                render_template('receipts.html', receipts=rows, page=1, pages=1, total=len(rows),
+                                archive_included=False, archived_before=None)
+
+        size_before = maintenance.database_size(db_path)['db_bytes']
+        everything_ms = timed(render_everything, max(args.repeat // 4, 3))
+        paged_before_ms = timed(get_page(client, '/receipts'), args.repeat)
+        stats_before_ms = timed(get_page(client, '/api/receipts/stats'), args.repeat)
+
+        started = time.perf_counter()
+        moved = archive.move(db_path, args.archive_days)
+        move_s = time.perf_counter() - started
+        maintenance.incremental_vacuum(db_path)
+        size_after = maintenance.database_size(db_path)['db_bytes']
+        archive_bytes = os.path.getsize(archive.archive_path(db_path))
+
+        last_page = archive.list_receipts(db)['pages']
+        reach_back = (date.today() - timedelta(days=args.archive_days + 30)).isoformat()
+        year_ago = (date.today() - timedelta(days=365)).isoformat()
+        results = {
+            'first page, live only': timed(get_page(client, '/receipts'), args.repeat),
+            f'last page ({last_page}), live only': timed(get_page(client, f'/receipts?page={last_page}'), args.repeat),
+            f'from {reach_back}, first page (+archive)':
+                timed(get_page(client, f'/receipts?date_from={reach_back}'), args.repeat),
+            f'from {year_ago} to {reach_back}, page 5 (+archive)':
+                timed(get_page(client, f'/receipts?date_from={year_ago}&date_to={reach_back}&page=5'), args.repeat),
+            'stats, live only': timed(get_page(client, '/api/receipts/stats'), args.repeat),
+            'stats, all time (+archive)': timed(get_page(client, '/api/receipts/stats?date_from=2000-01-01'), args.repeat),
+        }
+        total_after = client.get('/api/receipts/stats?date_from=2000-01-01').get_json()['stats']['total_receipts']
+        archived_id = db.execute('SELECT MIN(id) FROM receipts').fetchone()[0] - 1
+        detail_ms = timed(get_page(client, f'/receipt/{archived_id}'), args.repeat)
+        db.close()
+
+    mb = 1024 * 1024
+    print(f'{args.days} days of receipts: {receipts:,} receipts, {lines:,} lines; archive after {args.archive_days} days')
+    print()
+    print(f'before: /receipts with every receipt {everything_ms:.0f} ms, paginated {paged_before_ms:.1f} ms, '
+          f'stats {stats_before_ms:.1f} ms; live DB {size_before / mb:.1f} MB')
+    print(f'archive_receipts: {moved["archived_receipts"]:,} receipts, {moved["archived_items"]:,} lines '
+          f'in {move_s:.1f} s; live DB {size_after / mb:.1f} MB after incremental_vacuum, '
+          f'archive {archive_bytes / mb:.1f} MB')
+    print()
+    for name, ms in results.items():
+        print(f'{name:<50} {ms:7.1f} ms')
+    print(f'{"archived receipt detail":<50} {detail_ms:7.1f} ms')
+    print()
+    print(f'receipts across live + archive after the move: {total_after:,} (expected {receipts:,})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""Отчёт о пополнении: предрассчитанные остатки против пересчёта (replenishment.py).
+
+Замеряется цена поддержки ``product_stock`` для каждого изменения
+остатка — фиксация одиночного сканирования через писателя с триггерами
+и без них (поочерёдно) — и время отчёта: из ``product_stock`` и дневного
+расхода против пересчёта по всем ``box_items`` и истории движений
+``stock_movements`` за тот же период.
+
+    python -m bench.replenishment --thresholds 5000 --history 500000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from bench import generate  # noqa: E402
+
+# Тот же отчёт без предрассчитанных таблиц
+RECOMPUTE_QUERY = '''
+    SELECT p.barcode, p.name AS product_name, p.article,
+           COALESCE(s.stock, 0) AS stock, t.min_quantity, COALESCE(o.outflow, 0) AS outflow,
+           MAX(t.min_quantity - COALESCE(s.stock, 0), 0) AS shortfall
+    FROM stock_thresholds t
+    JOIN products p ON p.id = t.product_id
+    LEFT JOIN (SELECT product_id, SUM(quantity) AS stock FROM box_items GROUP BY product_id) s
+        ON s.product_id = t.product_id
+    LEFT JOIN (
+        SELECT product_id, -SUM(delta) AS outflow FROM stock_movements
+        WHERE delta < 0 AND created_at >= DATETIME('now', :since) GROUP BY product_id
+    ) o ON o.product_id = t.product_id
+    WHERE :all OR COALESCE(s.stock, 0) < t.min_quantity
+    ORDER BY shortfall DESC, outflow DESC, p.name
+'''
+
+STOCK_TRIGGERS = ('trg_box_items_stock_insert', 'trg_box_items_stock_update', 'trg_box_items_stock_delete')
+
+
+def writer_cost(db_path, item_ids, count, rng):
+    """Медиана фиксации одиночного изменения остатка через писателя, мс"""
+    import writer
+    coalescer = writer.get_writer(db_path)
+
+    def scan(conn, item_id, delta):
+        conn.execute('UPDATE box_items SET quantity = MAX(quantity + ?, 0) WHERE id = ?', (delta, item_id))
+
+    samples = []
+    for _ in range(count):
+        started = time.perf_counter()
+        coalescer.submit(scan, rng.choice(item_ids), rng.choice((-1, 1)))
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def timed(func, repeat=5):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return result, statistics.median(samples)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replenishment report: precomputed table vs recompute')
+    parser.add_argument('--zones', type=int, default=10)
+    parser.add_argument('--boxes-per-zone', type=int, default=50)
+    parser.add_argument('--items-per-box', type=int, default=200)
+    parser.add_argument('--thresholds', type=int, default=5000, help='products with a minimum stock')
+    parser.add_argument('--history', type=int, default=500_000, help='collection movements in the period')
+    parser.add_argument('--changes', type=int, default=1000, help='stock changes per trigger cost sample')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory(prefix='warehouse-replenishment-') as workdir:
+        db_path = os.path.join(workdir, 'warehouse.db')
+        os.environ['WAREHOUSE_DB'] = db_path
+        import database
+        import replenishment
+        database.init_db()
+        generate.generate_warehouse(db_path, zones=args.zones, boxes_per_zone=args.boxes_per_zone,
+                                    items_per_box=args.items_per_box, seed=args.seed)
+        db = database.get_db()
+        items = db.execute('SELECT id, box_id, product_id FROM box_items').fetchall()
+        item_ids = [item['id'] for item in items]
+        product_ids = sorted({item['product_id'] for item in items})
+        barcodes = [row[0] for row in db.execute('SELECT barcode FROM products WHERE barcode IS NOT NULL')]
+
+        # Пороги и история сборок за период: движения в журнале и дневной расход
+        thresholds = [{'barcode': barcode, 'min_quantity': rng.randint(50, 400)}
+                      for barcode in rng.sample(barcodes, min(args.thresholds, len(barcodes)))]
+        replenishment.set_thresholds(db, thresholds)
+        movements = [(item['id'], item['box_id'], item['product_id'], -rng.randint(1, 5), f'-{rng.randrange(30)} days')
+                     for item in (rng.choice(items) for _ in range(args.history))]
+        db.executemany('''
+            INSERT INTO stock_movements (item_id, box_id, product_id, delta, created_at)
+            VALUES (?, ?, ?, ?, DATETIME('now', ?))
+        ''', movements)
+        db.execute('''
+            INSERT INTO collection_outflow (product_id, day, quantity)
+            SELECT product_id, DATE(created_at), -SUM(delta) FROM stock_movements WHERE delta < 0
+            GROUP BY product_id, DATE(created_at)
+        ''')
+        db.commit()
+
+        # Цена триггеров product_stock — поочерёдно с ними и без них
+        with_triggers, without_triggers = [], []
+        for _ in range(3):
+            with_triggers.append(writer_cost(db_path, item_ids, args.changes, rng))
+            for name in STOCK_TRIGGERS:
+                db.execute(f'DROP TRIGGER {name}')
+            db.commit()
+            without_triggers.append(writer_cost(db_path, item_ids, args.changes, rng))
+            replenishment.init_replenishment(db)
+            replenishment.rebuild(db)
+            db.commit()
+        with_triggers, without_triggers = statistics.median(with_triggers), statistics.median(without_triggers)
+
+        params = {'since': f'-{replenishment.OUTFLOW_DAYS} days', 'all': True}
+        precomputed, precomputed_ms = timed(lambda: replenishment.report(db, include_all=True))
+        recomputed, recompute_ms = timed(lambda: db.execute(RECOMPUTE_QUERY, params).fetchall())
+        _, rebuild_ms = timed(lambda: replenishment.rebuild(db), repeat=3)
+        db.commit()
+        mismatched = db.execute('''
+            SELECT COUNT(*) FROM (SELECT product_id, SUM(quantity) AS quantity FROM box_items GROUP BY product_id) b
+            LEFT JOIN product_stock ps USING (product_id) WHERE ps.quantity IS NOT b.quantity
+        ''').fetchone()[0]
+        positions = len(item_ids)
+        db.close()
+
+    print(f'{positions:,} positions, {len(product_ids):,} products, {len(thresholds):,} thresholds, '
+          f'{args.history:,} collection movements in the last {replenishment.OUTFLOW_DAYS} days')
+    print()
+    print(f'stock change via writer: {without_triggers:.3f} ms without product_stock triggers, '
+          f'{with_triggers:.3f} ms with them (median of {args.changes} x 3), '
+          f'+{with_triggers - without_triggers:.3f} ms per change')
+    print(f'report, all thresholds:  {precomputed_ms:.1f} ms from product_stock + daily outflow '
+          f'({len(precomputed)} rows), {recompute_ms:.1f} ms recomputed from box_items + stock_movements '
+          f'({len(recomputed)} rows)')
+    print(f'full rebuild of product_stock: {rebuild_ms:.0f} ms; products out of sync after the run: {mismatched}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+"""Воспроизводимый бенчмарк горячих путей приложения.
+
+Создаёт синтетический склад во временном каталоге, прогоняет реальное
+Flask-приложение через тестовый клиент и сохраняет результаты в JSON.
+При наличии базовой линии печатает сравнение и отмечает регрессии.
+
+    python -m bench.run --output bench/results.json --baseline bench/baseline.json
+    python -m bench.run --save-baseline bench/baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from bench import generate  # noqa: E402
+
+
+def load_app(workdir):
+    """Импортирует приложение с базой во временном каталоге"""
+    os.environ['WAREHOUSE_DB'] = os.path.join(workdir, 'warehouse.db')
+    os.chdir(workdir)
+    import app as warehouse_app
+    return warehouse_app.app
+
+
+def logged_in_client(flask_app, username='admin'):
+    client = flask_app.test_client()
+    with client.session_transaction() as sess:
+        sess['logged_in'] = True
+        sess['username'] = username
+    return client
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def summarize(samples_ms):
+    return {
+        'runs': len(samples_ms),
+        'min_ms': round(min(samples_ms), 3),
+        'median_ms': round(statistics.median(samples_ms), 3),
+        'mean_ms': round(statistics.mean(samples_ms), 3),
+        'p95_ms': round(percentile(samples_ms, 95), 3),
+    }
+
+
+def expect_ok(response):
+    if response.status_code != 200:
+        raise RuntimeError(f'{response.request.path}: HTTP {response.status_code} {response.get_data(as_text=True)[:200]}')
+    return response
+
+
+class Context:
+    def __init__(self, client, warehouse, args):
+        self.client = client
+        self.warehouse = warehouse
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.receipt_id = None
+
+
+def upload(client, url, payload, filename='bench.xlsx', **form):
+    payload.seek(0)
+    data = dict(form)
+    data['file'] = (payload, filename)
+    return expect_ok(client.post(url, data=data, content_type='multipart/form-data'))
+
+
+# Сценарии: (название, подготовка вне замера, операция, количество повторов)
+
+def setup_scan(ctx):
+    barcode = ctx.rng.choice(ctx.warehouse.barcodes)
+    return {
+        'box_id': ctx.rng.choice(ctx.warehouse.box_ids),
+        'product_name': ctx.warehouse.names[barcode],
+        'barcode': barcode,
+        'quantity': 1,
+    }
+
+
+def op_scan_add(ctx, payload):
+    expect_ok(ctx.client.get('/api/check_product', query_string={'box_id': payload['box_id'], 'barcode': payload['barcode']}))
+    expect_ok(ctx.client.post('/api/box_items', json=payload))
+
+
+def op_check_product(ctx, payload):
+    expect_ok(ctx.client.get('/api/check_product', query_string={'box_id': payload['box_id'], 'barcode': payload['barcode']}))
+
+
+def make_order_setup(file_format):
+    def setup(ctx):
+        return generate.generate_order_xlsx(ctx.warehouse, file_format, lines=ctx.args.order_lines,
+                                            seed=ctx.rng.randrange(1 << 30))
+    return setup
+
+
+def op_process_collection(ctx, payload):
+    upload(ctx.client, '/api/process_collection', payload)
+
+
+def setup_confirm(ctx):
+    payload = generate.generate_order_xlsx(ctx.warehouse, 'shk_excel', lines=ctx.args.order_lines,
+                                           seed=ctx.rng.randrange(1 << 30))
+    plan = upload(ctx.client, '/api/process_collection', payload).get_json()['collection_plan']
+    return {'collection_plan': plan}
+
+
+def op_confirm_collection(ctx, payload):
+    expect_ok(ctx.client.post('/api/confirm_collection', json=payload))
+
+
+def setup_items_file(ctx):
+    return generate.generate_items_xlsx(ctx.warehouse, rows=ctx.args.import_rows, seed=ctx.rng.randrange(1 << 30))
+
+
+def op_import_items(ctx, payload):
+    upload(ctx.client, '/api/import_items_excel', payload, import_mode='add')
+
+
+def op_import_receipt(ctx, payload):
+    data = upload(ctx.client, '/api/receipts/import_excel', payload,
+                  receipt_date=date.today().isoformat(), description='bench').get_json()
+    ctx.receipt_id = data['receipt_id']
+
+
+def no_setup(ctx):
+    return None
+
+
+def op_export_all(ctx, payload):
+    expect_ok(ctx.client.get('/api/export_excel_all'))
+
+
+def op_export_boxes(ctx, payload):
+    expect_ok(ctx.client.get('/api/export_excel_boxes'))
+
+
+def op_export_by_date(ctx, payload):
+    today = date.today().isoformat()
+    expect_ok(ctx.client.get('/api/export_items_by_date', query_string={'start_date': '2000-01-01', 'end_date': today}))
+
+
+def op_export_receipt(ctx, payload):
+    expect_ok(ctx.client.get(f'/api/receipts/{ctx.receipt_id}/export_excel'))
+
+
+def scenarios(args):
+    return [
+        ('scan_add', setup_scan, op_scan_add, args.scans),
+        ('check_product', setup_scan, op_check_product, args.scans),
+        ('process_collection_shk_excel', make_order_setup('shk_excel'), op_process_collection, args.repeat),
+        ('process_collection_products_export', make_order_setup('products_export'), op_process_collection, args.repeat),
+        ('confirm_collection', setup_confirm, op_confirm_collection, args.repeat),
+        ('import_items_excel', setup_items_file, op_import_items, args.repeat),
+        ('import_receipts_excel', setup_items_file, op_import_receipt, args.repeat),
+        ('export_excel_all', no_setup, op_export_all, args.repeat),
+        ('export_excel_boxes', no_setup, op_export_boxes, args.repeat),
+        ('export_items_by_date', no_setup, op_export_by_date, args.repeat),
+        ('export_receipt_excel', no_setup, op_export_receipt, args.repeat),
+    ]
+
+
+def run_suite(args, client, warehouse):
+    ctx = Context(client, warehouse, args)
+    results = {}
+    for name, setup, op, repeat in scenarios(args):
+        if args.only and name not in args.only:
+            continue
+        samples = []
+        for _ in range(repeat):
+            payload = setup(ctx)
+            started = time.perf_counter()
+            op(ctx, payload)
+            samples.append((time.perf_counter() - started) * 1000)
+        results[name] = summarize(samples)
+        print(f"{name:<38} median {results[name]['median_ms']:>10.2f} ms  p95 {results[name]['p95_ms']:>10.2f} ms")
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Сравнение медиан с базовой линией; ratio > 1 + tolerance — регрессия"""
+    comparison = {}
+    for name, current in results.items():
+        base = baseline.get('results', {}).get(name)
+        if not base:
+            comparison[name] = {'status': 'new', 'current_ms': current['median_ms']}
+            continue
+        ratio = current['median_ms'] / base['median_ms'] if base['median_ms'] else float('inf')
+        if ratio > 1 + tolerance:
+            status = 'regression'
+        elif ratio < 1 - tolerance:
+            status = 'improvement'
+        else:
+            status = 'ok'
+        comparison[name] = {
+            'status': status,
+            'baseline_ms': base['median_ms'],
+            'current_ms': current['median_ms'],
+            'ratio': round(ratio, 3),
+        }
+    return comparison
+
+
+def print_comparison(comparison):
+    print('\nComparison with baseline:')
+    for name, row in comparison.items():
+        if row['status'] == 'new':
+            print(f"  {name:<38} new")
+        else:
+            print(f"  {name:<38} {row['baseline_ms']:>10.2f} -> {row['current_ms']:>10.2f} ms  x{row['ratio']:<6} {row['status']}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the warehouse app hot paths')
+    parser.add_argument('--zones', type=int, default=10)
+    parser.add_argument('--boxes-per-zone', type=int, default=20)
+    parser.add_argument('--items-per-box', type=int, default=50)
+    parser.add_argument('--duplicate-rate', type=float, default=0.1,
+                        help='share of items whose barcode is also stored in another box')
+    parser.add_argument('--order-lines', type=int, default=500)
+    parser.add_argument('--import-rows', type=int, default=1000)
+    parser.add_argument('--scans', type=int, default=200, help='repetitions of single-scan scenarios')
+    parser.add_argument('--repeat', type=int, default=5, help='repetitions of file scenarios')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--only', nargs='*', help='run only these scenarios')
+    parser.add_argument('--output', default=os.path.join(REPO_ROOT, 'bench', 'results.json'))
+    parser.add_argument('--baseline', help='baseline results to compare against')
+    parser.add_argument('--save-baseline', help='also write the results to this baseline path')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    output = os.path.abspath(args.output)
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    save_baseline = os.path.abspath(args.save_baseline) if args.save_baseline else None
+
+    with tempfile.TemporaryDirectory(prefix='warehouse-bench-') as workdir:
+        flask_app = load_app(workdir)
+        warehouse = generate.generate_warehouse(
+            os.environ['WAREHOUSE_DB'], zones=args.zones, boxes_per_zone=args.boxes_per_zone,
+            items_per_box=args.items_per_box, duplicate_rate=args.duplicate_rate, seed=args.seed)
+        client = logged_in_client(flask_app)
+        results = run_suite(args, client, warehouse)
+        os.chdir(REPO_ROOT)
+
+    report = {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'config': {k: v for k, v in vars(args).items() if k not in ('output', 'baseline', 'save_baseline')},
+        },
+        'results': results,
+    }
+
+    exit_code = 0
+    if baseline_path and os.path.exists(baseline_path):
+        with open(baseline_path, encoding='utf-8') as f:
+            baseline = json.load(f)
+        report['comparison'] = compare(results, baseline, args.tolerance)
+        print_comparison(report['comparison'])
+        if args.fail_on_regression and any(r['status'] == 'regression' for r in report['comparison'].values()):
+            exit_code = 1
+
+    for path in filter(None, (output, save_baseline)):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f'Results written to {path}')
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""Бенчмарк поиска товаров (FTS5) на большом складе.
+
+    python -m bench.search --items 1000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from bench import generate  # noqa: E402
+from bench.run import percentile  # noqa: E402
+
+
+def make_queries(rng, warehouse, count):
+    queries = []
+    for _ in range(count):
+        barcode = rng.choice(warehouse.barcodes)
+        name = warehouse.names[barcode]
+        kind = rng.randrange(4)
+        if kind == 0:
+            queries.append(('barcode', barcode))
+        elif kind == 1:
+            start = rng.randrange(len(barcode) - 6)
+            queries.append(('barcode part', barcode[start:start + 6]))
+        elif kind == 2:
+            word = rng.choice(name.split()[:2])
+            queries.append(('name word', word[:max(3, len(word) - 2)]))
+        else:
+            queries.append(('two words', ' '.join(name.split()[:2])))
+    return queries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Search latency over a large warehouse')
+    parser.add_argument('--items', type=int, default=1_000_000)
+    parser.add_argument('--receipt-items', type=int, default=200_000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--dir')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix='warehouse-search-', dir=args.dir) as workdir:
+        os.environ['WAREHOUSE_DB'] = os.path.join(workdir, 'warehouse.db')
+        import database
+        import search
+        database.init_db()
+
+        boxes_per_zone, items_per_box = 200, 100
+        zones = max(1, args.items // (boxes_per_zone * items_per_box))
+        print(f'Generating {zones * boxes_per_zone * items_per_box:,} box items...')
+        started = time.perf_counter()
+        warehouse = generate.generate_warehouse(database.DB_PATH, zones=zones, boxes_per_zone=boxes_per_zone,
+                                                items_per_box=items_per_box, duplicate_rate=0.3, seed=args.seed)
+        db = sqlite3.connect(database.DB_PATH)
+        db.row_factory = sqlite3.Row
+        db.execute("INSERT INTO receipts (receipt_number, receipt_date) VALUES ('REC-BENCH', date('now'))")
+        rng = random.Random(args.seed)
+        product_ids = dict(db.execute('SELECT barcode, id FROM products WHERE barcode IS NOT NULL'))
+        db.executemany(
+            'INSERT INTO receipt_items (receipt_id, product_id, quantity) VALUES (1, ?, ?)',
+            ((product_ids[rng.choice(warehouse.barcodes)], rng.randint(1, 50)) for _ in range(args.receipt_items))
+        )
+        db.commit()
+        print(f'generated and indexed in {time.perf_counter() - started:.1f}s')
+
+        queries = make_queries(rng, warehouse, args.queries)
+        by_kind = {}
+        for kind, text in queries:
+            t = time.perf_counter()
+            rows, _ = search.search(db, text, page=1, per_page=50)
+            by_kind.setdefault(kind, []).append(((time.perf_counter() - t) * 1000, len(rows)))
+        db.close()
+
+    everything = [ms for samples in by_kind.values() for ms, _ in samples]
+    for kind, samples in sorted(by_kind.items()):
+        latencies = [ms for ms, _ in samples]
+        hits = statistics.mean(n for _, n in samples)
+        print(f'{kind:<14} median {statistics.median(latencies):7.2f} ms  p95 {percentile(latencies, 95):7.2f} ms  avg hits {hits:.0f}')
+    print(f'{"all":<14} median {statistics.median(everything):7.2f} ms  p95 {percentile(everything, 95):7.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
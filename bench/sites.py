@@ -0,0 +1,193 @@
+"""Запись при нескольких площадках: одна общая база против шарда на площадку (sites.py).
+
+Процессы-«воркеры» (как у gunicorn) держат по писателю (writer.py) на каждый
+шард, их клиенты-потоки сканируют на своей площадке, каждая запись — как
+сканирование (UPDATE позиции, триггер журнала движений). Замеряется:
+
+- пропускная способность записи при 1, 2, 4, ... площадках — в общей базе
+  и с отдельным файлом на площадку;
+- задержка сканирований площадки B, пока на площадке A идёт большой импорт
+  одной транзакцией.
+
+    python -m bench.sites --sites 1 2 4 8 --workers 4 --clients 4 --duration 10
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from bench import generate  # noqa: E402
+from bench.run import percentile  # noqa: E402
+
+
+def scan(conn, item_id):
+    conn.execute('UPDATE box_items SET quantity = quantity + 1 WHERE id = ?', (item_id,))
+
+
+def bulk_import(conn, box_id, product_ids):
+    conn.executemany('INSERT INTO box_items (box_id, product_id, quantity) VALUES (?, ?, 1)',
+                     ((box_id, product_id) for product_id in product_ids))
+    return len(product_ids)
+
+
+def prepare(workdir, sites, shared, args):
+    """Файлы площадок: один общий или по файлу на площадку -> {site: path}, {path: item ids}"""
+    import database
+    if shared:
+        paths = {site: os.path.join(workdir, 'warehouse.db') for site in sites}
+    else:
+        paths = {site: os.path.join(workdir, f'warehouse-{site}.db') for site in sites}
+    items = {}
+    for path in dict.fromkeys(paths.values()):
+        database.SITES.clear()
+        database.SITES['bench'] = path
+        database.init_db()
+        generate.generate_warehouse(path, zones=args.zones, boxes_per_zone=args.boxes_per_zone,
+                                    items_per_box=args.items_per_box, seed=args.seed)
+        conn = database.get_db('bench')
+        items[path] = [row[0] for row in conn.execute('SELECT id FROM box_items')]
+        conn.close()
+    return paths, items
+
+
+def worker(worker_id, client_sites, paths, items, start_at, deadline, results):
+    """Процесс-воркер: по писателю на шард, клиенты сканируют на своих площадках"""
+    import writer
+    counts = []
+    latencies = []
+    lock = threading.Lock()
+
+    def client(index, site):
+        rng = random.Random(worker_id * 1000 + index)
+        coalescer = writer.get_writer(paths[site])
+        ids = items[paths[site]]
+        done = 0
+        own = []
+        # Все клиенты начинают одновременно, когда запущены все процессы
+        time.sleep(max(0.0, start_at - time.time()))
+        while time.time() < deadline:
+            started = time.perf_counter()
+            coalescer.submit(scan, rng.choice(ids))
+            own.append((time.perf_counter() - started) * 1000)
+            done += 1
+        with lock:
+            counts.append(done)
+            latencies.extend(own)
+
+    threads = [threading.Thread(target=client, args=(index, site)) for index, site in enumerate(client_sites)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put((sum(counts), latencies))
+
+
+def run_load(paths, items, sites, args, duration):
+    """Все воркеры вместе; клиенты распределены по площадкам по кругу -> (сканирований/с, задержки)"""
+    start_at = time.time() + 1
+    deadline = start_at + duration
+    results = multiprocessing.Queue()
+    processes = []
+    for worker_id in range(args.workers):
+        client_sites = [sites[(worker_id * args.clients + index) % len(sites)] for index in range(args.clients)]
+        process = multiprocessing.Process(target=worker,
+                                          args=(worker_id, client_sites, paths, items, start_at, deadline, results))
+        process.start()
+        processes.append(process)
+    total = 0
+    latencies = []
+    for _ in processes:
+        count, samples = results.get()
+        total += count
+        latencies.extend(samples)
+    for process in processes:
+        process.join()
+    return total / duration, latencies
+
+
+def importer(path, rows, started_event, done_event):
+    import sqlite3
+    import writer
+    conn = sqlite3.connect(path)
+    box_id = conn.execute('SELECT MIN(id) FROM boxes').fetchone()[0]
+    product_ids = [row[0] for row in conn.execute('SELECT id FROM products')]
+    conn.close()
+    product_ids = (product_ids * (rows // len(product_ids) + 1))[:rows]
+    started_event.set()
+    writer.get_writer(path).submit(bulk_import, box_id, product_ids)
+    done_event.set()
+
+
+def import_stall(paths, items, args):
+    """Задержка сканирований площадки B во время импорта на площадке A"""
+    started_event = multiprocessing.Event()
+    done_event = multiprocessing.Event()
+    process = multiprocessing.Process(target=importer,
+                                      args=(paths['A'], args.import_rows, started_event, done_event))
+    process.start()
+    started_event.wait()
+
+    import writer
+    rng = random.Random(7)
+    coalescer = writer.get_writer(paths['B'])
+    latencies = []
+    started = time.perf_counter()
+    while not done_event.is_set():
+        began = time.perf_counter()
+        coalescer.submit(scan, rng.choice(items[paths['B']]))
+        latencies.append((time.perf_counter() - began) * 1000)
+        time.sleep(0.005)
+    elapsed = time.perf_counter() - started
+    process.join()
+    return elapsed, latencies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write throughput: one shared database vs one shard per site')
+    parser.add_argument('--sites', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--workers', type=int, default=4, help='worker processes')
+    parser.add_argument('--clients', type=int, default=4, help='scanning clients (threads) per worker')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of load per configuration')
+    parser.add_argument('--zones', type=int, default=2)
+    parser.add_argument('--boxes-per-zone', type=int, default=10)
+    parser.add_argument('--items-per-box', type=int, default=50)
+    parser.add_argument('--import-rows', type=int, default=200_000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    print(f'{args.workers} worker processes x {args.clients} scanning clients, {args.duration:.0f} s per run, '
+          f'{os.cpu_count()} CPU')
+    print()
+    print(f'{"sites":<7}{"layout":<10}{"scans/s":>10}{"p50 ms":>9}{"p99 ms":>9}{"max ms":>9}')
+    for count in args.sites:
+        sites = [f'site{index + 1}' for index in range(count)]
+        for shared in (True, False) if count > 1 else (True,):
+            with tempfile.TemporaryDirectory(prefix='warehouse-sites-') as workdir:
+                paths, items = prepare(workdir, sites, shared, args)
+                rate, latencies = run_load(paths, items, sites, args, args.duration)
+            layout = 'shared' if shared else 'sharded'
+            print(f'{count:<7}{layout:<10}{rate:>10.0f}{percentile(latencies, 50):>9.2f}'
+                  f'{percentile(latencies, 99):>9.1f}{max(latencies):>9.1f}')
+
+    print()
+    print(f'import of {args.import_rows:,} rows on site A, scans on site B every 5 ms:')
+    print(f'{"layout":<10}{"import s":>10}{"scans":>7}{"p50 ms":>9}{"p99 ms":>9}{"max ms":>9}')
+    for shared in (True, False):
+        with tempfile.TemporaryDirectory(prefix='warehouse-sites-') as workdir:
+            paths, items = prepare(workdir, ['A', 'B'], shared, args)
+            elapsed, latencies = import_stall(paths, items, args)
+        layout = 'shared' if shared else 'sharded'
+        print(f'{layout:<10}{elapsed:>10.1f}{len(latencies):>7}{percentile(latencies, 50):>9.2f}'
+              f'{percentile(latencies, 99):>9.1f}{max(latencies):>9.1f}')
+
+
+if __name__ == '__main__':
+    main()
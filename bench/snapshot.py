@@ -0,0 +1,134 @@
+"""Задержка записи во время больших выгрузок: рабочая база и снимок (snapshot.py).
+
+Отдельный процесс-«сканер» всё время фиксирует мелкие записи в базу и
+замеряет длительность каждой транзакции, а основной процесс гоняет
+выгрузки через тестовый клиент приложения в каждом режиме
+REPORT_SNAPSHOT. Дополнительно замеряется время самого снимка: backup API
+в память и в файл и ``VACUUM INTO``.
+
+    python -m bench.snapshot --zones 20 --boxes-per-zone 50 --items-per-box 100 --duration 30
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from bench import generate  # noqa: E402
+from bench.run import logged_in_client, percentile  # noqa: E402
+
+# Выгрузка по коробкам не берётся: на тысячах коробок её время — запись листов xlsx
+EXPORTS = ('/api/export_excel_all', '/api/export_items_by_date?start_date=2000-01-01&end_date=2100-01-01')
+
+
+def scanner(db_path, item_ids, interval, stop, results):
+    """Мелкие транзакции записи, как у сканирования; длительность каждой — в results"""
+    rng = random.Random(0)
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.execute('PRAGMA busy_timeout = 30000')
+    latencies = []
+    wal_max = 0
+    while not stop.is_set():
+        started = time.perf_counter()
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute('UPDATE box_items SET quantity = quantity + 1 WHERE id = ?', (rng.choice(item_ids),))
+        conn.execute('COMMIT')
+        latencies.append((time.perf_counter() - started) * 1000)
+        try:
+            wal_max = max(wal_max, os.path.getsize(db_path + '-wal'))
+        except OSError:
+            # Журнал удаляется, когда закрывается последнее соединение к базе
+            pass
+        time.sleep(interval)
+    conn.close()
+    results.put((latencies, wal_max))
+
+
+def run_mode(flask_app, client, mode, db_path, item_ids, args):
+    flask_app.config['REPORT_SNAPSHOT'] = mode
+    stop = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=scanner, args=(db_path, item_ids, args.interval / 1000, stop, results))
+    process.start()
+    exports = []
+    deadline = time.perf_counter() + args.duration
+    while time.perf_counter() < deadline:
+        for url in EXPORTS:
+            started = time.perf_counter()
+            response = client.get(url)
+            if response.status_code != 200:
+                raise RuntimeError(f'{url}: HTTP {response.status_code}')
+            response.close()
+            exports.append((time.perf_counter() - started) * 1000)
+    stop.set()
+    latencies, wal_max = results.get()
+    process.join()
+    return latencies, exports, wal_max
+
+
+def snapshot_times(db_path, workdir):
+    import snapshot
+    source = sqlite3.connect(db_path)
+    timings = {}
+    started = time.perf_counter()
+    snapshot.take_snapshot(source).close()
+    timings['backup API -> memory'] = time.perf_counter() - started
+
+    target = os.path.join(workdir, 'snapshot-backup.db')
+    started = time.perf_counter()
+    snapshot.take_snapshot(source, target).close()
+    timings['backup API -> file'] = time.perf_counter() - started
+
+    target = os.path.join(workdir, 'snapshot-vacuum.db')
+    started = time.perf_counter()
+    source.execute('VACUUM INTO ?', (target,))
+    timings['VACUUM INTO file'] = time.perf_counter() - started
+    source.close()
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Writer latency during large exports, with and without snapshots')
+    parser.add_argument('--zones', type=int, default=20)
+    parser.add_argument('--boxes-per-zone', type=int, default=50)
+    parser.add_argument('--items-per-box', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=30, help='seconds of exports per mode')
+    parser.add_argument('--interval', type=float, default=5, help='pause between scanner commits, ms')
+    parser.add_argument('--modes', nargs='+', default=['off', 'memory', 'file'])
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix='warehouse-snapshot-') as workdir:
+        db_path = os.path.join(workdir, 'warehouse.db')
+        os.environ['WAREHOUSE_DB'] = db_path
+        os.chdir(workdir)
+        import app as warehouse_app
+        generate.generate_warehouse(db_path, zones=args.zones, boxes_per_zone=args.boxes_per_zone,
+                                    items_per_box=args.items_per_box, seed=args.seed)
+        db = sqlite3.connect(db_path)
+        item_ids = [row[0] for row in db.execute('SELECT id FROM box_items')]
+        db.close()
+        print(f'{len(item_ids):,} box items, database {os.path.getsize(db_path) / 1024 / 1024:.0f} MB')
+        for name, seconds in snapshot_times(db_path, workdir).items():
+            print(f'  {name:<24}{seconds * 1000:>8.0f} ms')
+
+        client = logged_in_client(warehouse_app.app)
+        print()
+        print(f'{"mode":<8}{"exports":>8}{"export p50":>12}{"commits":>9}'
+              f'{"commit p50":>12}{"p99":>9}{"max":>9}{"WAL max":>10}')
+        for mode in args.modes:
+            latencies, exports, wal_max = run_mode(warehouse_app.app, client, mode, db_path, item_ids, args)
+            print(f'{mode:<8}{len(exports):>8}{percentile(exports, 50):>10.0f}ms{len(latencies):>9}'
+                  f'{percentile(latencies, 50):>10.2f}ms{percentile(latencies, 99):>7.1f}ms'
+                  f'{max(latencies):>7.1f}ms{wal_max / 1024 / 1024:>8.1f}MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""Время запуска воркера и потребление памяти: ранний и отложенный импорт pandas.
+
+Каждый замер — отдельный процесс интерпретатора, как воркер gunicorn.
+«eager» воспроизводит прежнее поведение (pandas и openpyxl импортируются
+вместе с app.py), «lazy» — текущее (lazy.py). В процессе замеряются время
+``import app`` и RSS после импорта, после серии сканирований и после
+первой выгрузки в Excel. Отдельно ``python -X importtime`` показывает
+самые тяжёлые модули верхнего уровня.
+
+    python -m bench.startup --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+MODES = ('eager', 'lazy')
+EAGER_IMPORTS = 'import pandas, openpyxl'
+
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    raise RuntimeError('VmRSS not found')
+
+
+def child(mode, scans):
+    """Замеры внутри процесса-«воркера»; результат — JSON в stdout"""
+    started = time.perf_counter()
+    if mode == 'eager':
+        exec(EAGER_IMPORTS)
+    import app as warehouse_app
+    result = {'import_ms': (time.perf_counter() - started) * 1000, 'rss_import': rss_mb()}
+
+    # Не через bench.run: он импортирует генератор, а с ним и pandas
+    client = warehouse_app.app.test_client()
+    with client.session_transaction() as sess:
+        sess['logged_in'] = True
+        sess['username'] = 'admin'
+    db = warehouse_app.get_db()
+    pairs = db.execute('''
+        SELECT bi.box_id, p.barcode FROM box_items bi JOIN products p ON p.id = bi.product_id
+        ORDER BY bi.id LIMIT ?
+    ''', (scans,)).fetchall()
+    for box_id, barcode in pairs:
+        client.get('/api/check_product', query_string={'box_id': box_id, 'barcode': barcode})
+        client.get(f'/box/{box_id}')
+    result['rss_scans'] = rss_mb()
+    result['pandas_after_scans'] = 'pandas' in sys.modules
+
+    started = time.perf_counter()
+    response = client.get('/api/export_excel_all')
+    if response.status_code != 200:
+        raise RuntimeError(f'export: HTTP {response.status_code}')
+    response.close()
+    result['first_export_ms'] = (time.perf_counter() - started) * 1000
+    result['rss_export'] = rss_mb()
+    print(json.dumps(result))
+
+
+def run_child(mode, scans, env, workdir):
+    output = subprocess.run(
+        [sys.executable, '-m', 'bench.startup', '--child', mode, '--scans', str(scans)],
+        env=env, cwd=workdir, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def importtime(mode, env, workdir):
+    """Модули верхнего уровня по суммарному времени импорта, мкс"""
+    code = (EAGER_IMPORTS + '; ' if mode == 'eager' else '') + 'import app'
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            env=env, cwd=workdir, check=True, capture_output=True, text=True).stderr
+    top_level = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Вложенные импорты отмечены отступом
+        if not name.startswith('  '):
+            top_level[name.strip()] = int(cumulative)
+    return top_level
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Worker startup time and RSS: eager vs lazy pandas import')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--scans', type=int, default=200, help='scan requests before the first export')
+    parser.add_argument('--zones', type=int, default=10)
+    parser.add_argument('--boxes-per-zone', type=int, default=20)
+    parser.add_argument('--items-per-box', type=int, default=50)
+    parser.add_argument('--top', type=int, default=8, help='heaviest top-level imports to show')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--child', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        return child(args.child, args.scans)
+    if not os.path.exists('/proc/self/status'):
+        raise SystemExit('/proc/self/status is not available on this platform')
+
+    from bench import generate
+
+    with tempfile.TemporaryDirectory(prefix='warehouse-startup-') as workdir:
+        db_path = os.path.join(workdir, 'warehouse.db')
+        env = dict(os.environ, WAREHOUSE_DB=db_path,
+                   PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+        subprocess.run([sys.executable, '-c', 'import database; database.init_db()'], env=env, cwd=workdir, check=True)
+        generate.generate_warehouse(db_path, zones=args.zones, boxes_per_zone=args.boxes_per_zone,
+                                    items_per_box=args.items_per_box, seed=args.seed)
+
+        runs = {mode: [] for mode in MODES}
+        for _ in range(args.repeat):
+            # Поочерёдно, чтобы фоновые колебания доставались обоим вариантам
+            for mode in MODES:
+                runs[mode].append(run_child(mode, args.scans, env, workdir))
+        imports = {mode: importtime(mode, env, workdir) for mode in MODES}
+
+    def median(mode, key):
+        return statistics.median(run[key] for run in runs[mode])
+
+    print(f'{args.repeat} worker processes per mode, {args.scans} scans + box views before the first export')
+    print(f'{"":<28}{"eager":>10}{"lazy":>10}')
+    for key, label, unit in (('import_ms', 'import app', 'ms'), ('rss_import', 'RSS after import', 'MB'),
+                             ('rss_scans', 'RSS after scans', 'MB'), ('first_export_ms', 'first export', 'ms'),
+                             ('rss_export', 'RSS after export', 'MB')):
+        print(f'{label + ", " + unit:<28}{median("eager", key):>10.1f}{median("lazy", key):>10.1f}')
+    loaded = {mode: any(run['pandas_after_scans'] for run in runs[mode]) for mode in MODES}
+    print(f'{"pandas loaded after scans":<28}{str(loaded["eager"]):>10}{str(loaded["lazy"]):>10}')
+
+    print()
+    print('python -X importtime, heaviest top-level imports (eager), ms; totals for both modes below')
+    for name, us in sorted(imports['eager'].items(), key=lambda item: -item[1])[:args.top]:
+        print(f'  {name:<30}{us / 1000:>8.1f}')
+    for mode in MODES:
+        print(f'  {"total (" + mode + ")":<30}{sum(imports[mode].values()) / 1000:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Инвентаризация целой зоны (stocktake.py).
+
+Зона из многих коробок, N сканирований по одной штуке: в основном товары
+своих коробок, часть — чужих коробок и незнакомые штрих-коды, часть
+позиций не сканируется вовсе. Замеряется приём сканирований через API
+пачками (как их шлёт страница) и по одному, расчёт расхождений при
+закрытии и применение исправлений одной транзакцией. После применения
+повторный пересчёт тех же сканирований должен дать ноль расхождений.
+
+    python -m bench.stocktake --scans 100000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from bench import generate  # noqa: E402
+from bench.run import logged_in_client, percentile  # noqa: E402
+
+
+def make_scans(db, zone_id, count, rng, foreign_rate=0.02, unknown_rate=0.01, skip_rate=0.05):
+    items = db.execute('''
+        SELECT bi.box_id, p.barcode FROM box_items bi
+        JOIN products p ON p.id = bi.product_id
+        JOIN boxes b ON b.id = bi.box_id
+        WHERE b.zone_id = ? AND p.barcode IS NOT NULL
+    ''', (zone_id,)).fetchall()
+    # Часть позиций не найдена вовсе — недостача
+    counted = [tuple(item) for item in items if rng.random() >= skip_rate]
+    box_ids = sorted({item[0] for item in items})
+    barcodes = [item[1] for item in items]
+    scans = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < unknown_rate:
+            scans.append({'box_id': rng.choice(box_ids), 'barcode': str(rng.randrange(10**12, 10**13))})
+        elif roll < unknown_rate + foreign_rate:
+            scans.append({'box_id': rng.choice(box_ids), 'barcode': rng.choice(barcodes)})
+        else:
+            box_id, barcode = rng.choice(counted)
+            scans.append({'box_id': box_id, 'barcode': barcode})
+    return scans, len(items)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Whole-zone stocktake: scan ingestion, diff and apply')
+    parser.add_argument('--scans', type=int, default=100_000)
+    parser.add_argument('--batch', type=int, default=500, help='scans per request, as the page sends them')
+    parser.add_argument('--single', type=int, default=2000, help='scans sent one request each (sample)')
+    parser.add_argument('--boxes', type=int, default=200, help='boxes in the counted zone')
+    parser.add_argument('--items-per-box', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix='warehouse-stocktake-') as workdir:
+        db_path = os.path.join(workdir, 'warehouse.db')
+        os.environ['WAREHOUSE_DB'] = db_path
+        os.chdir(workdir)
+        import app as warehouse_app
+        import database
+        generate.generate_warehouse(db_path, zones=2, boxes_per_zone=args.boxes,
+                                    items_per_box=args.items_per_box, seed=args.seed)
+        db = database.get_db()
+        zone_id = db.execute('SELECT MIN(id) FROM zones').fetchone()[0]
+        scans, positions = make_scans(db, zone_id, args.scans, random.Random(args.seed))
+        db.close()
+        client = logged_in_client(warehouse_app.app)
+
+        def start():
+            return client.post('/api/stocktakes', json={'zone_id': zone_id}).get_json()['id']
+
+        # По одному запросу на сканирование — выборка, для сравнения
+        session_id = start()
+        single = []
+        for scan in scans[:args.single]:
+            started = time.perf_counter()
+            client.post(f'/api/stocktakes/{session_id}/scans', json=scan)
+            single.append((time.perf_counter() - started) * 1000)
+
+        session_id = start()
+        batches = []
+        started = time.perf_counter()
+        for offset in range(0, len(scans), args.batch):
+            began = time.perf_counter()
+            response = client.post(f'/api/stocktakes/{session_id}/scans', json={'scans': scans[offset:offset + args.batch]})
+            batches.append((time.perf_counter() - began) * 1000)
+            assert response.get_json()['success'], response.data
+        ingest_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        closed = client.post(f'/api/stocktakes/{session_id}/close', json={}).get_json()
+        close_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        applied = client.post(f'/api/stocktakes/{session_id}/close', json={'apply': True}).get_json()
+        apply_ms = (time.perf_counter() - started) * 1000
+
+        # Те же сканирования после исправлений: расхождений быть не должно
+        recheck = start()
+        for offset in range(0, len(scans), args.batch):
+            client.post(f'/api/stocktakes/{recheck}/scans', json={'scans': scans[offset:offset + args.batch]})
+        remaining = client.post(f'/api/stocktakes/{recheck}/close', json={}).get_json()
+
+    summary = closed['summary']
+    print(f'zone of {args.boxes} boxes, {positions:,} positions; {len(scans):,} scans '
+          f'-> {summary["counted_lines"]:,} counted lines')
+    print()
+    print(f'scans one per request:      p50 {percentile(single, 50):.2f} ms, p99 {percentile(single, 99):.2f} ms '
+          f'-> {percentile(single, 50) * len(scans) / 1000:.0f} s for all scans at p50')
+    print(f'scans in batches of {args.batch}:   {ingest_s:.1f} s total ({len(scans) / ingest_s:,.0f} scans/s), '
+          f'p50 {percentile(batches, 50):.0f} ms per batch')
+    print(f'close (diff):               {close_ms:.0f} ms -> missing {summary["missing"]:,}, '
+          f'surplus {summary["surplus"]:,}, quantity delta {summary["delta"]:,}')
+    print(f'close + apply (one txn):    {apply_ms:.0f} ms -> status {applied["status"]}')
+    print(f'recount after apply:        {len(remaining["changes"])} differences')
+
+
+if __name__ == '__main__':
+    main()
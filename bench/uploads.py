@@ -0,0 +1,111 @@
+"""Дисковый ввод-вывод при разборе загружаемых Excel-файлов.
+
+Сравнивает прежнюю обработку (разбор формы Werkzeug со сбросом на диск
+после 500 КБ, сохранение во временный файл и повторное чтение) с
+загрузкой в памяти (uploads.py) на файлах заданных размеров. Байты
+записи и чтения берутся из /proc/self/io (Linux).
+
+    python -m bench.uploads --sizes 5 10 20
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+import pandas as pd
+from flask import Flask, Request, request
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+import uploads  # noqa: E402
+from bench import generate  # noqa: E402
+
+CALIBRATION_ROWS = 20_000
+
+
+def make_items_xlsx(rows, seed):
+    rng = random.Random(seed)
+    barcodes = [generate.make_barcode(rng) for _ in range(max(1, rows // 5))]
+    data = []
+    for _ in range(rows):
+        barcode = rng.choice(barcodes)
+        data.append({
+            'Название товара': generate.make_product_name(rng, barcode),
+            'Штрих-код': barcode,
+            'Количество': rng.randint(1, 200),
+            'Зона': f'Зона {rng.randint(1, 20)}',
+            'Коробка': f'Коробка {rng.randint(1, 500)}',
+        })
+    buffer = io.BytesIO()
+    pd.DataFrame(data).to_excel(buffer, index=False, engine='openpyxl')
+    return buffer.getvalue()
+
+
+def legacy_read(file):
+    """Прежняя обработка: копия во временный файл и чтение с диска"""
+    with tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False) as tmp:
+        file_path = tmp.name
+        file.save(file_path)
+    df = pd.read_excel(file_path)
+    try:
+        os.unlink(file_path)
+    except OSError:
+        pass
+    return df
+
+
+def io_counters():
+    with open('/proc/self/io') as f:
+        return {key: int(value) for key, value in (line.split(': ') for line in f)}
+
+
+def measure(flask_app, request_class, reader, payload):
+    flask_app.request_class = request_class
+    data = {'file': (io.BytesIO(payload), 'upload.xlsx')}
+    with flask_app.test_request_context('/', method='POST', data=data, content_type='multipart/form-data'):
+        before = io_counters()
+        started = time.perf_counter()
+        rows = len(reader(request.files['file']))
+        elapsed = time.perf_counter() - started
+        after = io_counters()
+    return {
+        'rows': rows,
+        'ms': elapsed * 1000,
+        'written': after['wchar'] - before['wchar'],
+        'read': after['rchar'] - before['rchar'],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Disk I/O of upload handling')
+    parser.add_argument('--sizes', type=float, nargs='+', default=[5, 10, 20], help='file sizes, MB')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists('/proc/self/io'):
+        raise SystemExit('/proc/self/io is not available on this platform')
+
+    flask_app = Flask(__name__)
+    uploads.init_uploads(flask_app)
+    spooled = flask_app.request_class
+
+    bytes_per_row = len(make_items_xlsx(CALIBRATION_ROWS, args.seed)) / CALIBRATION_ROWS
+    mb = 1024 * 1024
+    print(f'{"file":>8} {"rows":>9} | {"before: written":>15} {"read":>8} {"time":>8} | '
+          f'{"after: written":>14} {"read":>8} {"time":>8}')
+    for size in args.sizes:
+        payload = make_items_xlsx(int(size * mb / bytes_per_row), args.seed)
+        before = measure(flask_app, Request, legacy_read, payload)
+        after = measure(flask_app, spooled, uploads.read_excel, payload)
+        print(f'{len(payload) / mb:>6.1f}MB {after["rows"]:>9,} | '
+              f'{before["written"] / mb:>13.1f}MB {before["read"] / mb:>6.1f}MB {before["ms"]:>6.0f}ms | '
+              f'{after["written"] / mb:>12.1f}MB {after["read"] / mb:>6.1f}MB {after["ms"]:>6.0f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Сборка волной против сборки по одному заказу (collection.build_wave).
+
+Генерирует N файлов заказов (сразу DataFrame — без записи xlsx) и
+планирует их двумя способами: каждый заказ отдельно (build_plan, как
+/api/process_collection по одному файлу) и одной волной. Считаются
+посещения коробок — сколько раз сборщик подходит к коробке — и время
+планирования без чтения Excel. Проверяется, что раскладка по ячейкам
+сходится со взятым из коробок.
+
+    python -m bench.wave --orders 50 --lines 200
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+import collection  # noqa: E402
+from bench import generate  # noqa: E402
+
+
+def plan_separately(db, frames, columns):
+    """Заказы по одному -> посещения коробок (сумма по заказам)"""
+    visits = 0
+    for df in frames:
+        plan, _, _ = collection.build_plan(db, df, *columns)
+        visits += len({line['box_id'] for line in plan})
+    return visits
+
+
+def demand_frames(frames, columns):
+    return [(f'order-{index + 1}.xlsx', collection.demand_frame(df, *columns)) for index, df in enumerate(frames)]
+
+
+def timed(func, *args, repeat=5):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(*args)
+        samples.append((time.perf_counter() - started) * 1000)
+    return result, statistics.median(samples)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Wave picking vs one order at a time')
+    parser.add_argument('--orders', type=int, default=50)
+    parser.add_argument('--lines', type=int, default=200, help='lines per order')
+    parser.add_argument('--zones', type=int, default=10)
+    parser.add_argument('--boxes-per-zone', type=int, default=20)
+    parser.add_argument('--items-per-box', type=int, default=20)
+    parser.add_argument('--format', choices=sorted(generate.ORDER_FORMATS), default='shk_excel')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix='warehouse-wave-') as workdir:
+        db_path = os.path.join(workdir, 'warehouse.db')
+        os.environ['WAREHOUSE_DB'] = db_path
+        import database
+        database.init_db()
+        warehouse = generate.generate_warehouse(db_path, zones=args.zones, boxes_per_zone=args.boxes_per_zone,
+                                                items_per_box=args.items_per_box, seed=args.seed)
+        db = sqlite3.connect(db_path)
+        db.row_factory = sqlite3.Row
+
+        columns = generate.ORDER_FORMATS[args.format]
+        frames = [generate.generate_order_frame(warehouse, args.format, lines=args.lines, seed=args.seed + index)
+                  for index in range(args.orders)]
+
+        separate_visits, separate_ms = timed(plan_separately, db, frames, columns)
+        orders, demand_ms = timed(demand_frames, frames, columns)
+        wave, wave_ms = timed(collection.build_wave, db, orders)
+        db.close()
+
+    taken = sum(line['take'] for line in wave['collection_plan'])
+    put = sum(slot['put'] for slot in wave['put_wall'])
+    if taken != put:
+        raise SystemExit(f'Put wall does not add up: {put} put vs {taken} taken')
+    if wave['separate_box_visits'] != separate_visits:
+        raise SystemExit(f'Visit counts differ: {wave["separate_box_visits"]} vs {separate_visits}')
+
+    print(f'{args.orders} orders x {args.lines} lines, {len(warehouse.barcodes):,} products in '
+          f'{args.zones * args.boxes_per_zone} boxes')
+    print()
+    print(f'{"":<22}{"box visits":>11}{"planning ms":>13}')
+    print(f'{"order by order":<22}{separate_visits:>11}{separate_ms:>13.0f}')
+    print(f'{"one wave":<22}{wave["box_visits"]:>11}{demand_ms + wave_ms:>13.0f}'
+          f'  (order files -> demand {demand_ms:.0f} ms, build_wave {wave_ms:.0f} ms)')
+    print()
+    print(f'visits saved: {wave["visits_saved"]} ({wave["visits_saved"] / max(separate_visits, 1):.0%}); '
+          f'{len(wave["collection_plan"]):,} pick lines, {taken:,} units into {len(wave["put_wall"])} slots')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""Справочник штрих-кодов для станций сканирования с локальным кэшем.
+
+Страница коробки (script.js) держит копию справочника в IndexedDB:
+название по штрих-коду берётся из неё, а не запросом к серверу на каждое
+сканирование. Копия догоняется по номеру изменения: каждая вставка,
+правка названия или штрих-кода и удаление товара триггером получает
+в ``catalog_changes`` следующий номер ``seq`` (одна строка на товар —
+последнее изменение). Клиент запрашивает изменения после своего номера;
+первый раз — с нуля, это полная выгрузка. Товары без штрих-кода
+и удалённые приходят как удалённые.
+
+Сканирования без сети копятся в очереди браузера и уходят пачкой в
+``apply_scans``. У каждого сканирования свой ключ идемпотентности: ключ
+занимается в ``idempotency_keys`` в той же транзакции, что и изменение
+остатка, поэтому повторно отправленное (ответ на прошлую отправку
+потерялся) не применяется дважды, как бы ни менялся состав пачки.
+"""
+import json
+import time
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS catalog_changes (
+        product_id INTEGER PRIMARY KEY,
+        seq INTEGER NOT NULL
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_catalog_changes_seq ON catalog_changes (seq);
+
+    CREATE TRIGGER IF NOT EXISTS trg_products_catalog_insert AFTER INSERT ON products
+    WHEN NEW.barcode IS NOT NULL
+    BEGIN
+        INSERT INTO catalog_changes (product_id, seq)
+        VALUES (NEW.id, (SELECT COALESCE(MAX(seq), 0) + 1 FROM catalog_changes))
+        ON CONFLICT (product_id) DO UPDATE SET seq = excluded.seq;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_products_catalog_update AFTER UPDATE OF name, barcode ON products
+    WHEN NEW.name IS NOT OLD.name OR NEW.barcode IS NOT OLD.barcode
+    BEGIN
+        INSERT INTO catalog_changes (product_id, seq)
+        VALUES (NEW.id, (SELECT COALESCE(MAX(seq), 0) + 1 FROM catalog_changes))
+        ON CONFLICT (product_id) DO UPDATE SET seq = excluded.seq;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_products_catalog_delete AFTER DELETE ON products
+    WHEN OLD.barcode IS NOT NULL
+    BEGIN
+        INSERT INTO catalog_changes (product_id, seq)
+        VALUES (OLD.id, (SELECT COALESCE(MAX(seq), 0) + 1 FROM catalog_changes))
+        ON CONFLICT (product_id) DO UPDATE SET seq = excluded.seq;
+    END;
+'''
+
+# Справочник до появления таблицы: номер изменения — id товара
+BACKFILL = 'INSERT INTO catalog_changes (product_id, seq) SELECT id, id FROM products WHERE barcode IS NOT NULL'
+
+CHANGES_QUERY = '''
+    SELECT c.seq, c.product_id, p.barcode, p.name
+    FROM catalog_changes c
+    LEFT JOIN products p ON p.id = c.product_id
+    WHERE c.seq > ?
+    ORDER BY c.seq
+    LIMIT ?
+'''
+
+PAGE_SIZE = 20000
+MAX_SCANS = 1000
+SCAN_ENDPOINT = 'scan'
+
+
+def init_catalog(db):
+    created = not db.execute("SELECT 1 FROM sqlite_master WHERE name = 'catalog_changes'").fetchone()
+    db.executescript(SCHEMA)
+    if created:
+        db.execute(BACKFILL)
+
+
+def latest_seq(db):
+    return db.execute('SELECT COALESCE(MAX(seq), 0) FROM catalog_changes').fetchone()[0]
+
+
+def changes(db, since=0, limit=PAGE_SIZE):
+    """Изменения справочника после since: [id, штрих-код, название] и id удалённых.
+
+    Номер since больше последнего (база восстановлена из копии) — ``reset``:
+    клиент очищает копию и выгружает справочник заново.
+    """
+    latest = latest_seq(db)
+    reset = since > latest
+    if reset:
+        since = 0
+    items, deleted = [], []
+    seq = since
+    for row in db.execute(CHANGES_QUERY, (since, limit)):
+        seq = row['seq']
+        if row['barcode'] is None:
+            deleted.append(row['product_id'])
+        else:
+            items.append([row['product_id'], row['barcode'], row['name']])
+    return {'seq': seq, 'latest': latest, 'more': seq < latest, 'reset': reset,
+            'items': items, 'deleted': deleted}
+
+
+def apply_scans(db, scans, upsert):
+    """Пачка сканирований из очереди станции; выполняется писателем (writer.py).
+
+    scans — [{key, box_id, barcode, product_name, quantity}], upsert(db, box_id,
+    product_name, barcode, quantity) — добавление в коробку. Возвращает ключи
+    применённых, уже применённых раньше и отклонённых (нет коробки, пустые
+    поля) — все они убираются из очереди.
+    """
+    result = {'applied': [], 'duplicates': [], 'rejected': []}
+    keys = [scan.get('key') for scan in scans]
+    seen = {row[0] for row in db.execute('''
+        SELECT key FROM idempotency_keys WHERE key IN (SELECT value FROM json_each(?))
+    ''', (json.dumps([key for key in keys if isinstance(key, str)]),))}
+    boxes = {row[0] for row in db.execute('''
+        SELECT id FROM boxes WHERE id IN (SELECT value FROM json_each(?))
+    ''', (json.dumps([scan.get('box_id') for scan in scans]),))}
+    now = time.time()
+    for scan, key in zip(scans, keys):
+        if not isinstance(key, str) or not key:
+            continue
+        if key in seen:
+            result['duplicates'].append(key)
+            continue
+        quantity = scan.get('quantity')
+        if (scan.get('box_id') not in boxes or not scan.get('barcode') or not scan.get('product_name')
+                or not isinstance(quantity, int) or quantity < 1):
+            result['rejected'].append(key)
+            continue
+        upsert(db, scan['box_id'], scan['product_name'], scan['barcode'], quantity)
+        db.execute('''
+            INSERT INTO idempotency_keys (key, endpoint, status, created_at) VALUES (?, ?, 200, ?)
+        ''', (key, SCAN_ENDPOINT, now))
+        seen.add(key)
+        result['applied'].append(key)
+    return result
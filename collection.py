@@ -0,0 +1,210 @@
+"""Сопоставление файла сборки с остатками склада.
+
+Спрос из файла и остатки из базы сводятся в два DataFrame и соединяются
+одним ``merge`` по штрих-коду вместо цикла по строкам файла. Повторяющиеся
+в файле штрих-коды суммируются до сопоставления: раньше каждая строка
+брала из коробки независимо, и один и тот же остаток мог попасть в план
+дважды.
+
+Волна (``build_wave``) — несколько заказов сразу: спрос всех заказов
+суммируется по штрих-коду, остатки распределяются один раз, сборщик
+проходит по объединению коробок один раз, а собранное раскладывается по
+ячейкам стены сортировки (одна ячейка на заказ). Нехватка достаётся
+заказам, загруженным позже.
+"""
+import json
+
+from lazy import LazyModule
+
+pd = LazyModule('pandas')
+
+# Позиции с остатком; при нескольких коробках с одним товаром берётся
+# последняя по id — как раньше, когда словарь перезаписывался по ходу выборки
+# (MAX(bi.id) в SQLite возвращает «голые» столбцы той же строки). Коробка и
+# зона соединяются до группировки: в старых базах до ``flask sweep-orphans``
+# остаются позиции удалённых коробок, и выбранная строка должна быть в
+# существующей коробке. Названия коробок, зон и товаров подтягиваются уже
+# к строкам плана.
+STOCK_QUERY = '''
+    SELECT MAX(bi.id) AS item_id, TRIM(p.barcode) AS barcode, bi.product_id,
+           bi.quantity AS available, bi.box_id
+    FROM box_items bi
+    JOIN products p ON bi.product_id = p.id
+    JOIN boxes b ON bi.box_id = b.id
+    JOIN zones z ON b.zone_id = z.id
+    WHERE bi.quantity > 0 AND p.barcode IS NOT NULL
+    GROUP BY bi.product_id
+'''
+
+BOXES_QUERY = '''
+    SELECT b.id AS box_id, b.name AS box, z.name AS zone
+    FROM boxes b
+    JOIN zones z ON b.zone_id = z.id
+'''
+
+# Поля строки плана в ответе /api/process_collection
+PLAN_FIELDS = ('barcode', 'article', 'product_name', 'needed', 'take',
+               'zone', 'box', 'remaining_after', 'item_id', 'box_id')
+
+
+def _first_values(df, column, first_rows):
+    """Значения столбца в первой строке каждого штрих-кода (None, если столбца нет)"""
+    if column is None or column not in df.columns:
+        return None
+    values = df.loc[first_rows, column]
+    return values.map(str, na_action='ignore').astype(object).where(values.notna(), None).tolist()
+
+
+def demand_frame(df, barcode_col, quantity_col, name_col=None, article_col=None):
+    """Спрос по штрих-кодам в порядке их первого появления в файле.
+
+    Строки без штрих-кода или положительного количества отбрасываются,
+    количества повторяющихся штрих-кодов суммируются; название и артикул
+    берутся из первой строки штрих-кода. Группировка идёт по исходным
+    значениям столбца, в строки переводятся только уникальные штрих-коды.
+    """
+    # Индекс файла может повторяться (склеенные листы) — нужен позиционный
+    df = df.reset_index(drop=True)
+    demand = pd.DataFrame({
+        'barcode': df[barcode_col],
+        'needed': pd.to_numeric(df[quantity_col], errors='coerce'),
+    })
+    demand = demand[demand['barcode'].notna() & demand['needed'].notna()]
+    if pd.api.types.is_float_dtype(demand['barcode']):
+        # Столбец штрих-кодов с пропусками Excel отдаёт как float: 4601234567890.0
+        demand['barcode'] = demand['barcode'].astype('int64')
+    # Дробные количества усекаются, как int() в прежнем цикле
+    demand['needed'] = demand['needed'].astype('int64')
+    demand = demand[demand['needed'] > 0]
+
+    needed = demand.groupby('barcode', sort=False)['needed'].sum()
+    first_rows = demand.drop_duplicates('barcode').index
+    result = pd.DataFrame({
+        'barcode': needed.index.astype(str).str.strip(),
+        'needed': needed.to_numpy(),
+        'product_name': _first_values(df, name_col, first_rows),
+        'article': _first_values(df, article_col, first_rows),
+    })
+    result = result[(result['barcode'] != '') & (result['barcode'] != 'nan')]
+    if not result['barcode'].is_unique:
+        # Штрих-коды, различавшиеся только пробелами по краям
+        result = result.groupby('barcode', sort=False).agg(
+            needed=('needed', 'sum'), product_name=('product_name', 'first'), article=('article', 'first')
+        ).reset_index()
+    return result
+
+
+def stock_frame(db):
+    return pd.read_sql_query(STOCK_QUERY, db)
+
+
+def _catalog_names(db, product_ids):
+    rows = db.execute(
+        'SELECT id, name FROM products WHERE id IN (SELECT value FROM json_each(?))',
+        (json.dumps(product_ids),)
+    ).fetchall()
+    return {row[0]: row[1] for row in rows}
+
+
+def match(db, demand, stock):
+    """План сборки: сколько взять из какой коробки по каждому штрих-коду спроса"""
+    plan = demand.merge(stock, on='barcode', how='inner', sort=False)
+    plan['take'] = plan['needed'].clip(upper=plan['available'])
+    plan['remaining_after'] = plan['available'] - plan['take']
+    plan = plan.merge(pd.read_sql_query(BOXES_QUERY, db), on='box_id', how='inner', sort=False)
+    # Без названия в файле берётся название из справочника
+    unnamed = plan['product_name'].isna()
+    if unnamed.any():
+        names = _catalog_names(db, plan.loc[unnamed, 'product_id'].tolist())
+        plan.loc[unnamed, 'product_name'] = plan.loc[unnamed, 'product_id'].map(names)
+    plan['article'] = plan['article'].fillna('')
+    return plan
+
+
+def plan_records(plan):
+    """Строки плана для JSON, собранные из столбцов (tolist даёт обычные int/str)"""
+    columns = [plan[field].tolist() for field in PLAN_FIELDS]
+    return [dict(zip(PLAN_FIELDS, values)) for values in zip(*columns)]
+
+
+def build_plan(db, df, barcode_col, quantity_col, name_col=None, article_col=None):
+    """(строки плана, всего нужно, всего взять)"""
+    if barcode_col is None or quantity_col is None:
+        return [], 0, 0
+    plan = match(db, demand_frame(df, barcode_col, quantity_col, name_col, article_col), stock_frame(db))
+    return plan_records(plan), int(plan['needed'].sum()), int(plan['take'].sum())
+
+
+# Поля строки раскладки заказа по ячейке стены сортировки
+PUT_FIELDS = ('barcode', 'article', 'product_name', 'needed', 'put', 'zone', 'box')
+
+
+def allocate(lines, plan):
+    """Раскладка собранного по заказам: строки заказов + сколько положить в ячейку.
+
+    Взятое по штрих-коду делится между заказами в порядке их загрузки —
+    накопленной суммой спроса внутри штрих-кода, без цикла по строкам.
+    """
+    picked = plan[['barcode', 'take', 'zone', 'box', 'box_id']]
+    # Левое соединение сохраняет порядок строк: заказы идут в порядке загрузки
+    lines = lines.merge(picked, on='barcode', how='left', sort=False)
+    lines['take'] = lines['take'].fillna(0).astype('int64')
+    # Спрос более ранних заказов по тому же штрих-коду
+    before = lines.groupby('barcode', sort=False)['needed'].cumsum() - lines['needed']
+    lines['put'] = (lines['take'] - before).clip(lower=0).clip(upper=lines['needed'])
+    lines['article'] = lines['article'].fillna('')
+    return lines
+
+
+def build_wave(db, orders):
+    """Волна из нескольких заказов.
+
+    orders — [(название, DataFrame спроса из demand_frame)]. Возвращает
+    словарь: строки плана сборки (как у build_plan — их принимает
+    /api/confirm_collection), раскладку по ячейкам и число посещений коробок
+    волной и заказами по отдельности.
+    """
+    lines = pd.concat([demand.assign(order=index) for index, (_, demand) in enumerate(orders)],
+                      ignore_index=True)
+    demand = lines.groupby('barcode', sort=False).agg(
+        needed=('needed', 'sum'), product_name=('product_name', 'first'), article=('article', 'first')
+    ).reset_index()
+    plan = match(db, demand, stock_frame(db))
+    lines = allocate(lines, plan)
+
+    # Каждый заказ отдельно заходил бы во все коробки своих штрих-кодов, что есть на складе
+    in_stock = lines[lines['box_id'].notna()]
+    order_visits = in_stock.groupby('order')['box_id'].nunique()
+
+    names = dict(zip(plan['barcode'], plan['product_name']))
+    lines['product_name'] = lines['product_name'].fillna(lines['barcode'].map(names))
+    # Столбцы переводятся в списки один раз для всей волны, строки раскладываются по заказам
+    columns = [lines[field].astype(object).where(lines[field].notna(), None).tolist() for field in PUT_FIELDS]
+    order_lines = [[] for _ in orders]
+    for index, values in zip(lines['order'].tolist(), zip(*columns)):
+        order_lines[index].append(dict(zip(PUT_FIELDS, values)))
+    totals = lines.groupby('order')[['needed', 'put']].sum()
+
+    put_wall = []
+    for index, (name, _) in enumerate(orders):
+        # Заказ без строк с количеством тоже получает ячейку — пустую
+        put_wall.append({
+            'slot': index + 1,
+            'order': name,
+            'needed': int(totals['needed'].get(index, 0)),
+            'put': int(totals['put'].get(index, 0)),
+            'box_visits': int(order_visits.get(index, 0)),
+            'lines': order_lines[index],
+        })
+
+    separate_visits = int(order_visits.sum())
+    wave_visits = int(plan['box_id'].nunique())
+    return {
+        'collection_plan': plan_records(plan),
+        'total_needed': int(plan['needed'].sum()),
+        'total_to_take': int(plan['take'].sum()),
+        'put_wall': put_wall,
+        'box_visits': wave_visits,
+        'separate_box_visits': separate_visits,
+        'visits_saved': separate_visits - wave_visits,
+    }
@@ -0,0 +1,42 @@
+"""Сжатие gzip ответов JSON, HTML и статики.
+
+Ответ сжимается, если клиент принимает gzip, тип текстовый и тело не
+меньше MIN_SIZE. Потоковые ответы и файлы выгрузок (xlsx уже сжат)
+не трогаются.
+"""
+import gzip
+
+from flask import request
+
+COMPRESSIBLE_TYPES = {
+    'application/json', 'text/html', 'text/css', 'text/plain',
+    'application/javascript', 'text/javascript', 'image/svg+xml',
+}
+MIN_SIZE = 500
+COMPRESS_LEVEL = 6
+
+
+def init_compression(app):
+    @app.after_request
+    def compress_response(response):
+        if (response.status_code != 200
+                or response.mimetype not in COMPRESSIBLE_TYPES
+                or 'Content-Encoding' in response.headers
+                or (response.is_streamed and not response.direct_passthrough)
+                or 'gzip' not in request.headers.get('Accept-Encoding', '').lower()):
+            return response
+
+        # Статика отдаётся через send_file; её тело нужно прочитать
+        response.direct_passthrough = False
+        data = response.get_data()
+        if len(data) < MIN_SIZE:
+            return response
+
+        response.set_data(gzip.compress(data, compresslevel=COMPRESS_LEVEL))
+        response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+        # Сжатое тело отличается по байтам: строгий ETag становится слабым
+        etag, _ = response.get_etag()
+        if etag:
+            response.set_etag(etag, weak=True)
+        return response
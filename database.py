@@ -1,12 +1,70 @@
+import contextvars
+import os
 import sqlite3
 
-def get_db():
-    conn = sqlite3.connect('warehouse.db')
+DB_PATH = os.environ.get('WAREHOUSE_DB', 'warehouse.db')
+
+
+def _parse_sites(value, directory):
+    """'msk,spb=/data/spb.db' -> {'msk': '<directory>/warehouse-msk.db', 'spb': '/data/spb.db'}"""
+    sites = {}
+    for entry in filter(None, (part.strip() for part in value.split(','))):
+        name, _, path = entry.partition('=')
+        name = name.strip()
+        sites[name] = path.strip() or os.path.join(directory, f'warehouse-{name}.db')
+    return sites
+
+
+# Несколько складов (sites.py): у каждой площадки свой файл базы и свой писатель.
+# Без WAREHOUSE_SITES работает одна база DB_PATH, как раньше
+SITES = _parse_sites(os.environ.get('WAREHOUSE_SITES', ''),
+                     os.environ.get('WAREHOUSE_SITE_DIR') or os.path.dirname(DB_PATH) or '.')
+DEFAULT_SITE = next(iter(SITES), None)
+
+# Площадка текущего запроса; выставляется в sites.py
+current_site = contextvars.ContextVar('warehouse_site', default=None)
+
+# Колбэки, вызываемые для каждого нового соединения: hook(conn, path)
+connection_hooks = []
+
+def db_path(site=None):
+    """Файл базы площадки site (по умолчанию — текущей)"""
+    if not SITES:
+        return DB_PATH
+    site = site or current_site.get() or DEFAULT_SITE
+    try:
+        return SITES[site]
+    except KeyError:
+        raise LookupError(f'Unknown site: {site}') from None
+
+def shard_paths():
+    return list(SITES.values()) or [DB_PATH]
+
+def connect(path, **kwargs):
+    conn = sqlite3.connect(path, **kwargs)
     conn.row_factory = sqlite3.Row
+    for hook in connection_hooks:
+        hook(conn, path)
     return conn
 
-def init_db():
-    db = get_db()
+def get_db(site=None):
+    return connect(db_path(site))
+
+def init_db(site=None):
+    if site is None and SITES:
+        # Схема создаётся и обновляется в каждом шарде
+        for name in SITES:
+            init_db(name)
+        return
+    db = get_db(site)
+    
+    # Новая база: освобождённые страницы возвращаются файлу по частям (maintenance.py).
+    # auto_vacuum меняется только до создания первой таблицы
+    if db.execute('PRAGMA page_count').fetchone()[0] == 0:
+        db.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    
+    # WAL: читатели не блокируют писателя (writer.py) и наоборот
+    db.execute('PRAGMA journal_mode = WAL')
     
     # Таблица зон
     db.execute('''
@@ -30,16 +88,26 @@ def init_db():
         )
     ''')
     
+    # Справочник товаров: box_items и receipt_items ссылаются на него по product_id
+    from products import LEGACY_TABLES, copy_legacy, detach_legacy, init_products, is_legacy
+    init_products(db)
+    legacy = [table for table in LEGACY_TABLES if is_legacy(db, table)]
+    if legacy:
+        # Перенос одной транзакцией: при сбое база остаётся в старом виде
+        db.execute('BEGIN IMMEDIATE')
+    for table in legacy:
+        detach_legacy(db, table)
+    
     # Таблица товаров в коробках
     db.execute('''
         CREATE TABLE IF NOT EXISTS box_items (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             box_id INTEGER NOT NULL,
-            product_name TEXT NOT NULL,
-            barcode TEXT,
+            product_id INTEGER NOT NULL,
             quantity INTEGER NOT NULL DEFAULT 1,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (box_id) REFERENCES boxes (id)
+            FOREIGN KEY (box_id) REFERENCES boxes (id),
+            FOREIGN KEY (product_id) REFERENCES products (id)
         )
     ''')
     
@@ -61,14 +129,74 @@ def init_db():
         CREATE TABLE IF NOT EXISTS receipt_items (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             receipt_id INTEGER NOT NULL,
-            product_name TEXT NOT NULL,
-            barcode TEXT,
+            product_id INTEGER NOT NULL,
             quantity INTEGER NOT NULL DEFAULT 1,
             box_name TEXT,
             zone_name TEXT,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (receipt_id) REFERENCES receipts (id) ON DELETE CASCADE
+            FOREIGN KEY (receipt_id) REFERENCES receipts (id) ON DELETE CASCADE,
+            FOREIGN KEY (product_id) REFERENCES products (id)
         )
     ''')
     
-    db.commit()
\ No newline at end of file
+    # Перенос данных из таблиц, созданных до справочника
+    if 'box_items' in legacy:
+        copy_legacy(db, 'box_items', ['id', 'box_id', 'quantity', 'created_at'])
+    if 'receipt_items' in legacy:
+        copy_legacy(db, 'receipt_items', ['id', 'receipt_id', 'quantity', 'box_name', 'zone_name', 'created_at'])
+    
+    # Поиск позиции по товару в коробке при каждом сканировании
+    db.execute('CREATE INDEX IF NOT EXISTS idx_box_items_box_product ON box_items (box_id, product_id)')
+    # Каскадное удаление и выборки по зоне/приёмке (box_id покрывает idx_box_items_box_product)
+    db.execute('CREATE INDEX IF NOT EXISTS idx_boxes_zone ON boxes (zone_id)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_receipt_items_receipt ON receipt_items (receipt_id)')
+    # Список приёмок постранично, новые первыми, и фильтр по датам
+    db.execute('CREATE INDEX IF NOT EXISTS idx_receipts_date ON receipts (receipt_date, created_at)')
+    # Позиции и строки приёмок по товару (поиск, сборка)
+    db.execute('CREATE INDEX IF NOT EXISTS idx_box_items_product ON box_items (product_id)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_receipt_items_product ON receipt_items (product_id)')
+    # Только позиции с остатком — для поиска и сборки, которые нулевые строки не смотрят
+    db.execute('''
+        CREATE INDEX IF NOT EXISTS idx_box_items_in_stock ON box_items (product_id, box_id, quantity)
+        WHERE quantity > 0
+    ''')
+    
+    # Журнал движений остатков (триггеры на box_items)
+    from ledger import init_ledger
+    init_ledger(db)
+    
+    # Полнотекстовый поиск по товарам (FTS5)
+    from search import init_search
+    init_search(db)
+    
+    # Расписание и журнал обслуживания
+    from maintenance import init_maintenance
+    init_maintenance(db)
+    
+    # Журнал изменений для живого обновления страниц (триггеры)
+    from events import init_events
+    init_events(db)
+    
+    # Ключи идемпотентности изменяющих запросов
+    from idempotency import init_idempotency
+    init_idempotency(db)
+    
+    # Сессии инвентаризации и их сканирования
+    from stocktake import init_stocktake
+    init_stocktake(db)
+    
+    # Пороги пополнения, остатки по товарам (триггеры) и расход по сборкам
+    from replenishment import init_replenishment
+    init_replenishment(db)
+    
+    # Граница архива старых приёмок (archive.py)
+    from archive import init_archive
+    init_archive(db)
+    
+    # Номера изменений справочника штрих-кодов для кэша станций (триггеры)
+    from catalog import init_catalog
+    init_catalog(db)
+    
+    db.commit()
+    # Соединение не должно пережить fork воркеров (serve.py)
+    db.close()
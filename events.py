@@ -0,0 +1,317 @@
+"""Поток изменений для живого обновления страниц (Server-Sent Events).
+
+Триггеры пишут каждое изменение позиций, коробок, зон и товаров в
+``change_events`` в той же транзакции, что и само изменение, — кто бы ни
+писал: любой воркер, импорт, сборка. В каждом процессе на шард работает
+один поток (``Broadcaster``): он читает новые строки журнала, одним
+запросом на вид сущности подтягивает их текущее состояние и раздаёт
+пачку всем подписчикам ``/api/events``. Станции получают готовые данные
+и правят страницу на месте, а число запросов к базе не зависит от числа
+открытых станций.
+
+Клиент передаёт номер последнего полученного события (``Last-Event-ID``
+при переподключении или ``last_event_id``, записанный в страницу при
+отрисовке) — пропущенное досылается из журнала. Если эти события уже
+удалены, приходит событие ``reset`` и страница перезагружается.
+"""
+import json
+import os
+import queue
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+
+import database
+import writer
+
+# Изменения из других процессов замечаются опросом журнала; записи своего
+# процесса (writer.py) будят поток сразу после фиксации
+POLL_INTERVAL = float(os.environ.get('WAREHOUSE_EVENTS_POLL_MS', '250')) / 1000
+HEARTBEAT = 15
+BATCH = 1000
+KEEP_HOURS = float(os.environ.get('WAREHOUSE_EVENTS_KEEP_HOURS', '24'))
+PRUNE_BATCH = 5000
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS change_events (
+        id INTEGER PRIMARY KEY,
+        entity TEXT NOT NULL,
+        entity_id INTEGER NOT NULL,
+        parent_id INTEGER,
+        deleted INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE TRIGGER IF NOT EXISTS trg_box_items_events_insert AFTER INSERT ON box_items
+    BEGIN
+        INSERT INTO change_events (entity, entity_id, parent_id) VALUES ('item', NEW.id, NEW.box_id);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_box_items_events_update AFTER UPDATE ON box_items
+    BEGIN
+        INSERT INTO change_events (entity, entity_id, parent_id) VALUES ('item', NEW.id, NEW.box_id);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_box_items_events_delete AFTER DELETE ON box_items
+    BEGIN
+        INSERT INTO change_events (entity, entity_id, parent_id, deleted) VALUES ('item', OLD.id, OLD.box_id, 1);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_boxes_events_insert AFTER INSERT ON boxes
+    BEGIN
+        INSERT INTO change_events (entity, entity_id, parent_id) VALUES ('box', NEW.id, NEW.zone_id);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_boxes_events_update AFTER UPDATE ON boxes
+    BEGIN
+        INSERT INTO change_events (entity, entity_id, parent_id) VALUES ('box', NEW.id, NEW.zone_id);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_boxes_events_delete AFTER DELETE ON boxes
+    BEGIN
+        INSERT INTO change_events (entity, entity_id, parent_id, deleted) VALUES ('box', OLD.id, OLD.zone_id, 1);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_zones_events_insert AFTER INSERT ON zones
+    BEGIN
+        INSERT INTO change_events (entity, entity_id) VALUES ('zone', NEW.id);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_zones_events_update AFTER UPDATE ON zones
+    BEGIN
+        INSERT INTO change_events (entity, entity_id) VALUES ('zone', NEW.id);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_zones_events_delete AFTER DELETE ON zones
+    BEGIN
+        INSERT INTO change_events (entity, entity_id, deleted) VALUES ('zone', OLD.id, 1);
+    END;
+
+    -- Название и штрих-код товара показываются во всех его позициях
+    CREATE TRIGGER IF NOT EXISTS trg_products_events_update AFTER UPDATE OF name, barcode ON products
+    BEGIN
+        INSERT INTO change_events (entity, entity_id) VALUES ('product', NEW.id);
+    END;
+'''
+
+# Текущее состояние изменившихся строк, по одному запросу на вид сущности
+STATE_QUERIES = {
+    'item': '''
+        SELECT bi.id, bi.box_id, bi.product_id, bi.quantity, p.name AS product_name, p.barcode
+        FROM box_items bi JOIN products p ON bi.product_id = p.id
+        WHERE bi.id IN (SELECT value FROM json_each(?))
+    ''',
+    'box': 'SELECT id, zone_id, name, description FROM boxes WHERE id IN (SELECT value FROM json_each(?))',
+    'zone': 'SELECT id, name, description FROM zones WHERE id IN (SELECT value FROM json_each(?))',
+    'product': 'SELECT id, name, barcode FROM products WHERE id IN (SELECT value FROM json_each(?))',
+}
+# Для удалённых строк известен только родитель из журнала
+PARENT_FIELDS = {'item': 'box_id', 'box': 'zone_id'}
+
+
+def init_events(db):
+    db.executescript(SCHEMA)
+
+
+def last_event_id(db):
+    """Номер последнего события — записывается в страницу, с него начинается поток"""
+    return db.execute('SELECT COALESCE(MAX(id), 0) FROM change_events').fetchone()[0]
+
+
+def read_events(conn, after_id, limit=BATCH):
+    return conn.execute('''
+        SELECT id, entity, entity_id, parent_id, deleted FROM change_events
+        WHERE id > ? ORDER BY id LIMIT ?
+    ''', (after_id, limit)).fetchall()
+
+
+def load_events(conn, rows):
+    """Строки журнала -> события с текущим состоянием сущностей.
+
+    Несколько изменений одной сущности в пачке сворачиваются в одно —
+    последнее состояние; повторное применение события клиентом безвредно.
+    """
+    latest = {}
+    for row in rows:
+        key = (row['entity'], row['entity_id'])
+        latest.pop(key, None)
+        latest[key] = row
+
+    ids = {}
+    for entity, entity_id in latest:
+        ids.setdefault(entity, []).append(entity_id)
+    states = {}
+    for entity, entity_ids in ids.items():
+        for state in conn.execute(STATE_QUERIES[entity], (json.dumps(entity_ids),)):
+            states[entity, state['id']] = dict(state)
+
+    result = []
+    for key, row in latest.items():
+        state = states.get(key)
+        if state is None:
+            # Удалена (в том числе уже после того, как изменение попало в журнал)
+            event = {'id': row['entity_id'], 'deleted': True}
+            if row['entity'] in PARENT_FIELDS:
+                event[PARENT_FIELDS[row['entity']]] = row['parent_id']
+        else:
+            event = dict(state, deleted=False)
+        event['type'] = row['entity']
+        result.append(event)
+    return result
+
+
+def format_message(message_id, events):
+    return f'id: {message_id}\ndata: {json.dumps(events, ensure_ascii=False)}\n\n'
+
+
+class Broadcaster:
+    """Раздаёт изменения одного шарда подписчикам в этом процессе"""
+
+    def __init__(self, path, poll_interval=POLL_INTERVAL):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.polls = 0
+        self.messages = 0
+
+    def subscribe(self):
+        self._ensure_started()
+        subscription = queue.Queue()
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def notify(self):
+        self._wake.set()
+
+    def _ensure_started(self):
+        # После fork поток родителя в дочернем процессе не существует
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._subscribers = set()
+                self._pid = os.getpid()
+                conn = database.connect(self.path, check_same_thread=False)
+                self._thread = threading.Thread(target=self._run, args=(conn, last_event_id(conn)),
+                                                name=f'events:{self.path}', daemon=True)
+                self._thread.start()
+
+    def _run(self, conn, after_id):
+        # Опрос идёт и без подписчиков: иначе подключившийся позже получил бы старую пачку
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                self.polls += 1
+                rows = read_events(conn, after_id)
+                while rows:
+                    after_id = rows[-1]['id']
+                    message = (rows[0]['id'], after_id, load_events(conn, rows))
+                    with self._lock:
+                        subscribers = list(self._subscribers)
+                    for subscription in subscribers:
+                        subscription.put(message)
+                    self.messages += 1
+                    rows = read_events(conn, after_id) if len(rows) == BATCH else None
+            except sqlite3.Error as e:
+                print(f'Change events failed for {self.path}: {e}')
+
+
+_broadcasters = {}
+_broadcasters_lock = threading.Lock()
+
+
+def get_broadcaster(path=None):
+    path = path or database.db_path()
+    broadcaster = _broadcasters.get(path)
+    if broadcaster is None:
+        with _broadcasters_lock:
+            broadcaster = _broadcasters.setdefault(path, Broadcaster(path))
+    return broadcaster
+
+
+def _notify_after_commit(path):
+    broadcaster = _broadcasters.get(path)
+    if broadcaster is not None:
+        broadcaster.notify()
+
+
+writer.commit_hooks.append(_notify_after_commit)
+
+
+def stream(path, last_id):
+    """Генератор ответа text/event-stream: досылка пропущенного, затем живые события"""
+    broadcaster = get_broadcaster(path)
+    # Подписка до досылки: всё, что появится во время неё, останется в очереди
+    subscription = broadcaster.subscribe()
+    try:
+        yield 'retry: 3000\n\n'
+        conn = database.connect(path)
+        try:
+            bounds = conn.execute('SELECT MIN(id), COALESCE(MAX(id), 0) FROM change_events').fetchone()
+            if last_id > bounds[1] or (bounds[0] is not None and last_id < bounds[0] - 1):
+                # Журнал очищен дальше, чем видел клиент, или база заменена копией
+                yield 'event: reset\ndata: {}\n\n'
+                return
+            rows = read_events(conn, last_id)
+            while rows:
+                last_id = rows[-1]['id']
+                yield format_message(last_id, load_events(conn, rows))
+                rows = read_events(conn, last_id)
+        finally:
+            conn.close()
+
+        while True:
+            try:
+                _, message_id, payload = subscription.get(timeout=HEARTBEAT)
+            except queue.Empty:
+                # Комментарий держит соединение и обнаруживает ушедших клиентов
+                yield ': keepalive\n\n'
+                continue
+            if message_id <= last_id:
+                continue
+            last_id = message_id
+            yield format_message(message_id, payload)
+    finally:
+        broadcaster.unsubscribe(subscription)
+
+
+def _delete_before(conn, before_id):
+    return conn.execute('''
+        DELETE FROM change_events WHERE id IN (
+            SELECT id FROM change_events WHERE id < ? ORDER BY id LIMIT ?
+        )
+    ''', (before_id, PRUNE_BATCH)).rowcount
+
+
+def prune(path, keep_hours=KEEP_HOURS):
+    """Удаляет события старше keep_hours; последнее событие остаётся всегда,
+    чтобы номера не начались заново"""
+    cutoff = (datetime.now(timezone.utc) - timedelta(hours=keep_hours)).strftime('%Y-%m-%d %H:%M:%S')
+    conn = sqlite3.connect(path)
+    try:
+        # Номера растут вместе со временем: граница — первое событие не старше cutoff
+        row = conn.execute('SELECT id FROM change_events WHERE created_at >= ? ORDER BY id LIMIT 1',
+                           (cutoff,)).fetchone()
+        before_id = row[0] if row else conn.execute('SELECT COALESCE(MAX(id), 0) FROM change_events').fetchone()[0]
+    finally:
+        conn.close()
+
+    coalescer = writer.get_writer(path)
+    deleted = 0
+    while True:
+        # Порциями, чтобы между ними проходили сканирования
+        count = coalescer.submit(_delete_before, before_id)
+        deleted += count
+        if count < PRUNE_BATCH:
+            break
+    return {'deleted_events': deleted} if deleted else None
@@ -0,0 +1,219 @@
+"""Ключи идемпотентности для изменяющих запросов.
+
+Клиент (script.js) при сетевой ошибке повторяет запрос с тем же
+заголовком ``Idempotency-Key``. Первый запрос занимает ключ в
+``idempotency_keys`` (вставка по первичному ключу через писателя),
+выполняется и сохраняет свой ответ; повтор получает сохранённый ответ с
+заголовком ``Idempotent-Replayed: true`` и ничего не применяет заново.
+Пока первый запрос ещё выполняется, повтор получает 409 и пробует позже.
+Ответ 5xx или исключение освобождают ключ — такой запрос можно повторить.
+
+Каждая запись запроса через писателя (``writer.submit``) в той же
+транзакции сохраняет под ключом свой результат — шаг по порядку вызова.
+Если процесс упал после записи, но до сохранения ответа, ключ остаётся
+занятым без ответа; через ``PENDING_TIMEOUT`` секунд
+(``WAREHOUSE_IDEMPOTENCY_PENDING_SECONDS``) повтор занимает его заново
+и выполняет запрос, но уже выполненные шаги не применяются второй раз:
+писатель возвращает их сохранённый результат, и ответ получается тем же.
+Поэтому изменяющие запросы пишут только через писателя.
+
+Ответы последних ключей держатся в LRU процесса: повтор, попавший в тот
+же воркер, базу не трогает, в другой — одна вставка по первичному ключу.
+Ключи старше ``KEY_TTL_HOURS`` удаляет задача обслуживания
+``prune_idempotency_keys`` (maintenance.py).
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, jsonify, make_response, request
+
+import database
+import writer
+
+KEY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 128
+KEY_TTL_HOURS = float(os.environ.get('WAREHOUSE_IDEMPOTENCY_TTL_HOURS', '24'))
+CACHE_SIZE = int(os.environ.get('WAREHOUSE_IDEMPOTENCY_CACHE', '4096'))
+PENDING_TIMEOUT = float(os.environ.get('WAREHOUSE_IDEMPOTENCY_PENDING_SECONDS', '120'))
+PRUNE_BATCH = 1000
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS idempotency_keys (
+        key TEXT PRIMARY KEY,
+        endpoint TEXT NOT NULL,
+        status INTEGER,
+        response TEXT,
+        results TEXT,
+        created_at REAL NOT NULL
+    ) WITHOUT ROWID;
+'''
+
+
+def init_idempotency(db):
+    db.executescript(SCHEMA)
+    # Базы, созданные до сохранения результатов шагов
+    if 'results' not in {row[1] for row in db.execute('PRAGMA table_info(idempotency_keys)')}:
+        db.execute('ALTER TABLE idempotency_keys ADD COLUMN results TEXT')
+
+
+class ResponseCache:
+    """LRU сохранённых ответов: (файл базы, ключ) -> (endpoint, status, тело)"""
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+
+_cache = ResponseCache()
+
+
+# Операции писателя (writer.py)
+
+def _claim(conn, key, endpoint, now):
+    """None — ключ занят этим запросом; иначе сохранённое состояние (endpoint, status, тело)
+
+    Ключ без ответа старше PENDING_TIMEOUT (запрос не завершился — процесс
+    упал) занимается заново.
+    """
+    claimed = conn.execute('''
+        INSERT INTO idempotency_keys (key, endpoint, created_at) VALUES (?, ?, ?)
+        ON CONFLICT (key) DO UPDATE SET created_at = excluded.created_at
+        WHERE status IS NULL AND endpoint = excluded.endpoint AND created_at < ?
+    ''', (key, endpoint, now, now - PENDING_TIMEOUT)).rowcount
+    if claimed:
+        return None
+    row = conn.execute('SELECT endpoint, status, response FROM idempotency_keys WHERE key = ?', (key,)).fetchone()
+    return tuple(row)
+
+
+def _store(conn, key, status, body):
+    conn.execute('UPDATE idempotency_keys SET status = ?, response = ?, results = NULL WHERE key = ?',
+                 (status, body, key))
+
+
+def _release(conn, key):
+    # Ключ с выполненными шагами не удаляется, а сразу отдаётся повтору:
+    # иначе повтор применил бы эти шаги второй раз
+    conn.execute('DELETE FROM idempotency_keys WHERE key = ? AND status IS NULL AND results IS NULL', (key,))
+    conn.execute('UPDATE idempotency_keys SET created_at = 0 WHERE key = ? AND status IS NULL', (key,))
+
+
+class _Steps:
+    """Обёртка записей запроса через писателя (writer.operation_wrapper)"""
+
+    def __init__(self, key):
+        self.key = key
+        self.count = 0
+
+    def __call__(self, fn):
+        step = str(self.count)
+        self.count += 1
+        key = self.key
+
+        def run(conn, *args):
+            row = conn.execute('SELECT results FROM idempotency_keys WHERE key = ?', (key,)).fetchone()
+            results = json.loads(row[0]) if row and row[0] else {}
+            if step in results:
+                return results[step]
+            result = fn(conn, *args)
+            conn.execute('''
+                UPDATE idempotency_keys SET results = json_set(COALESCE(results, '{}'), ?, json(?)) WHERE key = ?
+            ''', (f'$."{step}"', json.dumps(result), key))
+            return result
+        return run
+
+
+def _replay(endpoint, state):
+    stored_endpoint, status, body = state
+    if stored_endpoint != endpoint:
+        return jsonify({'success': False, 'error': 'Idempotency-Key was already used for another request'}), 422
+    if status is None:
+        return jsonify({'success': False, 'error': 'A request with this Idempotency-Key is still in progress'}), 409
+    response = current_app.response_class(body, status=status, mimetype='application/json')
+    response.headers[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def idempotent(view):
+    """Повтор запроса с тем же Idempotency-Key возвращает первый ответ, не выполняя view снова"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(KEY_HEADER)
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({'success': False, 'error': f'Idempotency-Key longer than {MAX_KEY_LENGTH} characters'}), 400
+
+        endpoint = f'{request.method} {request.path}'
+        path = database.db_path()
+        cached = _cache.get((path, key))
+        if cached is not None:
+            return _replay(endpoint, cached)
+
+        coalescer = writer.get_writer(path)
+        state = coalescer.submit(_claim, key, endpoint, time.time())
+        if state is not None:
+            if state[1] is not None:
+                _cache.put((path, key), state)
+            return _replay(endpoint, state)
+
+        try:
+            token = writer.operation_wrapper.set(_Steps(key))
+            try:
+                response = make_response(view(*args, **kwargs))
+            finally:
+                writer.operation_wrapper.reset(token)
+        except Exception:
+            coalescer.submit(_release, key)
+            raise
+        if response.status_code >= 500 or response.mimetype != 'application/json':
+            coalescer.submit(_release, key)
+            return response
+
+        body = response.get_data(as_text=True)
+        coalescer.submit(_store, key, response.status_code, body)
+        _cache.put((path, key), (endpoint, response.status_code, body))
+        return response
+    return wrapper
+
+
+def _delete_keys(conn, keys):
+    return conn.execute('DELETE FROM idempotency_keys WHERE key IN (SELECT value FROM json_each(?))',
+                        (json.dumps(keys),)).rowcount
+
+
+def prune(path, ttl_hours=KEY_TTL_HOURS):
+    """Удаляет ключи старше ttl_hours: выборка одним проходом, удаление порциями через писателя"""
+    before = time.time() - ttl_hours * 3600
+    conn = sqlite3.connect(path)
+    try:
+        keys = [row[0] for row in conn.execute('SELECT key FROM idempotency_keys WHERE created_at < ?', (before,))]
+    finally:
+        conn.close()
+
+    coalescer = writer.get_writer(path)
+    deleted = 0
+    for start in range(0, len(keys), PRUNE_BATCH):
+        deleted += coalescer.submit(_delete_keys, keys[start:start + PRUNE_BATCH])
+    return {'deleted_keys': deleted} if deleted else None
@@ -0,0 +1,43 @@
+"""Отложенный импорт тяжёлых зависимостей.
+
+pandas (а через него openpyxl) нужен только импорту, выгрузкам и сборке
+заказов, но его импорт стоит сотни миллисекунд и десятки мегабайт в каждом
+воркере. ``LazyModule`` подставляется вместо модуля и импортирует его при
+первом обращении к атрибуту — воркеры, обслуживающие только сканирование,
+pandas не загружают вовсе.
+
+    pd = LazyModule('pandas')
+"""
+import importlib
+import threading
+
+
+class LazyModule:
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+        self.__dict__['_lock'] = threading.Lock()
+
+    def _load(self):
+        # Потоки gthread-воркера могут обратиться к модулю одновременно
+        with self._lock:
+            if self._module is None:
+                self.__dict__['_module'] = importlib.import_module(self._name)
+        return self._module
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def __getattr__(self, attr):
+        value = getattr(self._module or self._load(), attr)
+        # Следующие обращения (pd.isna в циклах импорта) идут мимо __getattr__
+        self.__dict__[attr] = value
+        return value
+
+    def __setattr__(self, attr, value):
+        setattr(self._module or self._load(), attr, value)
+
+    def __repr__(self):
+        state = 'loaded' if self.loaded else 'not loaded'
+        return f'<lazy module {self._name!r} ({state})>'
@@ -0,0 +1,208 @@
+"""Журнал движений остатков и контрольные точки.
+
+Каждое изменение ``box_items.quantity`` (или перенос позиции в другую
+коробку) триггерами записывается в ``stock_movements`` в той же
+транзакции. Периодически создаются контрольные точки — снимки остатков
+на момент определённого движения, — так что остаток «на момент T»
+считается от ближайшей предшествующей точки плюс ограниченный хвост
+движений, а не перебором всей истории.
+"""
+import os
+import sqlite3
+
+import database
+from products import copy_legacy, detach_legacy, has_detached, is_legacy
+
+# Новая контрольная точка, когда после предыдущей накопилось столько движений
+CHECKPOINT_EVERY = int(os.environ.get('WAREHOUSE_LEDGER_CHECKPOINT_EVERY', '50000'))
+CHECK_INTERVAL = float(os.environ.get('WAREHOUSE_LEDGER_CHECK_INTERVAL', '60'))
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS stock_movements (
+        id INTEGER PRIMARY KEY,
+        item_id INTEGER NOT NULL,
+        box_id INTEGER NOT NULL,
+        product_id INTEGER,
+        delta INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_stock_movements_created ON stock_movements (created_at);
+
+    CREATE TABLE IF NOT EXISTS stock_checkpoints (
+        id INTEGER PRIMARY KEY,
+        last_movement_id INTEGER NOT NULL,
+        created_at TIMESTAMP NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_stock_checkpoints_created ON stock_checkpoints (created_at);
+
+    CREATE TABLE IF NOT EXISTS stock_checkpoint_items (
+        checkpoint_id INTEGER NOT NULL,
+        item_id INTEGER NOT NULL,
+        box_id INTEGER NOT NULL,
+        product_id INTEGER,
+        quantity INTEGER NOT NULL,
+        PRIMARY KEY (checkpoint_id, item_id, box_id)
+    ) WITHOUT ROWID;
+
+    CREATE TRIGGER IF NOT EXISTS trg_box_items_ledger_insert
+    AFTER INSERT ON box_items WHEN NEW.quantity != 0
+    BEGIN
+        INSERT INTO stock_movements (item_id, box_id, product_id, delta)
+        VALUES (NEW.id, NEW.box_id, NEW.product_id, NEW.quantity);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_box_items_ledger_update
+    AFTER UPDATE OF quantity ON box_items
+    WHEN NEW.box_id = OLD.box_id AND NEW.quantity != OLD.quantity
+    BEGIN
+        INSERT INTO stock_movements (item_id, box_id, product_id, delta)
+        VALUES (NEW.id, NEW.box_id, NEW.product_id, NEW.quantity - OLD.quantity);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_box_items_ledger_move
+    AFTER UPDATE OF box_id, quantity ON box_items
+    WHEN NEW.box_id != OLD.box_id
+    BEGIN
+        INSERT INTO stock_movements (item_id, box_id, product_id, delta)
+        VALUES (OLD.id, OLD.box_id, OLD.product_id, -OLD.quantity);
+        INSERT INTO stock_movements (item_id, box_id, product_id, delta)
+        VALUES (NEW.id, NEW.box_id, NEW.product_id, NEW.quantity);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_box_items_ledger_delete
+    AFTER DELETE ON box_items WHEN OLD.quantity != 0
+    BEGIN
+        INSERT INTO stock_movements (item_id, box_id, product_id, delta)
+        VALUES (OLD.id, OLD.box_id, OLD.product_id, -OLD.quantity);
+    END;
+'''
+
+# Состояние на момент T: строки ближайшей контрольной точки + движения после неё.
+# Хвост движений — диапазон id от точки до первого движения позже T (поиск по
+# индексу created_at), поэтому его длина не зависит от размера всей истории.
+# Товар берётся из последней записи (MAX(seq) в SQLite возвращает «голые»
+# столбцы той же строки).
+AS_OF_QUERY = '''
+    WITH cp AS (
+        SELECT id, last_movement_id FROM stock_checkpoints
+        WHERE created_at <= :at AND :use_checkpoints
+        ORDER BY created_at DESC, id DESC
+        LIMIT 1
+    ),
+    bounds AS (
+        SELECT
+            COALESCE((SELECT last_movement_id FROM cp), 0) AS after_id,
+            MIN(:upto, COALESCE((SELECT id - 1 FROM stock_movements WHERE created_at > :at
+                                 ORDER BY created_at, id LIMIT 1), :upto)) AS upto_id
+    ),
+    state AS (
+        SELECT item_id, box_id, product_id, quantity, 0 AS seq
+        FROM stock_checkpoint_items
+        WHERE checkpoint_id = (SELECT id FROM cp)
+        UNION ALL
+        SELECT item_id, box_id, product_id, delta, id
+        FROM stock_movements
+        WHERE id > (SELECT after_id FROM bounds)
+          AND id <= (SELECT upto_id FROM bounds)
+          AND created_at <= :at
+    )
+    SELECT item_id, box_id, product_id, MAX(seq) AS seq, SUM(quantity) AS quantity
+    FROM state
+    GROUP BY item_id, box_id
+    HAVING SUM(quantity) != 0
+'''
+
+
+# Столбцы, переносимые из таблиц журнала, созданных до справочника товаров
+LEGACY_COLUMNS = {
+    'stock_movements': (['id', 'item_id', 'box_id', 'delta', 'created_at'], 'id'),
+    'stock_checkpoint_items': (['checkpoint_id', 'item_id', 'box_id', 'quantity'], 'checkpoint_id'),
+}
+
+
+def init_ledger(db):
+    """Создаёт таблицы и триггеры журнала; для существующей базы пишет начальные остатки"""
+    had_ledger = db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stock_movements'"
+    ).fetchone()
+    for table in LEGACY_COLUMNS:
+        if had_ledger and is_legacy(db, table):
+            detach_legacy(db, table)
+    db.executescript(SCHEMA)
+    # Перенос отдельно от переименования (executescript фиксирует транзакцию),
+    # поэтому оставшиеся после сбоя *_legacy переносятся при следующем запуске
+    for table, (columns, order_by) in LEGACY_COLUMNS.items():
+        if has_detached(db, table):
+            copy_legacy(db, table, columns, order_by)
+    if not had_ledger:
+        # Остатки, появившиеся до журнала, становятся начальными движениями
+        db.execute('''
+            INSERT INTO stock_movements (item_id, box_id, product_id, delta, created_at)
+            SELECT id, box_id, product_id, quantity, created_at
+            FROM box_items
+            WHERE quantity != 0
+            ORDER BY created_at, id
+        ''')
+
+
+def as_of_params(at, use_checkpoints=True, upto=None):
+    """Параметры AS_OF_QUERY; ``at`` — строка 'YYYY-MM-DD HH:MM:SS' в UTC, как created_at"""
+    return {
+        'at': at,
+        'use_checkpoints': 1 if use_checkpoints else 0,
+        'upto': upto if upto is not None else (1 << 62),
+    }
+
+
+def stock_as_of(db, at, use_checkpoints=True, upto=None):
+    """Остатки по позициям на момент ``at``"""
+    return db.execute(AS_OF_QUERY, as_of_params(at, use_checkpoints, upto)).fetchall()
+
+
+def create_checkpoint(db, upto=None):
+    """Снимок остатков на последнее (или ``upto``) движение, построенный от предыдущей точки.
+
+    Выполняется в транзакции вызывающего; возвращает id точки или None,
+    если новых движений нет.
+    """
+    last = upto or db.execute('SELECT MAX(id) FROM stock_movements').fetchone()[0]
+    previous = db.execute('SELECT MAX(last_movement_id) FROM stock_checkpoints').fetchone()[0]
+    if last is None or (previous is not None and last <= previous):
+        return None
+
+    # Время точки — время последнего вошедшего в неё движения: все более
+    # поздние движения имеют больший id и не меньшее время
+    created_at = db.execute('SELECT created_at FROM stock_movements WHERE id = ?', (last,)).fetchone()[0]
+    checkpoint_id = db.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM stock_checkpoints').fetchone()[0]
+    # Строки точки считаются до вставки самой точки, чтобы запрос опирался на
+    # предыдущую; границей служит только id, а не время движений
+    db.execute(f'''
+        INSERT INTO stock_checkpoint_items (checkpoint_id, item_id, box_id, product_id, quantity)
+        SELECT :checkpoint_id, item_id, box_id, product_id, quantity
+        FROM ({AS_OF_QUERY})
+    ''', {'checkpoint_id': checkpoint_id, 'at': '9999-12-31', 'use_checkpoints': 1, 'upto': last})
+    db.execute('INSERT INTO stock_checkpoints (id, last_movement_id, created_at) VALUES (?, ?, ?)',
+               (checkpoint_id, last, created_at))
+    return checkpoint_id
+
+
+def movements_since_checkpoint(db):
+    return db.execute('''
+        SELECT COUNT(*) FROM stock_movements
+        WHERE id > COALESCE((SELECT MAX(last_movement_id) FROM stock_checkpoints), 0)
+    ''').fetchone()[0]
+
+
+def maybe_checkpoint(path=None, every=CHECKPOINT_EVERY):
+    """Создаёт контрольную точку, если после предыдущей накопилось достаточно движений"""
+    db = sqlite3.connect(path or database.db_path(), timeout=30)
+    try:
+        if movements_since_checkpoint(db) < every:
+            return None
+        db.execute('BEGIN IMMEDIATE')
+        checkpoint_id = create_checkpoint(db)
+        db.commit()
+        return checkpoint_id
+    finally:
+        db.close()
+
@@ -0,0 +1,377 @@
+"""Плановое обслуживание базы в фоне.
+
+Задачи (интервалы — переменные окружения ``WAREHOUSE_MAINTENANCE_*``):
+
+- ``ledger_checkpoint`` — контрольные точки журнала движений (ledger.py);
+- ``purge_zero_rows`` — удаляются позиции с нулевым остатком, которых давно
+  не касались (их история остаётся в журнале движений ``stock_movements``);
+- ``incremental_vacuum`` — возврат свободных страниц файлу базы;
+- ``optimize`` — ``PRAGMA optimize`` (ANALYZE там, где статистика устарела);
+- ``backup`` — онлайн-копия базы и её архива приёмок backup API с ротацией;
+- ``prune_change_events`` — очистка журнала изменений для живого
+  обновления страниц (events.py);
+- ``prune_idempotency_keys`` — удаление просроченных ключей
+  идемпотентности (idempotency.py);
+- ``prune_collection_outflow`` — удаление дней расхода по сборкам старше
+  окна отчёта о пополнении (replenishment.py);
+- ``archive_receipts`` — перенос старых приёмок в файл архива своим
+  соединением с присоединённым архивом (archive.py).
+
+Записи идут небольшими порциями через писателя (writer.py) и чередуются
+со сканированиями. Очередь задач общая для всех процессов: задачу
+забирает тот воркер, чей UPDATE в ``maintenance_tasks`` первым сдвинул
+время следующего запуска. Выполненные запуски пишутся в ``maintenance_runs``
+вместе с размером базы — из них строится динамика размера.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import archive
+import database
+import events
+import idempotency
+import ledger
+import replenishment
+import snapshot
+import writer
+
+TICK = float(os.environ.get('WAREHOUSE_MAINTENANCE_TICK', '30'))
+# Сколько секунд задача считается занятой воркером, который её забрал
+LEASE = float(os.environ.get('WAREHOUSE_MAINTENANCE_LEASE', '3600'))
+
+INTERVALS = {
+    'ledger_checkpoint': ledger.CHECK_INTERVAL,
+    'purge_zero_rows': float(os.environ.get('WAREHOUSE_MAINTENANCE_PURGE_INTERVAL', '3600')),
+    'incremental_vacuum': float(os.environ.get('WAREHOUSE_MAINTENANCE_VACUUM_INTERVAL', '3600')),
+    'optimize': float(os.environ.get('WAREHOUSE_MAINTENANCE_OPTIMIZE_INTERVAL', '86400')),
+    'backup': float(os.environ.get('WAREHOUSE_BACKUP_INTERVAL', '86400')),
+    'prune_change_events': float(os.environ.get('WAREHOUSE_MAINTENANCE_EVENTS_INTERVAL', '3600')),
+    'prune_idempotency_keys': float(os.environ.get('WAREHOUSE_MAINTENANCE_IDEMPOTENCY_INTERVAL', '3600')),
+    'prune_collection_outflow': float(os.environ.get('WAREHOUSE_MAINTENANCE_OUTFLOW_INTERVAL', '86400')),
+    'archive_receipts': float(os.environ.get('WAREHOUSE_MAINTENANCE_ARCHIVE_INTERVAL', '86400')),
+}
+
+# Нулевые позиции, которых не касались столько часов, удаляются
+ZERO_ROW_GRACE_HOURS = float(os.environ.get('WAREHOUSE_ZERO_ROW_GRACE_HOURS', '24'))
+PURGE_BATCH = 500
+VACUUM_BATCH = 1000
+RUNS_KEEP_DAYS = 90
+BACKUP_KEEP = int(os.environ.get('WAREHOUSE_BACKUP_KEEP', '7'))
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS maintenance_tasks (
+        task TEXT PRIMARY KEY,
+        next_run_at REAL NOT NULL DEFAULT 0,
+        lease_until REAL
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS maintenance_runs (
+        id INTEGER PRIMARY KEY,
+        task TEXT NOT NULL,
+        started_at TIMESTAMP NOT NULL,
+        duration_ms REAL NOT NULL,
+        status TEXT NOT NULL,
+        details TEXT,
+        db_bytes INTEGER,
+        free_bytes INTEGER,
+        wal_bytes INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS idx_maintenance_runs_task ON maintenance_runs (task, started_at);
+    CREATE INDEX IF NOT EXISTS idx_maintenance_runs_started ON maintenance_runs (started_at);
+'''
+
+
+def init_maintenance(db):
+    db.executescript(SCHEMA)
+
+
+def backup_dir(path=None):
+    path = path or database.db_path()
+    return os.environ.get('WAREHOUSE_BACKUP_DIR') or os.path.join(os.path.dirname(os.path.abspath(path)), 'backups')
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+# Задачи: fn(path) -> словарь с итогами или None, если делать было нечего
+
+def ledger_checkpoint(path):
+    checkpoint_id = ledger.maybe_checkpoint(path)
+    return {'checkpoint_id': checkpoint_id} if checkpoint_id else None
+
+
+def _delete_zero_rows(conn, ids):
+    # Остаток мог измениться после выборки кандидатов — условие проверяется снова
+    return conn.execute(
+        'DELETE FROM box_items WHERE id IN (SELECT value FROM json_each(?)) AND quantity = 0',
+        (json.dumps(ids),)
+    ).rowcount
+
+
+def _prune_runs(conn, before):
+    return conn.execute('DELETE FROM maintenance_runs WHERE started_at < ?', (before,)).rowcount
+
+
+def purge_zero_rows(path, grace_hours=ZERO_ROW_GRACE_HOURS):
+    cutoff = (datetime.now(timezone.utc) - timedelta(hours=grace_hours)).strftime('%Y-%m-%d %H:%M:%S')
+    # Кандидаты выбираются чтением вне писателя; недавние движения — по индексу created_at
+    conn = sqlite3.connect(path)
+    try:
+        ids = [row[0] for row in conn.execute('''
+            SELECT id FROM box_items
+            WHERE quantity = 0
+              AND id NOT IN (SELECT item_id FROM stock_movements WHERE created_at > ?)
+        ''', (cutoff,))]
+    finally:
+        conn.close()
+
+    coalescer = writer.get_writer(path)
+    deleted = 0
+    for start in range(0, len(ids), PURGE_BATCH):
+        # Порциями: между ними писатель успевает зафиксировать сканирования
+        deleted += coalescer.submit(_delete_zero_rows, ids[start:start + PURGE_BATCH])
+    before = (datetime.now(timezone.utc) - timedelta(days=RUNS_KEEP_DAYS)).strftime('%Y-%m-%d %H:%M:%S')
+    pruned_runs = coalescer.submit(_prune_runs, before)
+    if not deleted and not pruned_runs:
+        return None
+    return {'deleted_rows': deleted, 'pruned_runs': pruned_runs}
+
+
+def _vacuum_step(conn, pages):
+    # Python выполняет PRAGMA incremental_vacuum(N) за один шаг, освобождая
+    # одну страницу, поэтому страницы освобождаются по одной
+    for _ in range(pages):
+        conn.execute('PRAGMA incremental_vacuum')
+    return conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+
+def incremental_vacuum(path):
+    conn = sqlite3.connect(path)
+    try:
+        auto_vacuum, free = (conn.execute(f'PRAGMA {name}').fetchone()[0] for name in ('auto_vacuum', 'freelist_count'))
+    finally:
+        conn.close()
+    if auto_vacuum != 2:
+        # Базы, созданные до включения auto_vacuum, переводятся flask compact
+        return {'skipped': 'auto_vacuum is not INCREMENTAL, run flask compact once', 'free_pages': free}
+    if not free:
+        return None
+    coalescer = writer.get_writer(path)
+    released = free
+    while free:
+        free = coalescer.submit(_vacuum_step, min(free, VACUUM_BATCH))
+    return {'released_pages': released - free}
+
+
+def optimize(path):
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        # Ограничение выборки ANALYZE: статистика по тысяче строк на индекс
+        conn.execute('PRAGMA analysis_limit = 1000')
+        conn.execute('PRAGMA optimize')
+    finally:
+        conn.close()
+    return {'optimized': True}
+
+
+def backup_files(directory, stem):
+    """Копии одного шарда, старые первыми.
+
+    Каталог копий общий для площадок (sites.py): у ``warehouse.db`` и
+    ``warehouse-spb.db`` общий префикс, поэтому имя сверяется целиком.
+    """
+    pattern = re.compile(rf'^{re.escape(stem)}-\d{{8}}-\d{{6}}\.db$')
+    return sorted(f for f in os.listdir(directory) if pattern.match(f))
+
+
+def _snapshot(path, directory, keep):
+    """Копия одного файла базы в каталог копий и ротация его прежних копий"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    name = f'{stem}-{datetime.now().strftime("%Y%m%d-%H%M%S")}.db'
+    target = os.path.join(directory, name)
+    partial = target + '.partial'
+    source = sqlite3.connect(path)
+    try:
+        snapshot.take_snapshot(source, partial).close()
+    except Exception:
+        if os.path.exists(partial):
+            os.unlink(partial)
+        raise
+    finally:
+        source.close()
+    os.replace(partial, target)
+
+    backups = backup_files(directory, stem)
+    removed = []
+    for old in backups[:-keep] if keep > 0 else []:
+        os.unlink(os.path.join(directory, old))
+        removed.append(old)
+    return {'file': name, 'bytes': os.path.getsize(target), 'removed': removed}
+
+
+def backup(path, keep=BACKUP_KEEP):
+    """Копия шарда и, если он есть, его архива приёмок (archive.py) с той же ротацией"""
+    directory = backup_dir(path)
+    os.makedirs(directory, exist_ok=True)
+    result = _snapshot(path, directory, keep)
+    archive_file = archive.archive_path(path)
+    if os.path.exists(archive_file):
+        result['archive'] = _snapshot(archive_file, directory, keep)
+    return result
+
+
+TASKS = {
+    'ledger_checkpoint': ledger_checkpoint,
+    'purge_zero_rows': purge_zero_rows,
+    'incremental_vacuum': incremental_vacuum,
+    'optimize': optimize,
+    'backup': backup,
+    'prune_change_events': events.prune,
+    'prune_idempotency_keys': idempotency.prune,
+    'prune_collection_outflow': replenishment.prune,
+    'archive_receipts': archive.move,
+}
+
+
+def database_size(path):
+    conn = sqlite3.connect(path)
+    try:
+        page_size, pages, free = (conn.execute(f'PRAGMA {name}').fetchone()[0]
+                                  for name in ('page_size', 'page_count', 'freelist_count'))
+    finally:
+        conn.close()
+    try:
+        wal = os.path.getsize(path + '-wal')
+    except OSError:
+        wal = 0
+    return {'db_bytes': page_size * pages, 'free_bytes': page_size * free, 'wal_bytes': wal}
+
+
+def _claim(conn, task, interval, now, force):
+    conn.execute('INSERT OR IGNORE INTO maintenance_tasks (task) VALUES (?)', (task,))
+    return conn.execute('''
+        UPDATE maintenance_tasks SET next_run_at = :now + :interval, lease_until = :now + :lease
+        WHERE task = :task AND (next_run_at <= :now OR :force) AND COALESCE(lease_until, 0) < :now
+    ''', {'task': task, 'interval': interval, 'lease': LEASE, 'now': now, 'force': force}).rowcount == 1
+
+
+def _finish(conn, task, run):
+    conn.execute('UPDATE maintenance_tasks SET lease_until = NULL WHERE task = ?', (task,))
+    if run is not None:
+        conn.execute('''
+            INSERT INTO maintenance_runs (task, started_at, duration_ms, status, details, db_bytes, free_bytes, wal_bytes)
+            VALUES (:task, :started_at, :duration_ms, :status, :details, :db_bytes, :free_bytes, :wal_bytes)
+        ''', dict(run, task=task))
+
+
+def run_task(task, path=None, force=False):
+    """Выполняет задачу, если подошёл её срок (или ``force``) и её не выполняет другой процесс.
+
+    Возвращает запись о запуске, None — если задачу не забрали или делать было нечего.
+    """
+    path = path or database.db_path()
+    interval = INTERVALS[task]
+    coalescer = writer.get_writer(path)
+    if not coalescer.submit(_claim, task, interval, time.time(), 1 if force else 0):
+        return None
+
+    started_at = _utcnow()
+    started = time.perf_counter()
+    run = None
+    try:
+        details = TASKS[task](path)
+        if details is not None:
+            run = {'status': 'ok', 'details': details}
+    except Exception as e:
+        run = {'status': 'error', 'details': {'error': str(e)}}
+    finally:
+        if run is not None:
+            run.update(database_size(path), started_at=started_at,
+                       duration_ms=round((time.perf_counter() - started) * 1000, 1))
+            run['details'] = json.dumps(run['details'], ensure_ascii=False)
+        coalescer.submit(_finish, task, run)
+    return run
+
+
+def run_due(path=None):
+    for task, interval in INTERVALS.items():
+        if interval > 0:
+            run_task(task, path)
+
+
+def status(db):
+    """Состояние обслуживания для администратора"""
+    tasks = {}
+    for task, interval in INTERVALS.items():
+        row = db.execute('SELECT next_run_at, lease_until FROM maintenance_tasks WHERE task = ?', (task,)).fetchone()
+        last = db.execute('''
+            SELECT started_at, duration_ms, status, details FROM maintenance_runs
+            WHERE task = ? ORDER BY started_at DESC, id DESC LIMIT 1
+        ''', (task,)).fetchone()
+        tasks[task] = {
+            'interval_s': interval,
+            'enabled': interval > 0,
+            'running': bool(row and row['lease_until'] and row['lease_until'] > time.time()),
+            'next_run_at': (datetime.fromtimestamp(row['next_run_at'], timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+                            if row and row['next_run_at'] else None),
+            'last_run': dict(last, details=json.loads(last['details'] or 'null')) if last else None,
+        }
+    # Динамика размера: последний замер каждого дня
+    trend = db.execute('''
+        SELECT DATE(started_at) AS day, db_bytes, free_bytes, wal_bytes
+        FROM maintenance_runs
+        WHERE id IN (SELECT MAX(id) FROM maintenance_runs
+                     WHERE started_at >= DATE('now', '-30 days') GROUP BY DATE(started_at))
+        ORDER BY day
+    ''').fetchall()
+    path = database.db_path()
+    directory = backup_dir(path)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    backups, archive_backups = [], []
+    if os.path.isdir(directory):
+        backups = [{'file': f, 'bytes': os.path.getsize(os.path.join(directory, f))}
+                   for f in reversed(backup_files(directory, stem))]
+        archive_stem = os.path.splitext(os.path.basename(archive.archive_path(path)))[0]
+        archive_backups = [{'file': f, 'bytes': os.path.getsize(os.path.join(directory, f))}
+                           for f in reversed(backup_files(directory, archive_stem))]
+    zero_rows = db.execute('SELECT COUNT(*) FROM box_items WHERE quantity = 0').fetchone()[0]
+    return {
+        'size': database_size(path),
+        'zero_quantity_rows': zero_rows,
+        'tasks': tasks,
+        'size_trend': [dict(row) for row in trend],
+        'backups': backups,
+        'archive_backups': archive_backups,
+    }
+
+
+_scheduler_pid = None
+_scheduler_lock = threading.Lock()
+
+
+def start_scheduler(path=None, tick=TICK):
+    """Фоновый поток обслуживания (один на процесс; без path — по всем шардам площадок)"""
+    global _scheduler_pid
+    if _scheduler_pid == os.getpid():
+        return
+    with _scheduler_lock:
+        if _scheduler_pid == os.getpid():
+            return
+        _scheduler_pid = os.getpid()
+
+        def run():
+            while True:
+                time.sleep(tick)
+                for shard in [path] if path else database.shard_paths():
+                    try:
+                        run_due(shard)
+                    except sqlite3.Error as e:
+                        print(f'Maintenance failed for {shard}: {e}')
+
+        threading.Thread(target=run, name='maintenance', daemon=True).start()
@@ -0,0 +1,133 @@
+"""Справочник товаров: штрих-код -> каноническое название и артикул.
+
+``box_items`` и ``receipt_items`` ссылаются на товар по ``product_id``
+вместо того, чтобы повторять название и штрих-код в каждой строке.
+Товары без штрих-кода различаются по названию.
+
+Базы, созданные до справочника, переводятся при запуске: старые таблицы
+переименовываются (``detach_legacy``), init_db создаёт новые, данные
+переносятся с подстановкой product_id (``copy_legacy``).
+"""
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS products (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        barcode TEXT UNIQUE,
+        name TEXT NOT NULL,
+        article TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_products_name_no_barcode ON products (name) WHERE barcode IS NULL;
+'''
+
+# Таблицы, которые до справочника хранили product_name и barcode в каждой строке
+LEGACY_TABLES = ('box_items', 'receipt_items')
+
+
+def init_products(db):
+    db.executescript(SCHEMA)
+
+
+def normalize_barcode(barcode):
+    """Пустые и «nan» штрих-коды (из Excel) считаются отсутствующими"""
+    if barcode is None:
+        return None
+    barcode = str(barcode).strip()
+    if not barcode or barcode == 'nan':
+        return None
+    return barcode
+
+
+def get_or_create(db, name, barcode=None, article=None):
+    """id товара по штрих-коду (или по названию, если штрих-кода нет); создаёт при отсутствии.
+
+    У существующего товара название не меняется — оно каноническое;
+    артикул дописывается, если раньше не был известен.
+    """
+    barcode = normalize_barcode(barcode)
+    if barcode:
+        lookup = ('SELECT id, article FROM products WHERE barcode = ?', (barcode,))
+    else:
+        lookup = ('SELECT id, article FROM products WHERE barcode IS NULL AND name = ?', (name,))
+
+    row = db.execute(*lookup).fetchone()
+    if row is None:
+        db.execute('INSERT OR IGNORE INTO products (barcode, name, article) VALUES (?, ?, ?)',
+                   (barcode, name, article))
+        row = db.execute(*lookup).fetchone()
+    elif article and not row[1]:
+        db.execute('UPDATE products SET article = ? WHERE id = ?', (article, row[0]))
+    return row[0]
+
+
+def _columns(db, table):
+    return {row[1] for row in db.execute(f'PRAGMA table_info({table})')}
+
+
+def is_legacy(db, table):
+    """Таблица существует и ещё хранит название товара в каждой строке"""
+    return 'product_name' in _columns(db, table)
+
+
+def detach_legacy(db, table):
+    """Переименовывает старую таблицу в <table>_legacy, убирая её индексы и триггеры.
+
+    Имена индексов и триггеров глобальны: без удаления ``CREATE ... IF NOT EXISTS``
+    для новой таблицы нашёл бы старые объекты и пропустил создание.
+    """
+    for kind, name in db.execute(
+        "SELECT type, name FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+        (table,)
+    ).fetchall():
+        db.execute(f'DROP {kind.upper()} {name}')
+    db.execute(f'ALTER TABLE {table} RENAME TO {table}_legacy')
+
+
+def _legacy_name(alias):
+    return f"COALESCE({alias}.product_name, 'Товар ' || TRIM({alias}.barcode), 'Без названия')"
+
+
+def import_legacy(db, table, order_by='id'):
+    """Заносит в справочник товары из старой таблицы; при расхождении названий
+    по одному штрих-коду каноническим становится самое позднее (по ``order_by``)"""
+    db.execute(f'''
+        INSERT OR IGNORE INTO products (barcode, name)
+        SELECT NULLIF(TRIM(l.barcode), ''), {_legacy_name('l')}
+        FROM {table} l
+        ORDER BY l.{order_by} DESC
+    ''')
+
+
+def legacy_product_id(alias):
+    """SQL-выражение product_id для строки старой таблицы с псевдонимом ``alias``"""
+    return f'''
+        CASE WHEN NULLIF(TRIM({alias}.barcode), '') IS NULL
+             THEN (SELECT id FROM products WHERE barcode IS NULL
+                   AND name = {_legacy_name(alias)})
+             ELSE (SELECT id FROM products WHERE barcode = TRIM({alias}.barcode))
+        END
+    '''
+
+
+def has_detached(db, table):
+    """Осталась ли <table>_legacy, которую ещё нужно перенести"""
+    return db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (f'{table}_legacy',)
+    ).fetchone() is not None
+
+
+def copy_legacy(db, table, columns, order_by='id'):
+    """Переносит строки из <table>_legacy в новую таблицу и удаляет старую.
+
+    ``columns`` — общие столбцы, копируемые как есть; product_id вычисляется.
+    """
+    legacy = f'{table}_legacy'
+    import_legacy(db, legacy, order_by)
+    column_list = ', '.join(columns)
+    selected = ', '.join(f'l.{c}' for c in columns)
+    db.execute(f'''
+        INSERT INTO {table} ({column_list}, product_id)
+        SELECT {selected}, {legacy_product_id('l')}
+        FROM {legacy} l
+    ''')
+    db.execute(f'DROP TABLE {legacy}')
@@ -0,0 +1,200 @@
+"""Профилирование отдельных запросов по требованию администратора.
+
+Запрос с заголовком ``X-Profile: 1`` или параметром ``?_profile=1`` от
+администратора выполняется под cProfile и tracemalloc, результат
+сохраняется в каталог профилей. Если задан порог медленного запроса,
+для всех SQL-запросов, выполненных в таком запросе, снимается
+``EXPLAIN QUERY PLAN``.
+
+Список запросов — в contextvar: писатель (writer.py) выполняет операцию
+в контексте отправившего её запроса, поэтому записи через
+``writer.submit`` тоже попадают в отчёт.
+"""
+import contextvars
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import sqlite3
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+
+from flask import g, request
+
+import database
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_ARG = '_profile'
+
+# Сколько уникальных SQL-запросов разбирать для медленного запроса
+MAX_EXPLAINED_STATEMENTS = 200
+TOP_FUNCTIONS = 60
+TOP_ALLOCATIONS = 30
+
+_EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH')
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+# tracemalloc глобален для процесса, поэтому профилируем один запрос за раз
+_profile_lock = threading.Lock()
+
+# SQL-запросы текущего HTTP-запроса: [(файл базы, запрос)]; None — не собираются
+sql_statements = contextvars.ContextVar('sql_statements', default=None)
+
+
+def init_profiling(app, is_admin):
+    """Подключает хуки профилирования к приложению"""
+    app.config.setdefault('PROFILE_DIR', os.environ.get('WAREHOUSE_PROFILE_DIR', 'profiles'))
+    slow_ms = os.environ.get('WAREHOUSE_SLOW_REQUEST_MS')
+    app.config.setdefault('SLOW_REQUEST_THRESHOLD_MS', float(slow_ms) if slow_ms else None)
+
+    database.connection_hooks.append(_trace_connection)
+
+    @app.before_request
+    def start_profiling():
+        g._request_started = time.perf_counter()
+        if app.config['SLOW_REQUEST_THRESHOLD_MS'] is not None:
+            g._sql_statements = []
+            sql_statements.set(g._sql_statements)
+
+        wants_profile = request.headers.get(PROFILE_HEADER) == '1' or request.args.get(PROFILE_ARG) == '1'
+        if wants_profile and is_admin() and _profile_lock.acquire(blocking=False):
+            tracemalloc.start()
+            profiler = cProfile.Profile()
+            g._profiler = profiler
+            profiler.enable()
+
+    @app.after_request
+    def finish_profiling(response):
+        profiler = g.pop('_profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            try:
+                snapshot = tracemalloc.take_snapshot()
+            finally:
+                tracemalloc.stop()
+                _profile_lock.release()
+            name = _save_profile(app.config['PROFILE_DIR'], profiler, snapshot)
+            response.headers['X-Profile-Id'] = name
+
+        started = g.pop('_request_started', None)
+        threshold = app.config['SLOW_REQUEST_THRESHOLD_MS']
+        if started is not None and threshold is not None:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            statements = g.pop('_sql_statements', [])
+            if elapsed_ms > threshold and statements:
+                name = _save_query_plans(app.config['PROFILE_DIR'], elapsed_ms, statements)
+                response.headers['X-Slow-Request-Report'] = name
+        return response
+
+    @app.teardown_request
+    def abort_profiling(exc):
+        sql_statements.set(None)
+        # after_request не вызывается при необработанном исключении
+        profiler = g.pop('_profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            tracemalloc.stop()
+            _profile_lock.release()
+
+
+def _trace_connection(conn, path):
+    """Записывает выполненные SQL-запросы в список текущего HTTP-запроса"""
+    def trace(statement):
+        statements = sql_statements.get()
+        if statements is not None:
+            statements.append((path, statement))
+    conn.set_trace_callback(trace)
+
+
+def _report_stem():
+    endpoint = (request.endpoint or 'unknown').replace('.', '_')
+    return f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{endpoint}_{uuid.uuid4().hex[:6]}"
+
+
+def _save_profile(profile_dir, profiler, snapshot):
+    """Сохраняет pstats и текстовый отчёт с топом функций и аллокаций"""
+    os.makedirs(profile_dir, exist_ok=True)
+    stem = _report_stem()
+
+    profiler.dump_stats(os.path.join(profile_dir, f'{stem}.pstats'))
+
+    out = io.StringIO()
+    out.write(f'{request.method} {request.full_path}\n\n')
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+
+    out.write(f'\nTop {TOP_ALLOCATIONS} allocations:\n')
+    for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+        out.write(f'{stat}\n')
+
+    with open(os.path.join(profile_dir, f'{stem}.txt'), 'w', encoding='utf-8') as f:
+        f.write(out.getvalue())
+    return stem
+
+
+def _save_query_plans(profile_dir, elapsed_ms, statements):
+    """Снимает EXPLAIN QUERY PLAN для уникальных запросов медленного запроса"""
+    seen = {}
+    for path, statement in statements:
+        sql = statement.strip()
+        if not sql.upper().startswith(_EXPLAINABLE):
+            continue
+        shape = _LITERAL_RE.sub('?', sql)
+        if shape in seen:
+            seen[shape]['count'] += 1
+        elif len(seen) < MAX_EXPLAINED_STATEMENTS:
+            seen[shape] = {'path': path, 'sql': sql, 'count': 1}
+
+    plans = []
+    connections = {}
+    try:
+        for entry in seen.values():
+            conn = connections.get(entry['path'])
+            if conn is None:
+                # Отдельное соединение без хуков, чтобы не трассировать сами EXPLAIN
+                conn = connections[entry['path']] = sqlite3.connect(entry['path'])
+            try:
+                rows = conn.execute('EXPLAIN QUERY PLAN ' + entry['sql']).fetchall()
+                plan = [row[-1] for row in rows]
+            except sqlite3.Error as e:
+                plan = [f'error: {e}']
+            plans.append({'sql': entry['sql'], 'executions': entry['count'], 'plan': plan})
+    finally:
+        for conn in connections.values():
+            conn.close()
+
+    os.makedirs(profile_dir, exist_ok=True)
+    stem = _report_stem()
+    report = {
+        'method': request.method,
+        'path': request.full_path,
+        'elapsed_ms': round(elapsed_ms, 1),
+        'statement_count': len(statements),
+        'queries': plans,
+    }
+    with open(os.path.join(profile_dir, f'{stem}.slow.json'), 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return stem
+
+
+def list_profiles(profile_dir):
+    """Список сохранённых профилей, новые первыми"""
+    if not os.path.isdir(profile_dir):
+        return []
+    files = []
+    for name in os.listdir(profile_dir):
+        path = os.path.join(profile_dir, name)
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            files.append({
+                'name': name,
+                'size': stat.st_size,
+                'created_at': datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S')
+            })
+    files.sort(key=lambda f: f['created_at'], reverse=True)
+    return files
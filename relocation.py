@@ -0,0 +1,128 @@
+"""Массовое перемещение коробок между зонами и товаров между коробками.
+
+Каждая операция — несколько set-based запросов по списку id (json_each)
+в транзакции писателя (writer.py). Пробный запуск (dry_run) выполняет те
+же запросы, собирает итоговые изменения и откатывает их, выбрасывая
+``DryRun`` — писатель откатывает точку сохранения операции.
+"""
+import json
+
+
+class DryRun(Exception):
+    """Пробный запуск: изменения откачены, результат в ``result``"""
+
+    def __init__(self, result):
+        super().__init__('dry run')
+        self.result = result
+
+
+def move_boxes(db, box_ids, zone_id, dry_run=False):
+    """Переносит коробки в зону ``zone_id``"""
+    if not db.execute('SELECT 1 FROM zones WHERE id = ?', (zone_id,)).fetchone():
+        raise ValueError('Zone not found')
+
+    params = {'ids': json.dumps(box_ids), 'zone_id': zone_id}
+    changes = db.execute('''
+        SELECT id AS box_id, name AS box_name, zone_id AS from_zone_id, :zone_id AS to_zone_id
+        FROM boxes
+        WHERE id IN (SELECT value FROM json_each(:ids)) AND zone_id != :zone_id
+        ORDER BY id
+    ''', params).fetchall()
+    moved = db.execute('''
+        UPDATE boxes SET zone_id = :zone_id
+        WHERE id IN (SELECT value FROM json_each(:ids)) AND zone_id != :zone_id
+    ''', params).rowcount
+
+    result = {'moved_boxes': moved, 'changes': [dict(row) for row in changes]}
+    if dry_run:
+        raise DryRun(result)
+    return result
+
+
+# Позиции со штрих-кодом сливаются по товару: с уже лежащей в целевой коробке
+# позицией или между собой (остаётся позиция с меньшим id). Позиции без
+# штрих-кода переносятся как есть — так же, как их добавляет сканирование.
+MOVE_ITEMS = [
+    # Переносимые позиции (кроме уже лежащих в целевой коробке)
+    'DROP TABLE IF EXISTS temp.moving',
+    '''
+    CREATE TEMP TABLE moving AS
+    SELECT bi.id AS item_id, bi.product_id, bi.quantity, p.barcode IS NOT NULL AS mergeable
+    FROM box_items bi
+    JOIN products p ON p.id = bi.product_id
+    WHERE bi.id IN (SELECT value FROM json_each(:ids)) AND bi.box_id != :box_id
+    ''',
+    'CREATE INDEX temp.idx_moving_product ON moving (product_id)',
+    # Снимок затронутых строк до переноса — для итоговой разницы
+    'DROP TABLE IF EXISTS temp.move_before',
+    '''
+    CREATE TEMP TABLE move_before AS
+    SELECT id, box_id, product_id, quantity FROM box_items WHERE id IN (SELECT item_id FROM moving)
+    UNION ALL
+    SELECT id, box_id, product_id, quantity FROM box_items
+    WHERE box_id = :box_id AND product_id IN (SELECT product_id FROM moving WHERE mergeable)
+    ''',
+    # 1. Слияние с позициями, уже лежащими в целевой коробке
+    '''
+    UPDATE box_items
+    SET quantity = quantity + (SELECT SUM(m.quantity) FROM moving m
+                               WHERE m.product_id = box_items.product_id AND m.mergeable)
+    WHERE id IN (
+        SELECT MIN(id) FROM box_items
+        WHERE box_id = :box_id AND product_id IN (SELECT product_id FROM moving WHERE mergeable)
+        GROUP BY product_id
+    )
+    ''',
+    '''
+    DELETE FROM box_items
+    WHERE id IN (
+        SELECT item_id FROM moving
+        WHERE mergeable AND product_id IN (SELECT product_id FROM box_items WHERE box_id = :box_id)
+    )
+    ''',
+    'DELETE FROM moving WHERE item_id NOT IN (SELECT id FROM box_items)',
+    # 2. Несколько переносимых позиций одного товара сводятся в одну
+    '''
+    UPDATE box_items
+    SET box_id = :box_id,
+        quantity = (SELECT SUM(m.quantity) FROM moving m WHERE m.product_id = box_items.product_id)
+    WHERE id IN (SELECT MIN(item_id) FROM moving WHERE mergeable GROUP BY product_id)
+    ''',
+    '''
+    DELETE FROM box_items
+    WHERE id IN (SELECT item_id FROM moving WHERE mergeable) AND box_id != :box_id
+    ''',
+    # 3. Позиции без штрих-кода
+    'UPDATE box_items SET box_id = :box_id WHERE id IN (SELECT item_id FROM moving WHERE NOT mergeable)',
+]
+
+MOVE_ITEMS_DIFF = '''
+    SELECT mb.id AS item_id, p.name AS product_name, p.barcode,
+           mb.box_id AS from_box_id, bi.box_id AS to_box_id,
+           mb.quantity AS quantity_before, bi.quantity AS quantity_after
+    FROM move_before mb
+    LEFT JOIN box_items bi ON bi.id = mb.id
+    JOIN products p ON p.id = mb.product_id
+    WHERE bi.id IS NULL OR bi.box_id != mb.box_id OR bi.quantity != mb.quantity
+    ORDER BY mb.id
+'''
+
+
+def move_items(db, item_ids, box_id, dry_run=False):
+    """Переносит позиции в коробку ``box_id`` со слиянием количеств по штрих-коду"""
+    if not db.execute('SELECT 1 FROM boxes WHERE id = ?', (box_id,)).fetchone():
+        raise ValueError('Box not found')
+
+    params = {'ids': json.dumps(item_ids), 'box_id': box_id}
+    for statement in MOVE_ITEMS:
+        db.execute(statement, params)
+    changes = [dict(row) for row in db.execute(MOVE_ITEMS_DIFF)]
+
+    result = {
+        'moved_items': sum(1 for c in changes if c['to_box_id'] == box_id and c['from_box_id'] != box_id),
+        'merged_items': sum(1 for c in changes if c['to_box_id'] is None),
+        'changes': changes,
+    }
+    if dry_run:
+        raise DryRun(result)
+    return result
@@ -0,0 +1,199 @@
+"""Пополнение: пороги минимального остатка и отчёт о заканчивающихся товарах.
+
+Отчёт не пересчитывает ``box_items`` и историю: остаток товара по всем
+коробкам хранится в ``product_stock`` и обновляется триггерами на
+``box_items`` в той же транзакции, что и само изменение (одна вставка
+с ON CONFLICT по первичному ключу на изменение). Расход по подтверждённым
+сборкам копится в ``collection_outflow`` по дням — не больше
+``OUTFLOW_DAYS`` строк на товар, старые дни удаляет задача обслуживания
+``prune_collection_outflow`` (maintenance.py). Отчёт — соединение
+порогов с этими двумя таблицами по первичным ключам.
+"""
+import csv
+import io
+import json
+import os
+import sqlite3
+
+import writer
+from lazy import LazyModule
+
+pd = LazyModule('pandas')
+
+OUTFLOW_DAYS = int(os.environ.get('WAREHOUSE_REPLENISHMENT_DAYS', '30'))
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS stock_thresholds (
+        product_id INTEGER PRIMARY KEY,
+        min_quantity INTEGER NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS product_stock (
+        product_id INTEGER PRIMARY KEY,
+        quantity INTEGER NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS collection_outflow (
+        product_id INTEGER NOT NULL,
+        day DATE NOT NULL,
+        quantity INTEGER NOT NULL,
+        PRIMARY KEY (product_id, day)
+    ) WITHOUT ROWID;
+
+    CREATE TRIGGER IF NOT EXISTS trg_box_items_stock_insert
+    AFTER INSERT ON box_items WHEN NEW.quantity != 0
+    BEGIN
+        INSERT INTO product_stock (product_id, quantity) VALUES (NEW.product_id, NEW.quantity)
+        ON CONFLICT (product_id) DO UPDATE SET quantity = quantity + excluded.quantity;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_box_items_stock_update
+    AFTER UPDATE OF quantity, product_id ON box_items
+    WHEN NEW.quantity != OLD.quantity OR NEW.product_id != OLD.product_id
+    BEGIN
+        UPDATE product_stock SET quantity = quantity - OLD.quantity WHERE product_id = OLD.product_id;
+        INSERT INTO product_stock (product_id, quantity) VALUES (NEW.product_id, NEW.quantity)
+        ON CONFLICT (product_id) DO UPDATE SET quantity = quantity + excluded.quantity;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_box_items_stock_delete
+    AFTER DELETE ON box_items WHEN OLD.quantity != 0
+    BEGIN
+        UPDATE product_stock SET quantity = quantity - OLD.quantity WHERE product_id = OLD.product_id;
+    END;
+'''
+
+REBUILD = [
+    'DELETE FROM product_stock',
+    'INSERT INTO product_stock (product_id, quantity) SELECT product_id, SUM(quantity) FROM box_items GROUP BY product_id',
+]
+
+# Расход по позициям плана сборки до его применения: было - останется
+RECORD_OUTFLOW = '''
+    INSERT INTO collection_outflow (product_id, day, quantity)
+    SELECT bi.product_id, DATE('now'), SUM(bi.quantity - CAST(json_extract(j.value, '$.remaining_after') AS INTEGER))
+    FROM json_each(?) j
+    JOIN box_items bi ON bi.id = json_extract(j.value, '$.item_id')
+    WHERE bi.quantity > CAST(json_extract(j.value, '$.remaining_after') AS INTEGER)
+    GROUP BY bi.product_id
+    ON CONFLICT (product_id, day) DO UPDATE SET quantity = quantity + excluded.quantity
+'''
+
+# Расход — диапазон первичного ключа (товар, день) только для товаров с порогом
+REPORT_QUERY = '''
+    SELECT barcode, product_name, article, stock, min_quantity, outflow,
+           MAX(min_quantity - stock, 0) AS shortfall
+    FROM (
+        SELECT p.barcode, p.name AS product_name, p.article,
+               COALESCE(ps.quantity, 0) AS stock,
+               t.min_quantity,
+               (SELECT COALESCE(SUM(o.quantity), 0) FROM collection_outflow o
+                WHERE o.product_id = t.product_id AND o.day >= DATE('now', :since)) AS outflow
+        FROM stock_thresholds t
+        JOIN products p ON p.id = t.product_id
+        LEFT JOIN product_stock ps ON ps.product_id = t.product_id
+    )
+    WHERE :all OR stock < min_quantity
+    ORDER BY shortfall DESC, outflow DESC, product_name
+'''
+
+# Столбцы выгрузки: поле отчёта -> заголовок
+EXPORT_COLUMNS = {
+    'barcode': 'Штрих-код',
+    'product_name': 'Название товара',
+    'article': 'Артикул',
+    'stock': 'Остаток',
+    'min_quantity': 'Минимальный остаток',
+    'shortfall': 'Не хватает до минимума',
+    'outflow': 'Расход по сборкам',
+    'days_left': 'Хватит на дней',
+}
+
+
+def init_replenishment(db):
+    created = not db.execute("SELECT 1 FROM sqlite_master WHERE name = 'product_stock'").fetchone()
+    db.executescript(SCHEMA)
+    if created:
+        # Остатки, накопленные до появления таблицы
+        rebuild(db)
+
+
+def rebuild(db):
+    for statement in REBUILD:
+        db.execute(statement)
+
+
+def record_outflow(db, collection_plan):
+    """Расход подтверждаемой сборки; вызывается до обновления остатков в той же транзакции"""
+    db.execute(RECORD_OUTFLOW, (json.dumps(collection_plan),))
+
+
+def set_thresholds(db, thresholds):
+    """[{barcode, min_quantity}] -> число обновлённых порогов; min_quantity null снимает порог.
+
+    Штрих-коды, которых нет в справочнике, пропускаются.
+    """
+    payload = json.dumps(thresholds)
+    removed = db.execute('''
+        DELETE FROM stock_thresholds WHERE product_id IN (
+            SELECT p.id FROM json_each(?) j JOIN products p ON p.barcode = TRIM(json_extract(j.value, '$.barcode'))
+            WHERE json_extract(j.value, '$.min_quantity') IS NULL
+        )
+    ''', (payload,)).rowcount
+    updated = db.execute('''
+        INSERT INTO stock_thresholds (product_id, min_quantity)
+        SELECT p.id, MAX(CAST(json_extract(j.value, '$.min_quantity') AS INTEGER), 0)
+        FROM json_each(?) j
+        JOIN products p ON p.barcode = TRIM(json_extract(j.value, '$.barcode'))
+        WHERE json_extract(j.value, '$.min_quantity') IS NOT NULL
+        ON CONFLICT (product_id) DO UPDATE SET min_quantity = excluded.min_quantity, updated_at = CURRENT_TIMESTAMP
+    ''', (payload,)).rowcount
+    return removed + updated
+
+
+def report(db, include_all=False, days=OUTFLOW_DAYS):
+    """Товары с порогом: остаток, порог, нехватка и расход по сборкам за days дней.
+
+    По умолчанию — только товары ниже порога.
+    """
+    rows = []
+    for row in db.execute(REPORT_QUERY, {'since': f'-{days} days', 'all': bool(include_all)}):
+        row = dict(row)
+        # На сколько дней хватит остатка при среднем расходе за период
+        row['days_left'] = round(row['stock'] * days / row['outflow'], 1) if row['outflow'] else None
+        rows.append(row)
+    return rows
+
+
+def to_csv(rows):
+    buffer = io.StringIO()
+    out = csv.writer(buffer)
+    out.writerow(EXPORT_COLUMNS.values())
+    for row in rows:
+        out.writerow(row[field] for field in EXPORT_COLUMNS)
+    # BOM — чтобы Excel открыл кириллицу в UTF-8
+    return '\ufeff' + buffer.getvalue()
+
+
+def to_frame(rows):
+    return pd.DataFrame([[row[field] for field in EXPORT_COLUMNS] for row in rows],
+                        columns=list(EXPORT_COLUMNS.values()))
+
+
+def _delete_outflow_before(db, since):
+    return db.execute("DELETE FROM collection_outflow WHERE day < DATE('now', ?)", (since,)).rowcount
+
+
+def prune(path, days=OUTFLOW_DAYS):
+    """Удаляет дни расхода старше окна отчёта"""
+    since = f'-{days} days'
+    conn = sqlite3.connect(path)
+    try:
+        stale = conn.execute("SELECT 1 FROM collection_outflow WHERE day < DATE('now', ?) LIMIT 1",
+                             (since,)).fetchone()
+    finally:
+        conn.close()
+    if not stale:
+        return None
+    return {'deleted_outflow_days': writer.get_writer(path).submit(_delete_outflow_before, since)}
@@ -0,0 +1,205 @@
+"""Полнотекстовый поиск товаров по коробкам и приёмкам (SQLite FTS5).
+
+Индекс — FTS5-таблица с внешним содержимым над справочником ``products``
+с триграммным токенизатором: он ищет по любой подстроке от трёх символов
+и без учёта регистра, в том числе для кириллицы. Найденные товары затем
+раскрываются в позиции коробок и строки приёмок по ``product_id``.
+Синхронизацию индекса со справочником поддерживают триггеры.
+"""
+import json
+
+MIN_TERM_LENGTH = 3
+MAX_PER_PAGE = 200
+
+SCHEMA = '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        name, barcode, article,
+        content='products', content_rowid='id', tokenize='trigram'
+    );
+
+    CREATE TRIGGER IF NOT EXISTS trg_products_fts_insert AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts (rowid, name, barcode, article)
+        VALUES (NEW.id, NEW.name, NEW.barcode, NEW.article);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_products_fts_delete AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts (products_fts, rowid, name, barcode, article)
+        VALUES ('delete', OLD.id, OLD.name, OLD.barcode, OLD.article);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_products_fts_update
+    AFTER UPDATE OF name, barcode, article ON products BEGIN
+        INSERT INTO products_fts (products_fts, rowid, name, barcode, article)
+        VALUES ('delete', OLD.id, OLD.name, OLD.barcode, OLD.article);
+        INSERT INTO products_fts (rowid, name, barcode, article)
+        VALUES (NEW.id, NEW.name, NEW.barcode, NEW.article);
+    END;
+'''
+
+# Индексы по строкам box_items/receipt_items, существовавшие до справочника товаров
+LEGACY_INDEXES = ('box_items_fts', 'receipt_items_fts')
+
+# Совпадения идут блоками по RANK_CANDIDATES товаров от новых к старым,
+# внутри блока — по bm25. Для узких запросов весь результат — один блок
+# и ранжирование точное; для общих слов (сотни тысяч совпадений) FTS5 не
+# перебирает все совпадения, а останавливается на нужном числе блоков.
+# Порядок от ширины окна не зависит, поэтому страницы не пересекаются.
+RANK_CANDIDATES = 1000
+
+# bm25 считается здесь, а не функцией FTS5: bm25() для IDF каждой фразы
+# перебирает все её совпадения в индексе (десятки миллисекунд на общем
+# слове при любом LIMIT). Без IDF фразы запроса весят одинаково; для
+# запроса из одного слова порядок тот же, что у bm25() FTS5.
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+CANDIDATES = '''
+    SELECT rowid AS product_id, name, barcode, article
+    FROM products_fts
+    WHERE products_fts MATCH :query
+    ORDER BY rowid DESC
+    LIMIT :candidates
+'''
+
+# Кандидаты уже упорядочены по блоку и рангу: порядок — позиция в массиве
+PRODUCT_HITS = '''
+    SELECT key AS position, value ->> 0 AS product_id, value ->> 1 AS block, value ->> 2 AS rank
+    FROM json_each(:hits)
+'''
+
+BOX_HITS = '''
+    SELECT 'box' AS source, bi.id AS item_id, p.name AS product_name, p.barcode, bi.quantity,
+           b.id AS box_id, b.name AS box_name, z.id AS zone_id, z.name AS zone_name,
+           NULL AS receipt_id, NULL AS receipt_number, NULL AS receipt_date,
+           h.position AS position, h.block AS block, h.rank AS rank
+    FROM hits h
+    JOIN products p ON p.id = h.product_id
+    JOIN box_items bi ON bi.product_id = h.product_id
+    JOIN boxes b ON b.id = bi.box_id
+    JOIN zones z ON z.id = b.zone_id
+    WHERE bi.quantity > 0
+    ORDER BY h.position, bi.id DESC
+    LIMIT :window
+'''
+
+RECEIPT_HITS = '''
+    SELECT 'receipt' AS source, ri.id AS item_id, p.name AS product_name, p.barcode, ri.quantity,
+           NULL AS box_id, ri.box_name, NULL AS zone_id, ri.zone_name,
+           r.id AS receipt_id, r.receipt_number, r.receipt_date,
+           h.position AS position, h.block AS block, h.rank AS rank
+    FROM hits h
+    JOIN products p ON p.id = h.product_id
+    JOIN receipt_items ri ON ri.product_id = h.product_id
+    JOIN receipts r ON r.id = ri.receipt_id
+    ORDER BY h.position, ri.id DESC
+    LIMIT :window
+'''
+
+
+def init_search(db):
+    """Создаёт индекс и триггеры; только что созданный индекс заполняет"""
+    existing = db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'"
+    ).fetchone()
+    for name in LEGACY_INDEXES:
+        db.execute(f'DROP TABLE IF EXISTS {name}')
+    db.executescript(SCHEMA)
+    if not existing:
+        rebuild(db)
+
+
+def rebuild(db):
+    """Перестраивает индекс по текущему содержимому справочника"""
+    db.execute("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+
+
+def search_terms(text):
+    return [t for t in text.split() if len(t) >= MIN_TERM_LENGTH]
+
+
+def build_match_query(text):
+    """Строка пользователя -> запрос FTS5: все слова от трёх символов, каждое как фраза"""
+    return ' '.join('"' + t.replace('"', '""') + '"' for t in search_terms(text))
+
+
+def _trigrams(value):
+    return max(len(value) - 2, 0) if value else 0
+
+
+def rank_candidates(candidates, terms):
+    """Товары-кандидаты (новые первыми) -> [[product_id, блок, ранг]] в порядке выдачи.
+
+    Ранг — bm25 со знаком минус, как у FTS5 (меньше — лучше): частота фраз
+    по всем колонкам, длина строки в триграммах, средняя длина — по блоку.
+    """
+    terms = [term.lower() for term in terms]
+    norm = BM25_K1 * (1 - BM25_B)
+    hits = []
+    for start in range(0, len(candidates), RANK_CANDIDATES):
+        block = [[value for value in row[1:] if value] for row in candidates[start:start + RANK_CANDIDATES]]
+        lengths = [sum(_trigrams(value) for value in values) for values in block]
+        average = max(sum(lengths) / len(lengths), 1)
+        ranked = []
+        for row, values, length in zip(candidates[start:], block, lengths):
+            text = ' '.join(values).lower()
+            score = 0.0
+            for term in terms:
+                frequency = text.count(term)
+                score += frequency * (BM25_K1 + 1) / (frequency + norm + BM25_K1 * BM25_B * length / average)
+            ranked.append([row[0], start // RANK_CANDIDATES, -score])
+        ranked.sort(key=lambda hit: hit[2])
+        hits += ranked
+    return hits
+
+
+def _ranked_hits(db, query, terms, window):
+    """Кандидаты окна в порядке выдачи и есть ли совпадения за его пределами"""
+    candidates = db.execute(CANDIDATES, {'query': query, 'candidates': window + 1}).fetchall()
+    return rank_candidates(candidates[:window], terms), len(candidates) > window
+
+
+def search(db, text, page=1, per_page=50, source='all'):
+    """Поиск с ранжированием по блокам совпадений (см. RANK_CANDIDATES).
+
+    Возвращает (строки страницы, есть ли следующая страница).
+    """
+    query = build_match_query(text)
+    if not query:
+        raise ValueError(f'Search query must contain a word of at least {MIN_TERM_LENGTH} characters')
+
+    per_page = max(1, min(per_page, MAX_PER_PAGE))
+    offset = (max(page, 1) - 1) * per_page
+    parts = []
+    if source in ('all', 'boxes'):
+        parts.append(BOX_HITS)
+    if source in ('all', 'receipts'):
+        parts.append(RECEIPT_HITS)
+    if not parts:
+        raise ValueError(f'Unknown search source: {source}')
+
+    # Товары ищутся один раз; каждый источник отдаёт не больше нужного окна,
+    # затем окна сливаются по блоку и рангу
+    sql = ' UNION ALL '.join(f'SELECT * FROM ({part})' for part in parts)
+    statement = (f'WITH hits AS ({PRODUCT_HITS}) '
+                 f'SELECT * FROM ({sql}) ORDER BY position, source, item_id DESC LIMIT :limit OFFSET :offset')
+    params = {'window': offset + per_page + 1, 'limit': per_page + 1, 'offset': offset}
+    terms = search_terms(text)
+    # Окно — целое число блоков, не меньше строк до конца страницы. В запрос
+    # уходят только первые товары окна: строк до конца страницы обычно хватает
+    # с них, а товары без остатка и приёмок строк не дают — тогда товаров
+    # берётся вдвое больше, а за ними расширяется и окно
+    need = offset + per_page + 1
+    window = -(-need // RANK_CANDIDATES) * RANK_CANDIDATES
+    hits, more = _ranked_hits(db, query, terms, window)
+    take = need
+    while True:
+        rows = db.execute(statement, dict(params, hits=json.dumps(hits[:take]))).fetchall()
+        if len(rows) > per_page:
+            return rows[:per_page], True
+        if take < len(hits):
+            take *= 2
+        elif more:
+            window *= 2
+            hits, more = _ranked_hits(db, query, terms, window)
+        else:
+            return rows, False
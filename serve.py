@@ -0,0 +1,70 @@
+"""Запуск приложения в продакшене под gunicorn.
+
+Приложение загружается один раз в мастер-процессе (preload_app), поэтому
+init_db и миграции схемы выполняются ровно один раз до fork; воркеры
+получают уже готовое приложение. Число воркеров по умолчанию — по числу
+CPU, в каждом несколько потоков (gthread): запросы в основном ждут SQLite
+и ввод-вывод. pandas в мастер не загружается (lazy.py): его импортирует
+только воркер, которому досталась выгрузка или импорт Excel.
+
+Каждая открытая страница держит поток изменений /api/events (events.py),
+а с ним — поток воркера на всё время соединения, поэтому потоков по
+умолчанию больше, чем нужно для обычных запросов: их должно хватать на
+все станции плюс запас.
+
+    python serve.py --bind 0.0.0.0:8000
+    WAREHOUSE_WORKERS=4 WAREHOUSE_THREADS=32 python serve.py
+
+Для разработки по-прежнему: python app.py
+"""
+import argparse
+import os
+
+DEFAULT_THREADS = 16
+# Выгрузки больших складов в xlsx идут десятки секунд
+DEFAULT_TIMEOUT = 300
+
+
+def default_workers():
+    return int(os.environ.get('WAREHOUSE_WORKERS', '0')) or (os.cpu_count() or 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the warehouse app under gunicorn')
+    parser.add_argument('--bind', default=os.environ.get('WAREHOUSE_BIND', '127.0.0.1:8000'))
+    parser.add_argument('--workers', type=int, default=default_workers())
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('WAREHOUSE_THREADS', DEFAULT_THREADS)))
+    parser.add_argument('--timeout', type=int, default=DEFAULT_TIMEOUT)
+    parser.add_argument('--access-log', action='store_true', help='log every request to stdout')
+    args = parser.parse_args(argv)
+
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise SystemExit('gunicorn is not installed: pip install gunicorn (for development use python app.py)')
+
+    options = {
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread',
+        'preload_app': True,
+        'timeout': args.timeout,
+        'accesslog': '-' if args.access_log else None,
+    }
+
+    class WarehouseApplication(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            # Импорт приложения выполняет init_db — в мастере, один раз
+            from app import app
+            return app
+
+    WarehouseApplication().run()
+
+
+if __name__ == '__main__':
+    main()
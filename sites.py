@@ -0,0 +1,142 @@
+"""Несколько складов: по файлу базы (шарду) на площадку.
+
+Площадки перечисляются в ``WAREHOUSE_SITES`` (database.py), например
+``msk,spb`` или ``main=warehouse.db,spb`` — так существующая база остаётся
+первой площадкой. У каждого шарда своя блокировка записи и свой писатель
+(writer.py), поэтому большой импорт на одной площадке не задерживает
+сканирования на других.
+
+Площадка запроса берётся из параметра ``?site=``, заголовка
+``X-Warehouse-Site`` или из сессии (выбор пользователя) и кладётся в
+``database.current_site``: get_db, писатель и снимки отчётов открывают
+файл этой площадки. Сводные отчёты (``fan_out``) выполняют запрос во всех
+шардах параллельно в пуле потоков — SQLite отпускает GIL на время
+выполнения запроса — и склеивают результаты. Соединения на чтение
+кэшируются в потоках пула, по одному на шард.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import g, jsonify, request, session
+
+import database
+
+SITE_HEADER = 'X-Warehouse-Site'
+SITE_ARG = 'site'
+FAN_OUT_THREADS = int(os.environ.get('WAREHOUSE_FAN_OUT_THREADS', '8'))
+
+LOOKUP_QUERY = '''
+    SELECT p.barcode, p.name AS product_name, bi.quantity, b.id AS box_id, b.name AS box_name, z.name AS zone_name
+    FROM products p
+    JOIN box_items bi ON bi.product_id = p.id
+    JOIN boxes b ON bi.box_id = b.id
+    JOIN zones z ON b.zone_id = z.id
+    WHERE p.barcode = ? AND bi.quantity > 0
+    ORDER BY z.name, b.name
+'''
+
+TOTALS_QUERY = '''
+    SELECT (SELECT COUNT(*) FROM zones) AS zones,
+           (SELECT COUNT(*) FROM boxes) AS boxes,
+           COUNT(*) AS items,
+           COUNT(DISTINCT product_id) AS products,
+           COALESCE(SUM(quantity), 0) AS units
+    FROM box_items WHERE quantity > 0
+'''
+# Товары одной площадки могут быть и на другой — их число не суммируется
+SUMMABLE_TOTALS = ('zones', 'boxes', 'items', 'units')
+
+
+def init_sites(app):
+    @app.before_request
+    def select_site():
+        if not database.SITES:
+            return None
+        requested = request.args.get(SITE_ARG) or request.headers.get(SITE_HEADER)
+        if requested is not None and requested not in database.SITES:
+            return jsonify({'success': False, 'error': f'Unknown site: {requested}'}), 404
+        site = requested or session.get('site')
+        if site not in database.SITES:
+            # Площадку из сессии могли убрать из конфигурации
+            site = database.DEFAULT_SITE
+        g._site_token = database.current_site.set(site)
+        return None
+
+    @app.teardown_request
+    def reset_site(exc):
+        token = g.pop('_site_token', None)
+        if token is not None:
+            database.current_site.reset(token)
+
+    @app.context_processor
+    def site_context():
+        return {'sites': list(database.SITES), 'current_site': database.current_site.get()}
+
+
+def current():
+    return database.current_site.get() or database.DEFAULT_SITE
+
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_local = threading.local()
+
+
+def _get_executor():
+    # Потоки пула не переживают fork воркеров (serve.py)
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(max_workers=FAN_OUT_THREADS, thread_name_prefix='fan-out')
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def _reader(site):
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(site)
+    if conn is None:
+        conn = connections[site] = database.get_db(site)
+    return conn
+
+
+def _run_in_site(fn, site):
+    token = database.current_site.set(site)
+    try:
+        return fn(_reader(site), site)
+    finally:
+        database.current_site.reset(token)
+
+
+def fan_out(fn, sites=None):
+    """Выполняет fn(db, site) в каждом шарде параллельно -> {site: результат}.
+
+    Без площадок — один вызов с site=None для единственной базы.
+    """
+    sites = list(sites or database.SITES) or [None]
+    executor = _get_executor()
+    futures = {site: executor.submit(_run_in_site, fn, site) for site in sites}
+    return {site: future.result() for site, future in futures.items()}
+
+
+def lookup_barcode(barcode):
+    """Где лежит товар на всех площадках"""
+    def query(db, site):
+        return [dict(row, site=site) for row in db.execute(LOOKUP_QUERY, (barcode,))]
+
+    return [row for rows in fan_out(query).values() for row in rows]
+
+
+def totals():
+    """Зоны, коробки, позиции и остаток по площадкам и в сумме"""
+    def query(db, site):
+        return dict(db.execute(TOTALS_QUERY).fetchone())
+
+    by_site = fan_out(query)
+    total = {key: sum(row[key] for row in by_site.values()) for key in SUMMABLE_TOTALS}
+    return {'sites': by_site, 'total': total}
@@ -0,0 +1,98 @@
+"""Снимок базы для тяжёлых отчётов.
+
+Выгрузки в Excel читают базу несколькими запросами, пока сканеры пишут;
+в WAL каждый запрос видит свою точку во времени, а длинное чтение держит
+метку в журнале и не даёт контрольной точке его укоротить. С включённым
+снимком отчёт сначала копирует базу backup API (одна короткая транзакция
+чтения) и дальше работает только с копией: все листы книги — из одного
+момента, а писатель с отчётом больше не пересекается.
+
+Режим задаётся ``WAREHOUSE_REPORT_SNAPSHOT`` (конфигурация
+``REPORT_SNAPSHOT``):
+
+- ``off`` — отчёты читают рабочую базу, как раньше;
+- ``memory`` — копия в памяти процесса (размер базы на каждый отчёт);
+- ``file`` — копия во временном файле в ``REPORT_SNAPSHOT_DIR``.
+"""
+import os
+import sqlite3
+import tempfile
+
+from flask import current_app, g
+
+import database
+
+SNAPSHOT_MODES = ('off', 'memory', 'file')
+
+
+def init_snapshots(app):
+    mode = app.config.setdefault('REPORT_SNAPSHOT', os.environ.get('WAREHOUSE_REPORT_SNAPSHOT', 'off'))
+    if mode not in SNAPSHOT_MODES:
+        raise ValueError(f'REPORT_SNAPSHOT must be one of {", ".join(SNAPSHOT_MODES)}, got {mode!r}')
+    app.config.setdefault('REPORT_SNAPSHOT_DIR', os.environ.get('WAREHOUSE_REPORT_SNAPSHOT_DIR'))
+
+    @app.teardown_appcontext
+    def close_snapshot(exc):
+        snapshot = g.pop('_report_snapshot', None)
+        if snapshot is not None:
+            conn, path = snapshot
+            conn.close()
+            if path:
+                _unlink(path)
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def take_snapshot(source, target_path=':memory:'):
+    """Копирует базу ``source`` в ``target_path`` за один шаг backup API.
+
+    pages=-1: копирование идёт в одной транзакции чтения, поэтому снимок
+    согласован, а писатель в WAL её не ждёт и не прерывает.
+    """
+    target = sqlite3.connect(target_path, check_same_thread=False)
+    try:
+        source.backup(target, pages=-1)
+    except Exception:
+        target.close()
+        raise
+    target.row_factory = sqlite3.Row
+    for hook in database.connection_hooks:
+        # План запроса в копии тот же, что и в рабочей базе
+        hook(target, database.db_path())
+    return target
+
+
+def report_db():
+    """Соединение для отчёта: снимок (если включён) или рабочая база.
+
+    Снимок один на запрос и закрывается (файл удаляется) при завершении
+    контекста приложения.
+    """
+    mode = current_app.config['REPORT_SNAPSHOT']
+    if mode == 'off':
+        return database.get_db()
+    snapshot = g.get('_report_snapshot')
+    if snapshot is not None:
+        return snapshot[0]
+
+    path = None
+    if mode == 'file':
+        fd, path = tempfile.mkstemp(prefix='warehouse-report-', suffix='.db',
+                                    dir=current_app.config['REPORT_SNAPSHOT_DIR'])
+        os.close(fd)
+    source = database.get_db()
+    try:
+        conn = take_snapshot(source, path or ':memory:')
+    except Exception:
+        if path:
+            _unlink(path)
+        raise
+    finally:
+        source.close()
+    g._report_snapshot = (conn, path)
+    return conn
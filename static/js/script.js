@@ -254,6 +254,7 @@ class ModalManager {
         document.getElementById('itemForm').reset();
         document.getElementById('itemId').value = '';
         document.getElementById('quantity').value = 1;
+        document.getElementById('renameEverywhereGroup').hidden = true;
         this.show(this.modals.item);
     }
 
@@ -263,6 +264,9 @@ class ModalManager {
         document.getElementById('productName').value = productName;
         document.getElementById('quantity').value = quantity;
         document.getElementById('barcode').value = barcode || '';
+        // A barcoded product's name is shared: renaming it is an explicit choice
+        document.getElementById('renameEverywhere').checked = false;
+        document.getElementById('renameEverywhereGroup').hidden = !barcode;
         this.show(this.modals.item);
     }
 
@@ -271,6 +275,18 @@ class ModalManager {
         this.stopScanner();
         
         const checkProduct = async () => {
+            // Already in this box: the page (kept current by live updates) has the name
+            const inBox = document.querySelector(`.edit-item-button[data-barcode="${CSS.escape(barcode)}"]`);
+            if (inBox) return { product_name: inBox.getAttribute('data-product-name') };
+            if (scans) {
+                try {
+                    const name = await scans.lookup(barcode);
+                    if (name !== undefined) return name === null ? null : { product_name: name };
+                } catch (error) {
+                    console.error('Catalogue lookup error:', error);
+                }
+            }
+            // No local catalogue yet: ask the server
             try {
                 const boxId = document.getElementById('boxId')?.value;
                 if (!boxId) return null;
@@ -323,7 +339,44 @@ class ModalManager {
 }
 
 // API functions
+const RETRY_STATUSES = [409, 502, 503, 504];
+
 class ApiManager {
+    // Mutating request with an Idempotency-Key: every retry after a network error or timeout
+    // reuses the key, so the server applies the change once and replays its first response.
+    // 409 means the first attempt is still being processed.
+    static async send(url, options = {}, timeoutMs = 15000, attempts = 4) {
+        const headers = Object.assign({}, options.headers, { 'Idempotency-Key': ApiManager.idempotencyKey() });
+        let delay = 500;
+        for (let attempt = 1; ; attempt++) {
+            const controller = new AbortController();
+            const timer = timeoutMs ? setTimeout(() => controller.abort(), timeoutMs) : null;
+            let response = null;
+            try {
+                response = await fetch(url, Object.assign({}, options, { headers, signal: controller.signal }));
+            } catch (error) {
+                if (attempt >= attempts) throw error;
+            } finally {
+                clearTimeout(timer);
+            }
+            if (response && (attempt >= attempts || !RETRY_STATUSES.includes(response.status))) return response;
+            await new Promise(resolve => setTimeout(resolve, delay));
+            delay *= 2;
+        }
+    }
+
+    static idempotencyKey() {
+        if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+        // randomUUID needs HTTPS or localhost; getRandomValues works on plain HTTP too
+        const bytes = crypto.getRandomValues(new Uint8Array(16));
+        return Array.from(bytes, b => b.toString(16).padStart(2, '0')).join('');
+    }
+
+    // After a change: the live stream patches the page itself, otherwise reload it
+    static refresh() {
+        if (!live || !live.connected) location.reload();
+    }
+
     static async saveZone() {
         const formData = {
             name: document.getElementById('zoneName').value,
@@ -335,14 +388,15 @@ class ApiManager {
         const method = zoneId ? 'PUT' : 'POST';
         
         try {
-            const response = await fetch(url, {
+            const response = await ApiManager.send(url, {
                 method: method,
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify(formData)
             });
             
             if (response.ok) {
-                location.reload();
+                window.closeZoneModal();
+                ApiManager.refresh();
             } else {
                 alert('Ошибка при сохранении зоны');
             }
@@ -355,8 +409,8 @@ class ApiManager {
         if (!confirm('Удалить зону и все коробки?')) return;
         
         try {
-            const response = await fetch(`/api/zones/${id}`, { method: 'DELETE' });
-            if (response.ok) location.reload();
+            const response = await ApiManager.send(`/api/zones/${id}`, { method: 'DELETE' });
+            if (response.ok) ApiManager.refresh();
             else alert('Ошибка удаления');
         } catch (error) {
             alert('Ошибка: ' + error.message);
@@ -375,14 +429,15 @@ class ApiManager {
         const method = boxId ? 'PUT' : 'POST';
         
         try {
-            const response = await fetch(url, {
+            const response = await ApiManager.send(url, {
                 method: method,
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify(formData)
             });
             
             if (response.ok) {
-                location.reload();
+                window.closeBoxModal();
+                ApiManager.refresh();
             } else {
                 alert('Ошибка при сохранении коробки');
             }
@@ -395,8 +450,8 @@ class ApiManager {
         if (!confirm('Удалить коробку и все товары?')) return;
         
         try {
-            const response = await fetch(`/api/boxes/${id}`, { method: 'DELETE' });
-            if (response.ok) location.reload();
+            const response = await ApiManager.send(`/api/boxes/${id}`, { method: 'DELETE' });
+            if (response.ok) ApiManager.refresh();
             else alert('Ошибка удаления');
         } catch (error) {
             alert('Ошибка: ' + error.message);
@@ -417,18 +472,23 @@ class ApiManager {
         }
         
         const itemId = document.getElementById('itemId').value;
+        if (itemId) formData.rename_everywhere = document.getElementById('renameEverywhere').checked;
         const url = itemId ? `/api/box_items/${itemId}` : '/api/box_items';
         const method = itemId ? 'PUT' : 'POST';
         
         try {
-            const response = await fetch(url, {
+            const response = await ApiManager.send(url, {
                 method: method,
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify(formData)
             });
             
             if (response.ok) {
-                location.reload();
+                modals.hide(modals.modals.item);
+                ApiManager.refresh();
+            } else if (response.status === 400 && itemId) {
+                alert('Название товара со штрих-кодом общее для всех коробок. ' +
+                      'Отметьте «Переименовать во всех коробках и приёмках», чтобы сменить его');
             } else {
                 alert('Ошибка при сохранении товара');
             }
@@ -441,8 +501,8 @@ class ApiManager {
         if (!confirm('Удалить товар?')) return;
         
         try {
-            const response = await fetch(`/api/box_items/${id}`, { method: 'DELETE' });
-            if (response.ok) location.reload();
+            const response = await ApiManager.send(`/api/box_items/${id}`, { method: 'DELETE' });
+            if (response.ok) ApiManager.refresh();
             else alert('Ошибка удаления');
         } catch (error) {
             alert('Ошибка: ' + error.message);
@@ -462,8 +522,20 @@ class ApiManager {
         
         const formData = { product_name: productName, barcode, quantity, box_id: boxId };
         
+        if (scans) {
+            // Queued locally and sent in bulk: works offline, the modal closes at once
+            try {
+                await scans.enqueue(Object.assign(formData, { box_id: Number(boxId) }));
+                modals.hide(modals.modals.quantity);
+                scans.flush();
+            } catch (error) {
+                alert('Ошибка: ' + error.message);
+            }
+            return;
+        }
+        
         try {
-            const response = await fetch('/api/box_items', {
+            const response = await ApiManager.send('/api/box_items', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify(formData)
@@ -471,7 +543,7 @@ class ApiManager {
             
             if (response.ok) {
                 modals.hide(modals.modals.quantity);
-                location.reload();
+                ApiManager.refresh();
             } else {
                 alert('Ошибка при добавлении товара');
             }
@@ -521,10 +593,338 @@ class ApiManager {
             alert('Ошибка: ' + error.message);
         }
     }
+
+    static async startStocktake(scope) {
+        try {
+            const response = await ApiManager.send('/api/stocktakes', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify(scope)
+            });
+            const result = await response.json();
+            if (result.success) {
+                window.location.href = `/stocktake/${result.id}`;
+            } else {
+                alert('Ошибка: ' + result.error);
+            }
+        } catch (error) {
+            alert('Ошибка: ' + error.message);
+        }
+    }
+
+    static async selectSite(site) {
+        try {
+            const response = await fetch('/api/sites/select', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ site })
+            });
+            
+            if (response.ok) {
+                // Зоны и коробки у каждой площадки свои — открываем список зон
+                window.location.href = '/';
+            } else {
+                alert('Ошибка при выборе площадки');
+            }
+        } catch (error) {
+            alert('Ошибка: ' + error.message);
+        }
+    }
+}
+
+// Live updates: server-sent change events patch the page in place
+class LiveUpdates {
+    constructor(lastEventId) {
+        this.connected = false;
+        if (!window.EventSource) return;
+        this.source = new EventSource(`/api/events?last_event_id=${encodeURIComponent(lastEventId)}`);
+        this.source.onopen = () => { this.connected = true; };
+        // EventSource reconnects by itself and resumes from Last-Event-ID
+        this.source.onerror = () => { this.connected = false; };
+        this.source.onmessage = (message) => JSON.parse(message.data).forEach(event => this.apply(event));
+        // Missed events were already pruned on the server
+        this.source.addEventListener('reset', () => location.reload());
+    }
+
+    apply(event) {
+        if (event.type === 'item') this.applyItem(event);
+        else if (event.type === 'product') this.applyProduct(event);
+        else if (event.type === 'box') this.applyBox(event);
+        else if (event.type === 'zone') this.applyZone(event);
+    }
+
+    applyItem(item) {
+        const list = document.querySelector('.items-list[data-box-id]');
+        if (!list) return;
+        const card = list.querySelector(`.item-card[data-item-id="${item.id}"]`);
+        if (card) card.remove();
+        if (!item.deleted && String(item.box_id) === list.dataset.boxId) {
+            LiveUpdates.place(list, '.item-card', LiveUpdates.itemCard(item), item.product_name);
+        }
+
+        let placeholder = list.querySelector('.no-items');
+        const empty = !list.querySelector('.item-card');
+        if (empty && !placeholder) {
+            list.appendChild(LiveUpdates.element('p', 'no-items', 'В коробке пока нет товаров'));
+        } else if (!empty && placeholder) {
+            placeholder.remove();
+        }
+    }
+
+    applyProduct(product) {
+        if (product.deleted) return;
+        document.querySelectorAll(`.item-card[data-product-id="${product.id}"]`).forEach(card => {
+            card.querySelector('h4').textContent = product.name;
+            card.querySelector('.item-barcode').textContent = `Штрих-код: ${product.barcode || 'Не указан'}`;
+            const editButton = card.querySelector('.edit-item-button');
+            editButton.setAttribute('data-product-name', product.name);
+            editButton.setAttribute('data-barcode', product.barcode || '');
+        });
+    }
+
+    applyBox(box) {
+        const title = document.querySelector(`#boxTitle[data-box-id="${box.id}"]`);
+        if (title) {
+            if (box.deleted) window.location.href = '/';
+            else title.textContent = box.name;
+        }
+        const grid = document.querySelector('.boxes-grid[data-zone-id]');
+        if (!grid) return;
+        const card = grid.querySelector(`.box-card[data-box-id="${box.id}"]`);
+        if (card) card.remove();
+        if (!box.deleted && String(box.zone_id) === grid.dataset.zoneId) {
+            LiveUpdates.place(grid, '.box-card', LiveUpdates.card('box', box), box.name);
+        }
+    }
+
+    applyZone(zone) {
+        const title = document.querySelector(`#zoneTitle[data-zone-id="${zone.id}"]`);
+        if (title) {
+            if (zone.deleted) window.location.href = '/';
+            else title.textContent = zone.name;
+        }
+        const grid = document.querySelector('.zones-grid');
+        if (!grid) return;
+        const card = grid.querySelector(`.zone-card[data-zone-id="${zone.id}"]`);
+        if (card) card.remove();
+        if (!zone.deleted) {
+            LiveUpdates.place(grid, '.zone-card', LiveUpdates.card('zone', zone), zone.name);
+        }
+    }
+
+    // Cards are kept in name order, as rendered by the server
+    static place(container, selector, card, name) {
+        const next = Array.from(container.querySelectorAll(selector))
+            .find(other => other.querySelector('h3, h4').textContent.localeCompare(name) > 0);
+        container.insertBefore(card, next || null);
+        card.classList.add('live-updated');
+        setTimeout(() => card.classList.remove('live-updated'), 1500);
+    }
+
+    static element(tag, className, text) {
+        const element = document.createElement(tag);
+        if (className) element.className = className;
+        if (text !== undefined) element.textContent = text;
+        return element;
+    }
+
+    static iconButton(className, icon, data) {
+        const button = LiveUpdates.element('button', `btn-icon ${className}`);
+        Object.entries(data).forEach(([key, value]) => button.setAttribute(`data-${key}`, value ?? ''));
+        button.appendChild(LiveUpdates.element('i', `fas ${icon}`));
+        return button;
+    }
+
+    // Same markup as the item cards in box_detail.html
+    static itemCard(item) {
+        const card = LiveUpdates.element('div', 'item-card');
+        card.setAttribute('data-item-id', item.id);
+        card.setAttribute('data-product-id', item.product_id);
+        const info = LiveUpdates.element('div', 'item-info');
+        info.append(
+            LiveUpdates.element('h4', null, item.product_name),
+            LiveUpdates.element('p', 'item-barcode', `Штрих-код: ${item.barcode || 'Не указан'}`),
+            LiveUpdates.element('p', 'item-quantity', `Количество: ${item.quantity}`)
+        );
+        const actions = LiveUpdates.element('div', 'item-actions');
+        actions.append(
+            LiveUpdates.iconButton('edit-item-button', 'fa-edit', {
+                'item-id': item.id, 'product-name': item.product_name, 'quantity': item.quantity, 'barcode': item.barcode
+            }),
+            LiveUpdates.iconButton('btn-danger delete-item-button', 'fa-trash', { 'item-id': item.id })
+        );
+        card.append(info, actions);
+        return card;
+    }
+
+    // Same markup as the zone cards in index.html and box cards in zone_detail.html
+    static card(kind, entity) {
+        const card = LiveUpdates.element('div', `${kind}-card`);
+        card.setAttribute(`data-${kind}-id`, entity.id);
+        const header = LiveUpdates.element('div', `${kind}-header`);
+        const actions = LiveUpdates.element('div', `${kind}-actions`);
+        actions.append(
+            LiveUpdates.iconButton(`edit-${kind}-btn`, 'fa-edit', {
+                [`${kind}-id`]: entity.id, [`${kind}-name`]: entity.name, [`${kind}-description`]: entity.description
+            }),
+            LiveUpdates.iconButton(`btn-danger delete-${kind}-btn`, 'fa-trash', { [`${kind}-id`]: entity.id })
+        );
+        header.append(LiveUpdates.element('h3', null, entity.name), actions);
+        card.appendChild(header);
+        if (entity.description) {
+            card.appendChild(LiveUpdates.element('p', `${kind}-description`, entity.description));
+        }
+        return card;
+    }
+}
+
+// Offline scanning on the box page: a local copy of the barcode catalogue and a scan queue
+// in IndexedDB (catalog.py). The catalogue catches up by change sequence, so names are
+// looked up without a round trip; scans are queued with their own idempotency key and
+// synced in bulk when the network is back, so a resent scan is never applied twice.
+const SCAN_FLUSH_MS = 5000;
+const SCAN_BATCH = 500;
+
+class ScanStore {
+    constructor(site) {
+        this.site = site;
+        this.name = site ? `warehouse-${site}` : 'warehouse';
+        this.db = null;
+        this.syncing = null;
+        this.flushing = null;
+    }
+
+    // The cache and the queue belong to one site: requests name it instead of
+    // relying on the session, which another tab may have switched
+    headers(extra = {}) {
+        return this.site ? Object.assign({ 'X-Warehouse-Site': this.site }, extra) : extra;
+    }
+
+    static request(request) {
+        return new Promise((resolve, reject) => {
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => reject(request.error);
+        });
+    }
+
+    static done(transaction) {
+        return new Promise((resolve, reject) => {
+            transaction.oncomplete = () => resolve();
+            transaction.onerror = transaction.onabort = () => reject(transaction.error);
+        });
+    }
+
+    open() {
+        if (!this.db) {
+            const request = indexedDB.open(this.name, 1);
+            request.onupgradeneeded = () => {
+                const db = request.result;
+                db.createObjectStore('products', { keyPath: 'id' }).createIndex('barcode', 'barcode');
+                db.createObjectStore('meta');
+                db.createObjectStore('queue', { keyPath: 'key' });
+            };
+            this.db = ScanStore.request(request);
+        }
+        return this.db;
+    }
+
+    async store(name, mode = 'readonly') {
+        const db = await this.open();
+        return db.transaction(name, mode).objectStore(name);
+    }
+
+    // Change sequence of the local copy; undefined until the first sync
+    async seq() {
+        return ScanStore.request((await this.store('meta')).get('seq'));
+    }
+
+    sync() {
+        if (this.syncing) return this.syncing;
+        this.syncing = (async () => {
+            let seq = (await this.seq()) || 0;
+            for (;;) {
+                const response = await fetch(`/api/catalog?since=${seq}`, { headers: this.headers() });
+                const data = await response.json();
+                if (!data.success) throw new Error(data.error);
+                const db = await this.open();
+                const transaction = db.transaction(['products', 'meta'], 'readwrite');
+                const products = transaction.objectStore('products');
+                // The server database was restored from a backup: start over
+                if (data.reset) products.clear();
+                data.deleted.forEach(id => products.delete(id));
+                data.items.forEach(([id, barcode, name]) => products.put({ id, barcode, name }));
+                transaction.objectStore('meta').put(data.seq, 'seq');
+                await ScanStore.done(transaction);
+                seq = data.seq;
+                if (!data.more) return seq;
+            }
+        })().finally(() => { this.syncing = null; });
+        return this.syncing;
+    }
+
+    // Product name by barcode; null if unknown, undefined if the catalogue was never synced
+    async lookup(barcode) {
+        if ((await this.seq()) === undefined) return undefined;
+        const product = await ScanStore.request((await this.store('products')).index('barcode').get(barcode));
+        return product ? product.name : null;
+    }
+
+    async enqueue(scan) {
+        const queue = await this.store('queue', 'readwrite');
+        await ScanStore.request(queue.put(Object.assign({ key: ApiManager.idempotencyKey(), created_at: Date.now() }, scan)));
+        this.updatePending();
+    }
+
+    async updatePending() {
+        const label = document.getElementById('pendingScans');
+        if (!label) return;
+        const count = await ScanStore.request((await this.store('queue')).count());
+        label.textContent = `Не отправлено: ${count}`;
+        label.style.display = count ? '' : 'none';
+    }
+
+    flush() {
+        if (this.flushing) return this.flushing;
+        this.flushing = (async () => {
+            let synced = 0;
+            for (;;) {
+                const scans = await ScanStore.request((await this.store('queue')).getAll(null, SCAN_BATCH));
+                if (!scans.length) break;
+                const response = await ApiManager.send('/api/box_items/bulk', {
+                    method: 'POST',
+                    headers: this.headers({ 'Content-Type': 'application/json' }),
+                    body: JSON.stringify({ scans })
+                });
+                const data = await response.json();
+                if (!data.success) throw new Error(data.error);
+                // Applied now, applied by an earlier send and rejected scans all leave the queue
+                const db = await this.open();
+                const transaction = db.transaction('queue', 'readwrite');
+                data.applied.concat(data.duplicates, data.rejected).forEach(key => transaction.objectStore('queue').delete(key));
+                await ScanStore.done(transaction);
+                if (data.rejected.length) console.warn('Scans rejected by the server:', data.rejected);
+                synced += data.applied.length;
+            }
+            if (synced) {
+                ApiManager.refresh();
+                // New products from the synced scans
+                this.sync().catch(error => console.warn('Catalogue sync failed:', error));
+            }
+        })()
+        // Offline: the queue stays in IndexedDB until the next attempt
+        .catch(error => console.warn('Scan sync failed:', error))
+        .finally(() => {
+            this.flushing = null;
+            this.updatePending();
+        });
+        return this.flushing;
+    }
 }
 
 // Initialize application
 let modals;
+let live = null;
+let scans = null;
 
 document.addEventListener('DOMContentLoaded', function() {
     modals = new ModalManager();
@@ -548,23 +948,36 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
-    // Edit item buttons
-    document.querySelectorAll('.edit-item-button').forEach(btn => {
-        btn.addEventListener('click', function() {
-            const itemId = this.getAttribute('data-item-id');
-            const productName = this.getAttribute('data-product-name');
-            const quantity = this.getAttribute('data-quantity');
-            const barcode = this.getAttribute('data-barcode');
-            modals.showEditItemModal(itemId, productName, quantity, barcode);
-        });
-    });
+    // Card buttons and card clicks (delegated: live updates add and replace cards)
+    document.addEventListener('click', function(e) {
+        const button = e.target.closest('.btn-icon');
+        if (button) {
+            if (button.classList.contains('edit-item-button')) {
+                modals.showEditItemModal(button.getAttribute('data-item-id'), button.getAttribute('data-product-name'),
+                                         button.getAttribute('data-quantity'), button.getAttribute('data-barcode'));
+            } else if (button.classList.contains('delete-item-button')) {
+                ApiManager.deleteItem(button.getAttribute('data-item-id'));
+            } else if (button.classList.contains('edit-zone-btn')) {
+                window.editZone(button.getAttribute('data-zone-id'), button.getAttribute('data-zone-name'),
+                                button.getAttribute('data-zone-description'));
+            } else if (button.classList.contains('delete-zone-btn')) {
+                window.deleteZone(button.getAttribute('data-zone-id'));
+            } else if (button.classList.contains('edit-box-btn')) {
+                window.editBox(button.getAttribute('data-box-id'), button.getAttribute('data-box-name'),
+                               button.getAttribute('data-box-description'));
+            } else if (button.classList.contains('delete-box-btn')) {
+                window.deleteBox(button.getAttribute('data-box-id'));
+            }
+            return;
+        }
 
-    // Delete item buttons
-    document.querySelectorAll('.delete-item-button').forEach(btn => {
-        btn.addEventListener('click', function() {
-            const itemId = this.getAttribute('data-item-id');
-            ApiManager.deleteItem(itemId);
-        });
+        const card = e.target.closest('.zone-card, .box-card');
+        if (card) {
+            const zoneId = card.getAttribute('data-zone-id');
+            const boxId = card.getAttribute('data-box-id');
+            if (zoneId) window.location.href = `/zone/${zoneId}`;
+            if (boxId) window.location.href = `/box/${boxId}`;
+        }
     });
 
     // Scanner modal buttons
@@ -637,24 +1050,6 @@ document.addEventListener('DOMContentLoaded', function() {
         addZoneBtn.addEventListener('click', () => window.showAddZoneModal());
     }
 
-    const editZoneBtns = document.querySelectorAll('.edit-zone-btn');
-    editZoneBtns.forEach(btn => {
-        btn.addEventListener('click', function() {
-            const zoneId = this.getAttribute('data-zone-id');
-            const zoneName = this.getAttribute('data-zone-name');
-            const zoneDescription = this.getAttribute('data-zone-description');
-            window.editZone(zoneId, zoneName, zoneDescription);
-        });
-    });
-
-    const deleteZoneBtns = document.querySelectorAll('.delete-zone-btn');
-    deleteZoneBtns.forEach(btn => {
-        btn.addEventListener('click', function() {
-            const zoneId = this.getAttribute('data-zone-id');
-            window.deleteZone(zoneId);
-        });
-    });
-
     const closeZoneModal = document.getElementById('closeZoneModal');
     if (closeZoneModal) {
         closeZoneModal.addEventListener('click', () => window.closeZoneModal());
@@ -676,24 +1071,6 @@ document.addEventListener('DOMContentLoaded', function() {
         addBoxBtn.addEventListener('click', () => window.showAddBoxModal());
     }
 
-    const editBoxBtns = document.querySelectorAll('.edit-box-btn');
-    editBoxBtns.forEach(btn => {
-        btn.addEventListener('click', function() {
-            const boxId = this.getAttribute('data-box-id');
-            const boxName = this.getAttribute('data-box-name');
-            const boxDescription = this.getAttribute('data-box-description');
-            window.editBox(boxId, boxName, boxDescription);
-        });
-    });
-
-    const deleteBoxBtns = document.querySelectorAll('.delete-box-btn');
-    deleteBoxBtns.forEach(btn => {
-        btn.addEventListener('click', function() {
-            const boxId = this.getAttribute('data-box-id');
-            window.deleteBox(boxId);
-        });
-    });
-
     const closeBoxModal = document.getElementById('closeBoxModal');
     if (closeBoxModal) {
         closeBoxModal.addEventListener('click', () => window.closeBoxModal());
@@ -720,6 +1097,15 @@ document.addEventListener('DOMContentLoaded', function() {
         exportExcelBoxesBtn.addEventListener('click', () => ApiManager.exportToExcelBoxes());
     }
 
+    // Stocktake of the current box or zone
+    const startStocktakeBtn = document.getElementById('startStocktakeBtn');
+    if (startStocktakeBtn) {
+        startStocktakeBtn.addEventListener('click', () => {
+            const { boxId, zoneId } = startStocktakeBtn.dataset;
+            ApiManager.startStocktake(boxId ? { box_id: Number(boxId) } : { zone_id: Number(zoneId) });
+        });
+    }
+
     // Enter key handlers
     document.addEventListener('keypress', function(e) {
         if (e.key === 'Enter') {
@@ -742,15 +1128,23 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
-    // Card clicks
-    document.querySelectorAll('.zone-card, .box-card').forEach(card => {
-        card.addEventListener('click', function() {
-            const zoneId = this.getAttribute('data-zone-id');
-            const boxId = this.getAttribute('data-box-id');
-            if (zoneId) window.location.href = `/zone/${zoneId}`;
-            if (boxId) window.location.href = `/box/${boxId}`;
-        });
-    });
+    // Live updates from other stations (pages rendered with last_event_id)
+    const lastEventId = document.body.dataset.lastEventId;
+    if (lastEventId !== undefined) {
+        live = new LiveUpdates(lastEventId);
+    }
+
+    // Box page: local barcode catalogue and offline scan queue
+    if (document.querySelector('.items-list[data-box-id]') && window.indexedDB) {
+        scans = new ScanStore(document.body.dataset.site);
+        const catchUp = () => {
+            scans.sync().catch(error => console.warn('Catalogue sync failed:', error));
+            scans.flush();
+        };
+        catchUp();
+        window.addEventListener('online', catchUp);
+        setInterval(() => scans.flush(), SCAN_FLUSH_MS);
+    }
     document.addEventListener('DOMContentLoaded', function() {
     const mainContent = document.querySelector('.main');
     if (mainContent) {
@@ -802,4 +1196,7 @@ window.closeBoxModal = function() {
 }
 
 window.saveBox = ApiManager.saveBox;
-window.deleteBox = ApiManager.deleteBox;
\ No newline at end of file
+window.deleteBox = ApiManager.deleteBox;
+
+window.selectSite = ApiManager.selectSite;
+window.sendWithRetry = ApiManager.send;
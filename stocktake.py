@@ -0,0 +1,217 @@
+"""Инвентаризация коробки или зоны.
+
+Сканирования сессии копятся в ``stocktake_scans`` — по строке на
+(коробку, штрих-код), повтор штрих-кода прибавляет количество, — и
+остатков не трогают. Закрытие сессии считает расхождения с ``box_items``
+одним запросом по всей области (``DIFF_QUERY``): недостача, излишек,
+разница количества. Исправления, если их нужно применить, выполняются в
+одной транзакции писателя набором set-based запросов: остаток становится
+равным насчитанному, журнал движений и поток изменений получают их
+триггерами, как любое другое изменение.
+
+Считаются только товары со штрих-кодом: позиции без него отсканировать
+нельзя, и инвентаризация их не меняет.
+"""
+import json
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS stocktake_sessions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        zone_id INTEGER,
+        box_id INTEGER,
+        status TEXT NOT NULL DEFAULT 'open',
+        created_by TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        closed_at TIMESTAMP,
+        summary TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS stocktake_scans (
+        session_id INTEGER NOT NULL,
+        box_id INTEGER NOT NULL,
+        barcode TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        product_name TEXT,
+        PRIMARY KEY (session_id, box_id, barcode)
+    ) WITHOUT ROWID;
+'''
+
+# Статусы: open — идёт счёт, closed — расхождения посчитаны, applied — исправления внесены
+OPEN, CLOSED, APPLIED = 'open', 'closed', 'applied'
+
+# Коробки области сессии: одна коробка или все коробки зоны
+SCOPE = 'SELECT id FROM boxes WHERE id = :box_id OR zone_id = :zone_id'
+
+# Сканирования пачкой: строки вне области сессии отбрасываются
+ADD_SCANS = f'''
+    INSERT INTO stocktake_scans (session_id, box_id, barcode, quantity, product_name)
+    SELECT :session_id, box_id, barcode, SUM(quantity), MAX(product_name)
+    FROM (
+        SELECT CAST(json_extract(value, '$.box_id') AS INTEGER) AS box_id,
+               TRIM(json_extract(value, '$.barcode')) AS barcode,
+               CAST(COALESCE(json_extract(value, '$.quantity'), 1) AS INTEGER) AS quantity,
+               json_extract(value, '$.product_name') AS product_name
+        FROM json_each(:scans)
+    )
+    WHERE box_id IN ({SCOPE}) AND barcode != '' AND quantity > 0
+    GROUP BY box_id, barcode
+    ON CONFLICT (session_id, box_id, barcode) DO UPDATE SET
+        quantity = quantity + excluded.quantity,
+        product_name = COALESCE(product_name, excluded.product_name)
+'''
+
+# Расхождения по (коробке, штрих-коду): ожидаемое из box_items против насчитанного
+DIFF_QUERY = f'''
+    SELECT d.box_id, d.barcode, SUM(d.expected) AS expected, SUM(d.counted) AS counted,
+           MAX(d.product_name) AS scanned_name
+    FROM (
+        SELECT bi.box_id, p.barcode, bi.quantity AS expected, 0 AS counted, NULL AS product_name
+        FROM box_items bi
+        JOIN products p ON p.id = bi.product_id
+        WHERE bi.box_id IN ({SCOPE}) AND p.barcode IS NOT NULL
+        UNION ALL
+        SELECT box_id, barcode, 0, quantity, product_name
+        FROM stocktake_scans WHERE session_id = :session_id
+    ) d
+    GROUP BY d.box_id, d.barcode
+    HAVING SUM(d.expected) != SUM(d.counted)
+'''
+
+DIFF_DETAILS = '''
+    SELECT d.box_id, b.name AS box_name, d.barcode, COALESCE(p.name, d.scanned_name) AS product_name,
+           d.expected, d.counted, d.counted - d.expected AS delta,
+           CASE WHEN d.counted = 0 THEN 'missing' WHEN d.expected = 0 THEN 'surplus' ELSE 'delta' END AS kind
+    FROM stocktake_diff d
+    JOIN boxes b ON b.id = d.box_id
+    LEFT JOIN products p ON p.barcode = d.barcode
+    ORDER BY b.name, d.barcode
+'''
+
+APPLY = [
+    # Товары, впервые встреченные при пересчёте
+    '''
+    INSERT OR IGNORE INTO products (barcode, name)
+    SELECT barcode, COALESCE(MAX(scanned_name), barcode) FROM stocktake_diff
+    WHERE counted > 0 AND barcode NOT IN (SELECT barcode FROM products WHERE barcode IS NOT NULL)
+    GROUP BY barcode
+    ''',
+    'DROP TABLE IF EXISTS temp.stocktake_targets',
+    '''
+    CREATE TEMP TABLE stocktake_targets AS
+    SELECT d.box_id, p.id AS product_id, d.counted FROM stocktake_diff d JOIN products p ON p.barcode = d.barcode
+    ''',
+    'CREATE INDEX temp.idx_stocktake_targets ON stocktake_targets (box_id, product_id)',
+    # Насчитанное — в первую позицию товара в коробке, остальные позиции обнуляются
+    # (нулевые строки удаляет обслуживание — maintenance.py)
+    '''
+    UPDATE box_items
+    SET quantity = CASE
+        WHEN id = (SELECT MIN(id) FROM box_items other
+                   WHERE other.box_id = box_items.box_id AND other.product_id = box_items.product_id)
+        THEN (SELECT t.counted FROM stocktake_targets t
+              WHERE t.box_id = box_items.box_id AND t.product_id = box_items.product_id)
+        ELSE 0 END
+    WHERE (box_id, product_id) IN (SELECT box_id, product_id FROM stocktake_targets)
+    ''',
+    # Излишки товаров, которых в коробке не было
+    '''
+    INSERT INTO box_items (box_id, product_id, quantity)
+    SELECT t.box_id, t.product_id, t.counted FROM stocktake_targets t
+    WHERE t.counted > 0 AND NOT EXISTS (
+        SELECT 1 FROM box_items bi WHERE bi.box_id = t.box_id AND bi.product_id = t.product_id
+    )
+    ''',
+]
+
+
+def init_stocktake(db):
+    db.executescript(SCHEMA)
+
+
+class StocktakeError(ValueError):
+    """Сессия не найдена или не в том состоянии"""
+
+
+def _session(db, session_id, statuses):
+    row = db.execute('SELECT * FROM stocktake_sessions WHERE id = ?', (session_id,)).fetchone()
+    if row is None:
+        raise StocktakeError('Stocktake session not found')
+    if row['status'] not in statuses:
+        raise StocktakeError(f'Stocktake session is {row["status"]}')
+    return row
+
+
+def _scope(row, **params):
+    return dict(params, session_id=row['id'], box_id=row['box_id'], zone_id=row['zone_id'])
+
+
+# Операции писателя (writer.py)
+
+def create(db, zone_id=None, box_id=None, username=None):
+    if (zone_id is None) == (box_id is None):
+        raise StocktakeError('Either zone_id or box_id is required')
+    table, target = ('zones', zone_id) if zone_id is not None else ('boxes', box_id)
+    if not db.execute(f'SELECT 1 FROM {table} WHERE id = ?', (target,)).fetchone():
+        raise StocktakeError('Zone not found' if zone_id is not None else 'Box not found')
+    return db.execute('INSERT INTO stocktake_sessions (zone_id, box_id, created_by) VALUES (?, ?, ?)',
+                      (zone_id, box_id, username)).lastrowid
+
+
+def add_scans(db, session_id, scans):
+    """Пачка сканирований [{box_id, barcode, quantity?, product_name?}] -> число строк
+    (коробка, штрих-код), которые она добавила или увеличила.
+
+    Без quantity сканирование считается за одну штуку; в сессии по коробке
+    box_id можно не указывать. Коробки вне области сессии пропускаются.
+    """
+    row = _session(db, session_id, (OPEN,))
+    if row['box_id'] is not None:
+        scans = [dict(scan, box_id=scan.get('box_id') or row['box_id']) for scan in scans]
+    return db.execute(ADD_SCANS, _scope(row, scans=json.dumps(scans))).rowcount
+
+
+def close(db, session_id, apply=False):
+    """Считает расхождения; с apply=True вносит исправления в той же транзакции.
+
+    Закрытую сессию можно закрыть ещё раз — расхождения пересчитываются по
+    текущим остаткам.
+    """
+    row = _session(db, session_id, (OPEN, CLOSED))
+    db.execute('DROP TABLE IF EXISTS temp.stocktake_diff')
+    db.execute(f'CREATE TEMP TABLE stocktake_diff AS {DIFF_QUERY}', _scope(row))
+    changes = [dict(change) for change in db.execute(DIFF_DETAILS)]
+    counted = db.execute('SELECT COUNT(*), COALESCE(SUM(quantity), 0) FROM stocktake_scans WHERE session_id = ?',
+                         (session_id,)).fetchone()
+    summary = {
+        'counted_lines': counted[0],
+        'counted_units': counted[1],
+        'missing': sum(1 for change in changes if change['kind'] == 'missing'),
+        'surplus': sum(1 for change in changes if change['kind'] == 'surplus'),
+        'delta': sum(1 for change in changes if change['kind'] == 'delta'),
+        'units_delta': sum(change['delta'] for change in changes),
+    }
+    if apply:
+        for statement in APPLY:
+            db.execute(statement)
+    db.execute('''
+        UPDATE stocktake_sessions SET status = ?, closed_at = COALESCE(closed_at, CURRENT_TIMESTAMP), summary = ?
+        WHERE id = ?
+    ''', (APPLIED if apply else CLOSED, json.dumps(summary), session_id))
+    return {'status': APPLIED if apply else CLOSED, 'summary': summary, 'changes': changes}
+
+
+def get(db, session_id):
+    row = db.execute('''
+        SELECT s.*, z.name AS zone_name, b.name AS box_name,
+               (SELECT COUNT(*) FROM stocktake_scans WHERE session_id = s.id) AS counted_lines,
+               (SELECT COALESCE(SUM(quantity), 0) FROM stocktake_scans WHERE session_id = s.id) AS counted_units
+        FROM stocktake_sessions s
+        LEFT JOIN zones z ON z.id = s.zone_id
+        LEFT JOIN boxes b ON b.id = s.box_id
+        WHERE s.id = ?
+    ''', (session_id,)).fetchone()
+    if row is None:
+        return None
+    session = dict(row)
+    session['summary'] = json.loads(session['summary']) if session['summary'] else None
+    return session
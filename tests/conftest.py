@@ -0,0 +1,49 @@
+import os
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+
+@pytest.fixture(scope='session')
+def warehouse_app(tmp_path_factory):
+    """Приложение на временной базе; модули читают WAREHOUSE_DB при импорте"""
+    workdir = tmp_path_factory.mktemp('warehouse')
+    os.environ['WAREHOUSE_DB'] = str(workdir / 'warehouse.db')
+    os.environ.pop('WAREHOUSE_SITES', None)
+    os.chdir(workdir)
+    import app
+    import maintenance
+    # Фоновое обслуживание в тестах не нужно
+    maintenance._scheduler_pid = os.getpid()
+    app.app.config['TESTING'] = True
+    return app.app
+
+
+@pytest.fixture
+def client(warehouse_app):
+    client = warehouse_app.test_client()
+    with client.session_transaction() as sess:
+        sess['logged_in'] = True
+        sess['username'] = 'admin'
+    return client
+
+
+@pytest.fixture
+def db(warehouse_app):
+    import database
+    conn = database.get_db()
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def box(db):
+    """id новой коробки в новой зоне"""
+    zone_id = db.execute("INSERT INTO zones (name) VALUES ('Тестовая зона')").lastrowid
+    box_id = db.execute('INSERT INTO boxes (name, zone_id) VALUES (?, ?)', ('Коробка', zone_id)).lastrowid
+    db.commit()
+    return box_id
@@ -0,0 +1,35 @@
+def add(client, box_id, name, barcode, quantity=1):
+    client.post('/api/box_items', json={'box_id': box_id, 'product_name': name, 'barcode': barcode,
+                                        'quantity': quantity})
+
+
+def item(db, box_id, barcode):
+    return db.execute('''
+        SELECT bi.id, p.name, bi.quantity FROM box_items bi JOIN products p ON p.id = bi.product_id
+        WHERE bi.box_id = ? AND p.barcode = ?
+    ''', (box_id, barcode)).fetchone()
+
+
+def test_rename_of_barcoded_product_requires_flag(client, db, box):
+    other = db.execute('INSERT INTO boxes (name, zone_id) SELECT ?, zone_id FROM boxes WHERE id = ?',
+                       ('Вторая', box)).lastrowid
+    db.commit()
+    add(client, box, 'Кружка', '4600000000048')
+    add(client, other, 'Кружка', '4600000000048')
+    item_id = item(db, box, '4600000000048')['id']
+
+    response = client.put(f'/api/box_items/{item_id}', json={'product_name': 'Чашка', 'quantity': 2})
+    assert response.status_code == 400
+    assert tuple(item(db, box, '4600000000048')) == (item_id, 'Кружка', 1)
+    assert item(db, other, '4600000000048')['name'] == 'Кружка'
+
+    # Количество без смены названия правится как раньше
+    response = client.put(f'/api/box_items/{item_id}', json={'product_name': 'Кружка', 'quantity': 2})
+    assert response.status_code == 200
+    assert item(db, box, '4600000000048')['quantity'] == 2
+
+    response = client.put(f'/api/box_items/{item_id}', json={'product_name': 'Чашка', 'quantity': 2,
+                                                             'rename_everywhere': True})
+    assert response.status_code == 200
+    assert item(db, box, '4600000000048')['name'] == 'Чашка'
+    assert item(db, other, '4600000000048')['name'] == 'Чашка'
@@ -0,0 +1,90 @@
+import pytest
+
+import idempotency
+
+
+class Crash(Exception):
+    pass
+
+
+def crash_before_store(monkeypatch):
+    """Процесс «падает» после записи запроса, но до сохранения ответа"""
+    def store(conn, key, status, body):
+        raise Crash()
+    monkeypatch.setattr(idempotency, '_store', store)
+
+
+def restart(monkeypatch):
+    """Новый процесс: пустой LRU, занятый ключ без ответа уже просрочен"""
+    monkeypatch.undo()
+    monkeypatch.setattr(idempotency, '_cache', idempotency.ResponseCache())
+    monkeypatch.setattr(idempotency, 'PENDING_TIMEOUT', 0)
+
+
+def quantity(db, box_id, barcode):
+    return db.execute('''
+        SELECT bi.quantity FROM box_items bi JOIN products p ON p.id = bi.product_id
+        WHERE bi.box_id = ? AND p.barcode = ?
+    ''', (box_id, barcode)).fetchone()[0]
+
+
+def test_retry_after_crash_does_not_reapply_scan(client, db, box, monkeypatch):
+    scan = {'box_id': box, 'product_name': 'Термос', 'barcode': '4600000000024', 'quantity': 3}
+    headers = {idempotency.KEY_HEADER: 'crash-scan'}
+
+    crash_before_store(monkeypatch)
+    with pytest.raises(Crash):
+        client.post('/api/box_items', json=scan, headers=headers)
+    assert quantity(db, box, '4600000000024') == 3
+
+    restart(monkeypatch)
+    response = client.post('/api/box_items', json=scan, headers=headers)
+    assert response.status_code == 200
+    assert response.get_json() == {'success': True}
+    assert quantity(db, box, '4600000000024') == 3
+
+
+def test_retry_after_crash_does_not_reapply_collection(client, db, box, monkeypatch):
+    client.post('/api/box_items', json={'box_id': box, 'product_name': 'Лампа', 'barcode': '4600000000031',
+                                        'quantity': 10})
+    item_id = db.execute('''
+        SELECT bi.id FROM box_items bi JOIN products p ON p.id = bi.product_id WHERE p.barcode = '4600000000031'
+    ''').fetchone()[0]
+    plan = {'collection_plan': [{'item_id': item_id, 'barcode': '4600000000031', 'collected': 4,
+                                 'remaining_after': 6}]}
+    headers = {idempotency.KEY_HEADER: 'crash-collection'}
+    outflow = 'SELECT COALESCE(SUM(quantity), 0) FROM collection_outflow'
+
+    crash_before_store(monkeypatch)
+    before = db.execute(outflow).fetchone()[0]
+    with pytest.raises(Crash):
+        client.post('/api/confirm_collection', json=plan, headers=headers)
+    recorded = db.execute(outflow).fetchone()[0]
+    assert recorded > before
+
+    restart(monkeypatch)
+    # Коробку пополнили до повтора: повторное списание затёрло бы пополнение
+    client.post('/api/box_items', json={'box_id': box, 'product_name': 'Лампа', 'barcode': '4600000000031',
+                                        'quantity': 5})
+    response = client.post('/api/confirm_collection', json=plan, headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()['updated_count'] == 1
+    assert db.execute(outflow).fetchone()[0] == recorded
+    assert quantity(db, box, '4600000000031') == 11
+
+
+def test_retry_after_crash_returns_same_receipt(client, db, monkeypatch):
+    receipt = {'receipt_date': '2026-10-19', 'description': 'Повтор'}
+    headers = {idempotency.KEY_HEADER: 'crash-receipt'}
+    count = "SELECT COUNT(*) FROM receipts WHERE description = 'Повтор'"
+
+    crash_before_store(monkeypatch)
+    with pytest.raises(Crash):
+        client.post('/api/receipts', json=receipt, headers=headers)
+    number = db.execute("SELECT receipt_number FROM receipts WHERE description = 'Повтор'").fetchone()[0]
+
+    restart(monkeypatch)
+    response = client.post('/api/receipts', json=receipt, headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()['receipt_number'] == number
+    assert db.execute(count).fetchone()[0] == 1
@@ -0,0 +1,19 @@
+import json
+import os
+
+
+def test_slow_request_report_includes_writer_statements(warehouse_app, client, box):
+    warehouse_app.config['SLOW_REQUEST_THRESHOLD_MS'] = 0
+    try:
+        response = client.post('/api/box_items', json={
+            'box_id': box, 'product_name': 'Чай зелёный', 'barcode': '4600000000017', 'quantity': 2})
+    finally:
+        warehouse_app.config['SLOW_REQUEST_THRESHOLD_MS'] = None
+    assert response.status_code == 200
+    stem = response.headers['X-Slow-Request-Report']
+
+    with open(os.path.join(warehouse_app.config['PROFILE_DIR'], f'{stem}.slow.json'), encoding='utf-8') as f:
+        report = json.load(f)
+    statements = [query['sql'].split()[0].upper() for query in report['queries']]
+    # Запись идёт через писателя (writer.py) в его потоке и соединении
+    assert 'INSERT' in statements
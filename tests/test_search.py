@@ -0,0 +1,52 @@
+import search
+
+
+def add_products(db, names, box_id=None):
+    ids = []
+    for name in names:
+        product_id = db.execute('INSERT INTO products (name) VALUES (?)', (name,)).lastrowid
+        if box_id is not None:
+            db.execute('INSERT INTO box_items (box_id, product_id, quantity) VALUES (?, ?, 1)', (box_id, product_id))
+        ids.append(product_id)
+    db.commit()
+    return ids
+
+
+def all_pages(db, text, per_page):
+    seen, page = [], 1
+    while True:
+        rows, has_more = search.search(db, text, page=page, per_page=per_page)
+        seen += [row['item_id'] for row in rows]
+        if not has_more:
+            return seen
+        page += 1
+
+
+def test_pages_cover_every_hit_once(db, box, monkeypatch):
+    monkeypatch.setattr(search, 'RANK_CANDIDATES', 3)
+    add_products(db, [f'Пылесос модель {n}' for n in range(8)], box)
+    items = [row[0] for row in db.execute('''
+        SELECT bi.id FROM box_items bi JOIN products p ON p.id = bi.product_id WHERE p.name LIKE 'Пылесос%'
+    ''')]
+
+    hits = all_pages(db, 'пылесос', per_page=2)
+    assert sorted(hits) == sorted(items)
+
+
+def test_products_without_rows_do_not_hide_older_hits(db, box, monkeypatch):
+    monkeypatch.setattr(search, 'RANK_CANDIDATES', 3)
+    add_products(db, [f'Утюг паровой {n}' for n in range(2)], box)
+    # Новые товары без остатка и приёмок занимают первые блоки окна
+    add_products(db, [f'Утюг дорожный {n}' for n in range(7)])
+
+    rows, has_more = search.search(db, 'утюг', per_page=5)
+    assert sorted(row['product_name'] for row in rows) == ['Утюг паровой 0', 'Утюг паровой 1']
+    assert not has_more
+
+
+def test_narrow_query_is_ranked_by_relevance(db, box):
+    # Одно окно: короткое название с точным совпадением выше длинного
+    add_products(db, ['Чайник', 'Чайник электрический стальной с подсветкой и фильтром'], box)
+
+    rows, _ = search.search(db, 'чайник', per_page=10)
+    assert rows[0]['product_name'] == 'Чайник'
@@ -0,0 +1,51 @@
+"""Приём загружаемых Excel-файлов в памяти.
+
+Werkzeug по умолчанию сбрасывает загрузки больше 500 КБ во временный файл,
+а обработчики затем ещё раз сохраняли его на диск и перечитывали. Здесь
+загрузка держится в ``SpooledTemporaryFile`` до ``UPLOAD_SPOOL_BYTES``
+(на диск уходят только файлы крупнее порога) и разбирается прямо из
+буфера. Размер запроса ограничен ``MAX_CONTENT_LENGTH``.
+"""
+import os
+import tempfile
+
+from flask import Request, abort, current_app, jsonify, request
+
+from lazy import LazyModule
+
+pd = LazyModule('pandas')
+
+MAX_UPLOAD_MB = float(os.environ.get('WAREHOUSE_MAX_UPLOAD_MB', '50'))
+UPLOAD_SPOOL_MB = float(os.environ.get('WAREHOUSE_UPLOAD_SPOOL_MB', '32'))
+
+
+class SpooledUploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=current_app.config['UPLOAD_SPOOL_BYTES'], mode='rb+')
+
+
+def init_uploads(app):
+    # Во Flask MAX_CONTENT_LENGTH уже есть в конфигурации со значением None
+    if app.config.get('MAX_CONTENT_LENGTH') is None:
+        app.config['MAX_CONTENT_LENGTH'] = int(MAX_UPLOAD_MB * 1024 * 1024)
+    app.config.setdefault('UPLOAD_SPOOL_BYTES', int(UPLOAD_SPOOL_MB * 1024 * 1024))
+    app.request_class = SpooledUploadRequest
+
+    @app.before_request
+    def reject_oversized_upload():
+        # Проверка до обработчика: внутри него общий except превратил бы 413 в 500
+        limit = app.config['MAX_CONTENT_LENGTH']
+        if limit and request.content_length and request.content_length > limit:
+            abort(413)
+
+    @app.errorhandler(413)
+    def upload_too_large(e):
+        limit_mb = app.config['MAX_CONTENT_LENGTH'] / 1024 / 1024
+        return jsonify({'success': False, 'error': f'File too large, the limit is {limit_mb:g} MB'}), 413
+
+
+def read_excel(file):
+    """DataFrame из загруженного файла; буфер закрывается в любом случае"""
+    with file.stream as stream:
+        stream.seek(0)
+        return pd.read_excel(stream)
@@ -0,0 +1,148 @@
+"""Групповая фиксация мелких записей (group commit).
+
+Один поток-писатель владеет соединением на запись. Потоки запросов кладут
+в очередь функции вида ``fn(conn, *args)``; писатель собирает всё, что
+накопилось за несколько миллисекунд, выполняет пачку в одной транзакции
+(каждую операцию в своей точке сохранения) и после COMMIT возвращает
+результат каждому вызывающему. Так на пачку приходится один fsync вместо
+одного на каждое сканирование.
+
+Операция выполняется в копии контекста (contextvars) вызвавшего потока:
+площадка запроса и список SQL-запросов для отчёта о медленном запросе
+(profiling.py) видны и в потоке-писателе.
+"""
+import contextvars
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import database
+
+MAX_BATCH = int(os.environ.get('WAREHOUSE_GROUP_COMMIT_BATCH', '512'))
+MAX_DELAY = float(os.environ.get('WAREHOUSE_GROUP_COMMIT_MS', '2')) / 1000
+BUSY_TIMEOUT_MS = 30000
+
+# Колбэки после каждой зафиксированной пачки: hook(path)
+commit_hooks = []
+
+# Обёртка операций, отправленных из текущего контекста: wrap(fn) -> fn
+# (idempotency.py записывает результат операции в той же транзакции)
+operation_wrapper = contextvars.ContextVar('operation_wrapper', default=None)
+
+
+class WriteCoalescer:
+    def __init__(self, path, max_batch=MAX_BATCH, max_delay=MAX_DELAY):
+        self.path = path
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        # Сколько вызывающих сейчас ждут результата; ждать пополнения пачки
+        # имеет смысл, только пока в очередь ещё кто-то может положить запись
+        self._waiting = 0
+        self.batches = 0
+        self.operations = 0
+
+    def submit(self, fn, *args):
+        """Выполняет fn(conn, *args) в писателе и ждёт фиксации транзакции"""
+        wrap = operation_wrapper.get()
+        if wrap is not None:
+            fn = wrap(fn)
+        self._ensure_started()
+        future = Future()
+        with self._lock:
+            self._waiting += 1
+        try:
+            self._queue.put((fn, args, contextvars.copy_context(), future))
+            return future.result()
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+    def _ensure_started(self):
+        # После fork поток-писатель родителя в дочернем процессе не существует
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name=f'writer:{self.path}', daemon=True)
+                self._thread.start()
+
+    def _connect(self):
+        # Через database.connect: row_factory и connection_hooks (профилирование) как у остальных соединений
+        conn = database.connect(self.path, isolation_level=None, check_same_thread=False)
+        conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+        return conn
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0 and len(batch) < self._waiting:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = self._connect()
+        while True:
+            batch = self._collect_batch()
+            outcomes = []
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                for fn, args, context, future in batch:
+                    conn.execute('SAVEPOINT op')
+                    try:
+                        result = context.run(fn, conn, *args)
+                    except Exception as e:
+                        conn.execute('ROLLBACK TO op')
+                        outcomes.append((future, None, e))
+                    else:
+                        outcomes.append((future, result, None))
+                    conn.execute('RELEASE op')
+                conn.execute('COMMIT')
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                for *_, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.operations += len(batch)
+            for future, result, error in outcomes:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+            for hook in commit_hooks:
+                hook(self.path)
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(path=None):
+    """Писатель для файла базы (по одному на файл в процессе)"""
+    path = path or database.db_path()
+    writer = _writers.get(path)
+    if writer is None:
+        with _writers_lock:
+            writer = _writers.setdefault(path, WriteCoalescer(path))
+    return writer
+
+
+def submit(fn, *args):
+    return get_writer().submit(fn, *args)